@@ -0,0 +1,266 @@
+"""
+予定の確認(READ)に応答するためのモジュール。
+
+「今週の予定は？」「明日空いてる？」のような問い合わせから対象の期間と種類をルールで求め、
+期間内のイベントから作ったIntervalIndexを使って、予定の一覧と空き時間を1回の走査で組み立てます。
+応答の作成にGeminiは呼び出しません。
+"""
+import datetime
+import re
+from dataclasses import dataclass
+from typing import List, Set, Tuple
+
+from .interval_index import Interval, IntervalIndex, free_gaps
+from .rule_based_parser import WEEKDAYS, find_date, normalize
+from .time_utils import TIME_ZONE, localize
+
+# 空き時間を探す時間帯（勤務時間）
+WORK_START = datetime.time(9, 0)
+WORK_END = datetime.time(18, 0)
+# 空き時間として扱う最小の長さ（分）
+DEFAULT_MIN_FREE_MINUTES = 30
+# LINEのテキストメッセージの最大文字数
+MAX_REPLY_CHARS = 5000
+
+_FREE_RE = re.compile(r"空いて|空き|あいて|暇|ひま|手が空")
+_MIN_FREE_RE = re.compile(r"(\d+)\s*(時間|分)\s*(以上|くらい|ぐらい|ほど)?")
+_WEEKEND_RE = re.compile(r"(今週末|来週末|週末|土日)")
+_WEEK_RE = re.compile(r"(今週|来週|再来週)")
+_MONTH_RE = re.compile(r"(今月|来月)")
+_UPCOMING_RE = re.compile(r"これから|今後|近々|直近")
+
+
+@dataclass
+class ReadQuery:
+    """
+    予定の確認の問い合わせ内容。
+
+    Attributes:
+        start: 対象期間の開始日時。
+        end: 対象期間の終了日時。
+        label: 返信に表示する期間の名前（例: "明日", "今週"）。
+        free_only: 空き時間を尋ねているかどうか。
+        min_free: 空き時間として扱う最小の長さ。
+    """
+
+    start: datetime.datetime
+    end: datetime.datetime
+    label: str
+    free_only: bool = False
+    min_free: datetime.timedelta = datetime.timedelta(minutes=DEFAULT_MIN_FREE_MINUTES)
+
+
+def _day_start(date: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(date, datetime.time(0, 0), tzinfo=TIME_ZONE)
+
+
+def _format_day(date: datetime.date) -> str:
+    return f"{date.month}/{date.day}({WEEKDAYS[date.weekday()]})"
+
+
+def resolve_read_query(
+    text: str,
+    now: datetime.datetime | None = None,
+    hint: str | None = None,
+) -> ReadQuery:
+    """
+    問い合わせのテキストから、対象の期間と空き時間を尋ねているかどうかを求めます。
+
+    テキストに期間が見つからない場合はhintから探し、それでも見つからない場合は今日を対象とします。
+
+    Args:
+        text: ユーザーの問い合わせ。
+        now: 基準となる現在日時。指定されない場合は現在時刻を使います。
+        hint: Geminiが抽出した期間の表現など、期間を探す補助のテキスト（任意）。
+
+    Returns:
+        問い合わせ内容を表すReadQuery。
+    """
+    now = localize(now or datetime.datetime.now(TIME_ZONE)).astimezone(TIME_ZONE)
+    text = normalize(text)
+
+    free_only = bool(_FREE_RE.search(text))
+    min_free = datetime.timedelta(minutes=DEFAULT_MIN_FREE_MINUTES)
+    m = _MIN_FREE_RE.search(text)
+    if free_only and m:
+        amount = int(m.group(1))
+        min_free = datetime.timedelta(hours=amount) if m.group(2) == "時間" else datetime.timedelta(minutes=amount)
+
+    period = _resolve_period(text, now)
+    if period is None and hint:
+        period = _resolve_period(normalize(hint), now)
+    start, days, label = period or (now.date(), 1, "今日")
+    return ReadQuery(_day_start(start), _day_start(start + datetime.timedelta(days=days)), label, free_only, min_free)
+
+
+def find_period(
+    text: str, now: datetime.datetime | None = None
+) -> Tuple[datetime.datetime, datetime.datetime] | None:
+    """
+    テキストに「明日」「来週の月曜」「今週」のような期間の表現があれば、その期間を日単位で返します。
+
+    resolve_read_queryと違い、期間が見つからない場合に今日を補いません。
+
+    Args:
+        text: ユーザーの入力。
+        now: 基準となる現在日時。指定されない場合は現在時刻を使います。
+
+    Returns:
+        (開始日時, 終了日時) の組。期間が見つからない場合はNone。
+    """
+    now = localize(now or datetime.datetime.now(TIME_ZONE)).astimezone(TIME_ZONE)
+    period = _resolve_period(normalize(text), now)
+    if period is None:
+        return None
+    start, days, _ = period
+    return _day_start(start), _day_start(start + datetime.timedelta(days=days))
+
+
+def _resolve_period(text: str, now: datetime.datetime) -> Tuple[datetime.date, int, str] | None:
+    """
+    テキストから期間を求め、(開始日, 日数, 表示名) を返します。見つからない場合はNone。
+    """
+    today = now.date()
+    monday = today - datetime.timedelta(days=today.weekday())
+
+    m = _WEEKEND_RE.search(text)
+    if m:
+        weeks = 1 if m.group(1) == "来週末" else 0
+        saturday = monday + datetime.timedelta(days=5 + 7 * weeks)
+        return saturday, 2, m.group(1)
+
+    date, _ = find_date(text, now.replace(tzinfo=None))
+    if date is not None:
+        label = "今日" if date == today else "明日" if date == today + datetime.timedelta(days=1) else _format_day(date)
+        return date, 1, label
+
+    m = _WEEK_RE.search(text)
+    if m:
+        weeks = {"今週": 0, "来週": 1, "再来週": 2}[m.group(1)]
+        if weeks == 0:
+            # 今週は今日から日曜日まで
+            return today, 7 - today.weekday(), "今週"
+        return monday + datetime.timedelta(weeks=weeks), 7, m.group(1)
+
+    m = _MONTH_RE.search(text)
+    if m:
+        if m.group(1) == "今月":
+            first = today
+        else:
+            first = (today.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        following = (first.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        return first, (following - first).days, m.group(1)
+
+    if _UPCOMING_RE.search(text):
+        return today, 7, "これから1週間"
+
+    return None
+
+
+def render_agenda(
+    index: IntervalIndex,
+    query: ReadQuery,
+    now: datetime.datetime | None = None,
+    max_chars: int = MAX_REPLY_CHARS,
+) -> str:
+    """
+    予定の一覧、または空き時間の一覧を返信用のテキストにします。
+
+    日ごとにインデックスから重なる予定を1度だけ取り出し、そこから一覧と空き時間の両方を作ります。
+    テキストがmax_charsを超える場合は、収まらない行を省略してその件数を末尾に示します。
+
+    Args:
+        index: 対象期間のイベントから作成したIntervalIndex。
+        query: 問い合わせ内容。
+        now: 基準となる現在日時。今日の空き時間は現在時刻以降から探します。
+        max_chars: 返信の最大文字数。
+
+    Returns:
+        返信のテキスト。
+    """
+    now = localize(now or datetime.datetime.now(TIME_ZONE)).astimezone(TIME_ZONE)
+    days = (query.end - query.start).days
+    work_hours = f"{WORK_START.hour}:{WORK_START.minute:02d}〜{WORK_END.hour}:{WORK_END.minute:02d}"
+    min_free_minutes = int(query.min_free.total_seconds() // 60)
+
+    blocks: List[List[str]] = []
+    event_keys: Set[str] = set()
+    for offset in range(days):
+        date = (query.start + datetime.timedelta(days=offset)).date()
+        day_start = _day_start(date)
+        intervals = index.overlapping(day_start, day_start + datetime.timedelta(days=1))
+
+        if query.free_only:
+            # 複数日を対象とする場合、平日だけを調べる（週末を尋ねられた場合を除く）
+            if days > 2 and date.weekday() >= 5:
+                continue
+            window_start = datetime.datetime.combine(date, WORK_START, tzinfo=TIME_ZONE)
+            window_end = datetime.datetime.combine(date, WORK_END, tzinfo=TIME_ZONE)
+            window_start = max(window_start, now)
+            if window_start >= window_end:
+                continue
+            slots = free_gaps(intervals, window_start, window_end, query.min_free)
+            lines = [f"・{_format_span(s, e, date)}" for s, e in slots] or ["・空きはありません"]
+        else:
+            if not intervals:
+                continue
+            event_keys.update(interval.key for interval in intervals)
+            lines = [f"・{_format_event(interval, date)}" for interval in intervals]
+        blocks.append([_format_day(date), *lines])
+
+    if query.free_only:
+        header = f"{query.label}の空き時間です。({work_hours}、{min_free_minutes}分以上)"
+        if not blocks:
+            return f"{query.label}の勤務時間内に確認できる空き時間はありません。"
+    else:
+        if not blocks:
+            return f"{query.label}の予定はありません。"
+        header = f"{query.label}の予定は{len(event_keys)}件です。"
+
+    return _fit(header, blocks, max_chars)
+
+
+def _format_time(dt: datetime.datetime) -> str:
+    return f"{dt.hour}:{dt.minute:02d}"
+
+
+def _format_span(start: datetime.datetime, end: datetime.datetime, date: datetime.date) -> str:
+    """
+    時間帯を表示用の文字列にします。日をまたぐ場合は日付も表示します。
+    """
+    start, end = start.astimezone(TIME_ZONE), end.astimezone(TIME_ZONE)
+    start_text = _format_time(start) if start.date() == date else f"{start.month}/{start.day} {_format_time(start)}"
+    if end.date() == date:
+        end_text = _format_time(end)
+    elif end.date() == date + datetime.timedelta(days=1) and end.time() == datetime.time(0):
+        end_text = "24:00"
+    else:
+        end_text = f"{end.month}/{end.day} {_format_time(end)}"
+    return f"{start_text}-{end_text}"
+
+
+def _format_event(interval: Interval, date: datetime.date) -> str:
+    title = (interval.data or {}).get("summary", "無題の予定")
+    if interval.all_day:
+        return f"終日 {title}"
+    return f"{_format_span(interval.start, interval.end, date)} {title}"
+
+
+def _fit(header: str, blocks: List[List[str]], max_chars: int) -> str:
+    """
+    見出しと日ごとの行を結合し、最大文字数を超える場合は後ろの行を省略します。
+    """
+    total_lines = sum(len(block) - 1 for block in blocks)
+    text = header
+    shown = 0
+    for block in blocks:
+        for i, line in enumerate(block):
+            addition = ("\n\n" if i == 0 else "\n") + line
+            # 省略した旨の注記を付けられる余白を残しておく
+            if len(text) + len(addition) > max_chars - 30:
+                omitted = total_lines - shown
+                return text + f"\n\n…ほか{omitted}件は省略しました。"
+            text += addition
+            if i > 0:
+                shown += 1
+    return text
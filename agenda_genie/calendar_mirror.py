@@ -0,0 +1,351 @@
+"""
+Googleカレンダーのイベントをローカルに複製し、検索をAPI呼び出しなしで行うモジュール。
+
+同期トークン(syncToken)による差分同期で複製を最新に保ち、
+開始・終了時刻のインデックスとタイトル・説明の文字bigramインデックスを使って
+期間とキーワードによる検索をメモリ上で処理します。
+複製するのは直近 history_days 日より後に終わるイベントのみで、それより前の期間は covers で判定し、
+呼び出し側でAPIを使って検索します。
+"""
+import bisect
+import datetime
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from googleapiclient.errors import HttpError
+
+from .time_utils import localize, parse_event_time, to_rfc3339
+
+
+def _normalize(text: str) -> str:
+    """
+    全角・半角と大文字・小文字の違いを吸収した文字列を返します。
+    """
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _bigrams(text: str) -> Set[str]:
+    """
+    文字列に含まれる文字bigramの集合を返します。
+    """
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class CalendarMirror:
+    """
+    1つのカレンダーのイベントを保持するローカルストア。
+
+    サービスはスレッドセーフではないため、同期時には呼び出し元のサービスを受け取ります。
+    """
+
+    def __init__(self, calendar_id: str = "primary", sync_interval: float = 60.0, history_days: int = 90):
+        """
+        Args:
+            calendar_id: 複製するカレンダーのID。
+            sync_interval: 差分同期を行う間隔（秒）。この時間内の検索は同期せずに応答します。
+            history_days: 全件の同期で複製する過去の日数。これより前に終わるイベントは複製しません。
+        """
+        self.calendar_id = calendar_id
+        self.sync_interval = sync_interval
+        self.history = datetime.timedelta(days=history_days)
+        # 複製を読み書きするためのロック。APIの呼び出し中は保持しない
+        self._lock = threading.RLock()
+        # 同期を1つのスレッドだけが行うためのロック
+        self._sync_lock = threading.Lock()
+        self._sync_token: str | None = None
+        self._last_sync = 0.0
+        # 複製している期間の開始日時のタイムスタンプ。全件の同期で決まる
+        self._window_start: float | None = None
+
+        self._events: Dict[str, Dict[str, Any]] = {}
+        self._bounds: Dict[str, Tuple[float, float]] = {}
+        # (開始時刻のタイムスタンプ, イベントID) を開始時刻順に並べたインデックス
+        self._starts: List[Tuple[float, str]] = []
+        # 最も長いイベントの長さ。開始時刻のインデックスから重なるイベントを探す範囲に使う
+        self._max_duration = 0.0
+        self._texts: Dict[str, str] = {}
+        self._bigram_index: Dict[str, Set[str]] = {}
+
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+
+    def is_stale(self) -> bool:
+        """
+        前回の同期から sync_interval 秒以上経過しているかどうかを返します。
+        """
+        return time.monotonic() - self._last_sync >= self.sync_interval
+
+    def covers(self, start_time: datetime.datetime) -> bool:
+        """
+        start_time 以降のイベントが複製に含まれるかどうかを返します。
+
+        Args:
+            start_time: 検索範囲の開始日時。
+
+        Returns:
+            複製している期間から検索できる場合はTrue。
+        """
+        window_start = self._window_start
+        if window_start is None:
+            # まだ同期していない場合は、次の全件の同期で複製する期間で判定する
+            window_start = self._history_start().timestamp()
+        return localize(start_time).timestamp() >= window_start
+
+    def refresh_if_stale(self, service: Any, execute: Callable[[Any], Any] | None = None) -> None:
+        """
+        同期の間隔を過ぎている場合のみ同期します。
+
+        Args:
+            service: Google Calendar APIのサービス。
+            execute: APIのリクエストを実行する関数（任意）。レート制限や再試行を適用する場合に指定します。
+        """
+        if not self.is_stale():
+            return
+        with self._sync_lock:
+            # 待っている間に他のスレッドが同期した場合は、APIを呼び出さない
+            if self.is_stale():
+                self._sync_locked(service, execute)
+
+    def sync(self, service: Any, execute: Callable[[Any], Any] | None = None) -> None:
+        """
+        同期トークンを使って差分同期します。トークンがない・無効な場合は全件を同期し直します。
+
+        Args:
+            service: Google Calendar APIのサービス。
+            execute: APIのリクエストを実行する関数（任意）。指定しない場合はrequest.execute()を呼び出します。
+
+        Raises:
+            HttpError: 同期トークンの失効以外のAPIエラーが発生した場合。
+        """
+        with self._sync_lock:
+            self._sync_locked(service, execute)
+
+    def search(
+        self,
+        start_time: datetime.datetime,
+        end_time: datetime.datetime,
+        query: str | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        期間と重なるイベントをキーワードで絞り込み、開始時刻順に返します。
+
+        Args:
+            start_time: 検索範囲の開始日時。
+            end_time: 検索範囲の終了日時。
+            query: 検索キーワード（任意）。タイトルと説明に対して部分一致で検索します。
+
+        Returns:
+            見つかったイベントのリスト。
+        """
+        low = localize(start_time).timestamp()
+        high = localize(end_time).timestamp()
+
+        with self._lock:
+            left = bisect.bisect_left(self._starts, (low - self._max_duration, ""))
+            right = bisect.bisect_left(self._starts, (high, ""))
+            candidates = [
+                event_id
+                for _, event_id in self._starts[left:right]
+                if self._bounds[event_id][1] > low
+            ]
+
+            if query:
+                terms = _normalize(query).split()
+                for term in terms:
+                    matched = self._match_term(term)
+                    candidates = [event_id for event_id in candidates if event_id in matched]
+
+            return [self._events[event_id] for event_id in candidates]
+
+    def upsert(self, event: Dict[str, Any]) -> None:
+        """
+        作成・更新されたイベントを複製に反映します。
+
+        Args:
+            event: Google Calendar APIのイベントリソース。
+        """
+        with self._lock:
+            self._remove(event["id"])
+            if event.get("status") != "cancelled":
+                self._add(event)
+
+    def remove(self, event_id: str) -> None:
+        """
+        削除されたイベントを複製から取り除きます。
+
+        Args:
+            event_id: 削除されたイベントのID。
+        """
+        with self._lock:
+            self._remove(event_id)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def _sync_locked(self, service: Any, execute: Callable[[Any], Any] | None) -> None:
+        """
+        _sync_lock を保持した状態で同期します。ページの取得中は複製のロックを保持しません。
+        """
+        execute = execute or (lambda request: request.execute())
+        if self._sync_token is not None:
+            try:
+                items, sync_token = self._fetch(service, execute, sync_token=self._sync_token)
+            except HttpError as error:
+                # 410 Goneは同期トークンが無効になったことを示す
+                if error.resp.status != 410:
+                    raise
+                print("同期トークンが無効になったため、カレンダーを再同期します。")
+            else:
+                with self._lock:
+                    self._apply(items)
+                    self._sync_token = sync_token
+                    self._last_sync = time.monotonic()
+                self.incremental_syncs += 1
+                return
+
+        window_start = self._history_start()
+        items, sync_token = self._fetch(service, execute, time_min=window_start)
+        with self._lock:
+            self._clear()
+            self._window_start = window_start.timestamp()
+            self._load(items)
+            self._sync_token = sync_token
+            self._last_sync = time.monotonic()
+        self.full_syncs += 1
+
+    def _fetch(
+        self,
+        service: Any,
+        execute: Callable[[Any], Any],
+        sync_token: str | None = None,
+        time_min: datetime.datetime | None = None,
+    ) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        events().listのページを順に取得し、イベントと次の同期トークンを返します。
+        """
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            params: Dict[str, Any] = {
+                "calendarId": self.calendar_id,
+                "singleEvents": True,
+                "maxResults": 2500,
+                "pageToken": page_token,
+            }
+            if sync_token is not None:
+                params["syncToken"] = sync_token
+                params["showDeleted"] = True
+            elif time_min is not None:
+                params["timeMin"] = to_rfc3339(time_min)
+            result = execute(service.events().list(**params))
+            items.extend(result.get("items", []))
+
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return items, result.get("nextSyncToken")
+
+    def _apply(self, items: List[Dict[str, Any]]) -> None:
+        """
+        差分同期で取得した変更を複製に反映します。
+        """
+        for event in items:
+            self._remove(event["id"])
+            if event.get("status") != "cancelled" and self._in_window(event):
+                self._add(event)
+
+    def _load(self, items: List[Dict[str, Any]]) -> None:
+        """
+        全件の同期で取得したイベントを空の複製に読み込みます。開始時刻のインデックスは最後に1回だけ並べ替えます。
+        """
+        for event in items:
+            if event.get("status") != "cancelled":
+                self._remove(event["id"])
+                self._add(event, keep_sorted=False)
+        self._starts.sort()
+
+    def _history_start(self) -> datetime.datetime:
+        return localize(datetime.datetime.now()) - self.history
+
+    def _in_window(self, event: Dict[str, Any]) -> bool:
+        """
+        イベントが複製している期間に終わるかどうかを返します。差分同期には期間を指定できないため、ここで絞り込みます。
+        """
+        if self._window_start is None or "end" not in event:
+            return True
+        return parse_event_time(event["end"]).timestamp() > self._window_start
+
+    def _match_term(self, term: str) -> Set[str]:
+        """
+        キーワードを含むイベントのIDを返します。
+        """
+        if len(term) < 2:
+            return {event_id for event_id, text in self._texts.items() if term in text}
+
+        grams = sorted(_bigrams(term), key=lambda g: len(self._bigram_index.get(g, ())))
+        matched = set(self._bigram_index.get(grams[0], ()))
+        for gram in grams[1:]:
+            matched &= self._bigram_index.get(gram, set())
+            if not matched:
+                break
+        # bigramがすべて含まれていても連続しているとは限らないため、部分一致で確認する
+        return {event_id for event_id in matched if term in self._texts[event_id]}
+
+    def _add(self, event: Dict[str, Any], keep_sorted: bool = True) -> None:
+        """
+        イベントをストアと各インデックスに追加します。
+
+        keep_sorted がFalseの場合は開始時刻のインデックスの末尾に追加するため、呼び出し側で並べ替える必要があります。
+        """
+        if "start" not in event or "end" not in event:
+            return
+        event_id = event["id"]
+        start = parse_event_time(event["start"]).timestamp()
+        end = parse_event_time(event["end"]).timestamp()
+
+        self._events[event_id] = event
+        self._bounds[event_id] = (start, end)
+        if keep_sorted:
+            bisect.insort(self._starts, (start, event_id))
+        else:
+            self._starts.append((start, event_id))
+        self._max_duration = max(self._max_duration, end - start)
+
+        text = _normalize(f"{event.get('summary') or ''}\n{event.get('description') or ''}")
+        self._texts[event_id] = text
+        for gram in _bigrams(text):
+            self._bigram_index.setdefault(gram, set()).add(event_id)
+
+    def _remove(self, event_id: str) -> None:
+        """
+        イベントをストアと各インデックスから取り除きます。
+        """
+        if event_id not in self._events:
+            return
+        start, _ = self._bounds.pop(event_id)
+        del self._events[event_id]
+        index = bisect.bisect_left(self._starts, (start, event_id))
+        if index < len(self._starts) and self._starts[index] == (start, event_id):
+            del self._starts[index]
+
+        text = self._texts.pop(event_id)
+        for gram in _bigrams(text):
+            ids = self._bigram_index.get(gram)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del self._bigram_index[gram]
+
+    def _clear(self) -> None:
+        """
+        複製と同期トークンをすべて破棄します。
+        """
+        self._sync_token = None
+        self._window_start = None
+        self._events.clear()
+        self._bounds.clear()
+        self._starts.clear()
+        self._max_duration = 0.0
+        self._texts.clear()
+        self._bigram_index.clear()
@@ -0,0 +1,351 @@
+"""
+Google Calendar APIクライアントをプロセス全体で共有するためのプールを提供するモジュール。
+
+認証情報の読み込みとディスカバリードキュメントの取得は一度だけ行い、
+構築済みのサービス（とそのHTTPコネクション）をリクエスト間で再利用します。
+認証情報の有効期限が近づくと、バックグラウンドスレッドで事前に更新します。
+
+複数のLINEユーザーにそれぞれのカレンダーを操作させる場合は、ユーザーごとの認証情報を
+CredentialStoreから読み込むMultiTenantCalendarPoolを使います。
+"""
+import datetime
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build, build_from_document
+
+from .calendar_mirror import CalendarMirror
+from .conflicts import ConflictChecker
+from .credential_store import CredentialStore
+from .google_calendar import GoogleCalendarManager, load_credentials, save_credentials
+
+logger = logging.getLogger(__name__)
+
+
+class CalendarClientPool:
+    """
+    スレッドセーフなGoogleCalendarManagerのプール。
+
+    httplib2のコネクションはスレッドセーフではないため、サービスは同時に
+    一つのスレッドだけが使用できるよう貸し出し方式で管理します。
+    """
+
+    def __init__(
+        self,
+        credentials_file: str = "credentials.json",
+        token_file: str = "token.json",
+        max_idle: int = 8,
+        refresh_margin: float = 300.0,
+        service_factory: Callable[[], Any] | None = None,
+        mirror: CalendarMirror | None = None,
+        conflict_checker: ConflictChecker | None = None,
+    ):
+        """
+        プールを初期化します。認証とサービスの構築は最初の貸し出し時に行います。
+
+        Args:
+            credentials_file: OAuthクライアントの認証情報ファイルのパス。
+            token_file: 保存済みトークンファイルのパス。
+            max_idle: プールに保持するアイドル状態のクライアントの最大数。
+            refresh_margin: 有効期限の何秒前に認証情報を更新するか。
+            service_factory: サービスを生成する関数（任意）。
+                指定された場合は認証情報の読み込みと自動更新を行いません。
+            mirror: 貸し出すクライアントで共有するカレンダーのローカル複製（任意）。
+            conflict_checker: 貸し出すクライアントで共有する、予定の重なりを調べるためのキャッシュ（任意）。
+        """
+        self.credentials_file = credentials_file
+        self.token_file = token_file
+        self.refresh_margin = refresh_margin
+        self._service_factory = service_factory
+        self.mirror = mirror
+        self.conflict_checker = conflict_checker
+
+        self._idle: queue.LifoQueue[GoogleCalendarManager] = queue.LifoQueue(maxsize=max_idle)
+        self._lock = threading.Lock()
+        self._creds = None
+        self._discovery_doc: Dict[str, Any] | None = None
+        self._refresher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+        self._hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._refresh_failures = 0
+
+    @contextmanager
+    def acquire(self) -> Iterator[GoogleCalendarManager]:
+        """
+        プールからクライアントを借り出し、ブロックを抜けると返却します。
+
+        Yields:
+            使用可能なGoogleCalendarManager。
+        """
+        try:
+            manager = self._idle.get_nowait()
+            with self._lock:
+                self._hits += 1
+        except queue.Empty:
+            manager = GoogleCalendarManager(
+                service=self._build_service(), mirror=self.mirror, conflict_checker=self.conflict_checker
+            )
+            with self._lock:
+                self._misses += 1
+
+        try:
+            yield manager
+        finally:
+            try:
+                self._idle.put_nowait(manager)
+            except queue.Full:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """
+        プールのヒット・ミス数と認証情報の更新回数を返します。
+
+        Returns:
+            各カウンターの値を持つ辞書。
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "refreshes": self._refreshes,
+                "refresh_failures": self._refresh_failures,
+                "idle": self._idle.qsize(),
+            }
+
+    def close(self) -> None:
+        """
+        バックグラウンドの更新スレッドを停止します。
+        """
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+
+    def _build_service(self) -> Any:
+        """
+        新しいサービスを構築します。ディスカバリードキュメントは初回のみ取得します。
+        """
+        if self._service_factory is not None:
+            return self._service_factory()
+
+        with self._lock:
+            if self._creds is None:
+                self._creds = load_credentials(self.credentials_file, self.token_file)
+                self._start_refresher()
+            creds = self._creds
+            discovery_doc = self._discovery_doc
+
+        if discovery_doc is None:
+            service = build("calendar", "v3", credentials=creds, cache_discovery=False)
+            with self._lock:
+                self._discovery_doc = service._rootDesc
+            return service
+        return build_from_document(discovery_doc, credentials=creds)
+
+    def _start_refresher(self) -> None:
+        """
+        認証情報を期限前に更新するデーモンスレッドを起動します。
+        """
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, name="calendar-token-refresher", daemon=True
+        )
+        self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        """
+        有効期限の refresh_margin 秒前まで待機し、認証情報を更新し続けます。
+        """
+        while not self._stop.is_set():
+            expiry = self._creds.expiry
+            if expiry is None:
+                wait = 3600.0
+            else:
+                remaining = (expiry - datetime.datetime.utcnow()).total_seconds()
+                wait = max(remaining - self.refresh_margin, 0.0)
+
+            if self._stop.wait(wait):
+                return
+
+            try:
+                self._creds.refresh(Request())
+                save_credentials(self._creds, self.token_file)
+                with self._lock:
+                    self._refreshes += 1
+            except Exception as e:
+                logger.warning("認証情報の更新中にエラーが発生しました: %s", e)
+                with self._lock:
+                    self._refresh_failures += 1
+                # 失敗した場合は少し待ってから再試行する
+                if self._stop.wait(60):
+                    return
+
+
+class _Tenant:
+    """
+    1人のユーザーの認証情報と、構築済みのクライアント。
+    """
+
+    def __init__(self, creds: Any, max_idle: int, mirror: CalendarMirror | None, conflict_checker: ConflictChecker | None):
+        self.creds = creds
+        self.idle: queue.LifoQueue[GoogleCalendarManager] = queue.LifoQueue(maxsize=max_idle)
+        self.mirror = mirror
+        self.conflict_checker = conflict_checker
+
+
+class MultiTenantCalendarPool:
+    """
+    LINEのユーザーごとに、そのユーザーの認証情報で構築したGoogleCalendarManagerを貸し出すプール。
+
+    最近使われたユーザーの認証情報とクライアントをLRUでメモリに保持し、上限を超えると
+    最も長く使われていないユーザーから破棄します。認証情報の有効期限が近い場合は、
+    貸し出す前にCredentialStoreを通して更新します（同じユーザーの更新は1回にまとめられます）。
+    貸し出している間にgoogle-authが401を受けて更新した認証情報も、返却時にストアへ保存します。
+    """
+
+    def __init__(
+        self,
+        store: CredentialStore,
+        max_users: int = 256,
+        max_idle_per_user: int = 2,
+        mirror_factory: Callable[[], CalendarMirror] | None = None,
+        conflict_checker_factory: Callable[[], ConflictChecker] | None = None,
+        service_factory: Callable[[Any], Any] | None = None,
+    ):
+        """
+        Args:
+            store: ユーザーごとの認証情報を保存するストア。
+            max_users: メモリに保持するユーザーの最大数。
+            max_idle_per_user: ユーザーごとに保持するアイドル状態のクライアントの最大数。
+            mirror_factory: ユーザーごとのカレンダーのローカル複製を生成する関数（任意）。
+            conflict_checker_factory: ユーザーごとの重なり判定のキャッシュを生成する関数（任意）。
+            service_factory: 認証情報からサービスを生成する関数（任意）。
+        """
+        self.store = store
+        self.max_users = max_users
+        self.max_idle_per_user = max_idle_per_user
+        self._mirror_factory = mirror_factory
+        self._conflict_checker_factory = conflict_checker_factory
+        self._service_factory = service_factory
+
+        self._tenants: OrderedDict[str, _Tenant] = OrderedDict()
+        self._lock = threading.Lock()
+        self._discovery_doc: Dict[str, Any] | None = None
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @contextmanager
+    def acquire(self, user_id: str) -> Iterator[GoogleCalendarManager]:
+        """
+        ユーザーのクライアントを借り出し、ブロックを抜けると返却します。
+
+        Args:
+            user_id: LINEのユーザーID。
+
+        Yields:
+            そのユーザーのカレンダーを操作するGoogleCalendarManager。
+
+        Raises:
+            CredentialsNotFoundError: ユーザーの認証情報が登録されていない場合。
+        """
+        tenant = self._tenant(user_id)
+        if self.store.needs_refresh(tenant.creds):
+            self.store.refresh(user_id, tenant.creds)
+        token = tenant.creds.token
+
+        try:
+            manager = tenant.idle.get_nowait()
+        except queue.Empty:
+            manager = GoogleCalendarManager(
+                service=self._build_service(tenant.creds),
+                mirror=tenant.mirror,
+                conflict_checker=tenant.conflict_checker,
+            )
+
+        try:
+            yield manager
+        finally:
+            # API呼び出しの401でgoogle-authが認証情報を更新した場合は、ストアにも保存する
+            if tenant.creds.token != token:
+                try:
+                    self.store.record_refresh(user_id, tenant.creds)
+                except Exception as e:
+                    logger.warning("認証情報の保存中にエラーが発生しました: %s", e)
+            try:
+                tenant.idle.put_nowait(manager)
+            except queue.Full:
+                pass
+
+    def forget(self, user_id: str) -> None:
+        """
+        ユーザーのクライアントをメモリから破棄します（認証情報を差し替えた場合など）。
+        """
+        with self._lock:
+            self._tenants.pop(user_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        メモリ上のユーザー数と、LRUのヒット・ミス・破棄の回数を返します。
+        """
+        with self._lock:
+            return {
+                "users": len(self._tenants),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def _tenant(self, user_id: str) -> _Tenant:
+        """
+        ユーザーの情報をLRUから取り出します。なければストアから読み込みます。
+        """
+        with self._lock:
+            tenant = self._tenants.get(user_id)
+            if tenant is not None:
+                self._tenants.move_to_end(user_id)
+                self._hits += 1
+                return tenant
+            self._misses += 1
+
+        creds = self.store.get(user_id)
+        tenant = _Tenant(
+            creds,
+            self.max_idle_per_user,
+            self._mirror_factory() if self._mirror_factory else None,
+            self._conflict_checker_factory() if self._conflict_checker_factory else None,
+        )
+        with self._lock:
+            # 読み込んでいる間に他のスレッドが登録していれば、そちらを使う
+            existing = self._tenants.get(user_id)
+            if existing is not None:
+                self._tenants.move_to_end(user_id)
+                return existing
+            self._tenants[user_id] = tenant
+            while len(self._tenants) > self.max_users:
+                self._tenants.popitem(last=False)
+                self._evictions += 1
+        return tenant
+
+    def _build_service(self, creds: Any) -> Any:
+        """
+        ユーザーの認証情報でサービスを構築します。ディスカバリードキュメントは全ユーザーで共有します。
+        """
+        if self._service_factory is not None:
+            return self._service_factory(creds)
+
+        with self._lock:
+            discovery_doc = self._discovery_doc
+        if discovery_doc is None:
+            service = build("calendar", "v3", credentials=creds, cache_discovery=False)
+            with self._lock:
+                self._discovery_doc = service._rootDesc
+            return service
+        return build_from_document(discovery_doc, credentials=creds)
@@ -0,0 +1,245 @@
+"""
+予定を登録する前に、既存の予定との重なりを調べるモジュール。
+
+日ごとのIntervalIndexをキャッシュしておき、同じ日の予定を続けて登録する場合は
+APIを呼び出さずに重なりを判定します。予定の作成・削除はキャッシュに差分として反映するため、
+期間全体を読み込み直す必要はありません。
+"""
+import datetime
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from .agenda import WORK_END, WORK_START
+from .interval_index import Interval, IntervalIndex, free_gaps
+from .schemas import CalendarEvent
+from .time_utils import TIME_ZONE, localize
+
+# 重なりの判定に読み込むイベントのフィールド
+_FIELDS = ("id", "summary", "start", "end", "transparency")
+
+
+@dataclass
+class ConflictReport:
+    """
+    登録しようとしている予定と既存の予定との重なりの判定結果。
+
+    Attributes:
+        event: 登録しようとしている予定。
+        conflicts: 時間が重なっている既存の予定。
+        nearest_free: 同じ長さで予定を入れられる、希望の時刻に最も近い時間帯（見つからない場合はNone）。
+    """
+
+    event: CalendarEvent
+    conflicts: List[Interval] = field(default_factory=list)
+    nearest_free: Tuple[datetime.datetime, datetime.datetime] | None = None
+
+    @property
+    def has_conflicts(self) -> bool:
+        return bool(self.conflicts)
+
+    def describe(self) -> str:
+        """
+        ユーザーに表示するための説明文を返します。
+        """
+        lines = ["次の予定と時間が重なっています。"]
+        for interval in self.conflicts:
+            title = (interval.data or {}).get("summary", "無題の予定")
+            lines.append(f"・{_format_range(interval.start, interval.end)} {title}")
+        if self.nearest_free is not None:
+            start, end = self.nearest_free
+            lines.append("")
+            lines.append(f"近くの空き時間: {_format_range(start, end)}")
+        return "\n".join(lines)
+
+
+def _format_range(start: datetime.datetime, end: datetime.datetime) -> str:
+    start, end = start.astimezone(TIME_ZONE), end.astimezone(TIME_ZONE)
+    end_text = end.strftime("%H:%M") if end.date() == start.date() else end.strftime("%m/%d %H:%M")
+    return f"{start.strftime('%m/%d %H:%M')}-{end_text}"
+
+
+class ConflictChecker:
+    """
+    日ごとのIntervalIndexをキャッシュし、予定の重なりと近くの空き時間を求めるクラス。
+
+    キャッシュは複数のGoogleCalendarManagerで共有できます。キャッシュにない日を調べるときだけ、
+    渡されたマネージャーを使ってその日のイベントを読み込みます。
+    """
+
+    def __init__(self, ttl: float = 300.0, search_days: int = 3):
+        """
+        Args:
+            ttl: 日ごとのキャッシュの有効期間（秒）。他の端末で変更された予定はこの間隔で反映されます。
+            search_days: 予定の日に空き時間がない場合に、後ろの何日まで空き時間を探すか。
+        """
+        self.ttl = ttl
+        self.search_days = search_days
+        self._lock = threading.Lock()
+        self._days: Dict[datetime.date, Tuple[IntervalIndex, float]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def check(self, manager: Any, event: CalendarEvent) -> ConflictReport:
+        """
+        予定が既存の予定と重なるかどうかを調べます。
+
+        Args:
+            manager: キャッシュにない日のイベントを読み込むためのGoogleCalendarManager。
+            event: 登録しようとしている予定。
+
+        Returns:
+            重なっている予定と近くの空き時間を持つConflictReport。
+        """
+        start, end = localize(event.start_time), localize(event.end_time)
+        days = self._ensure_days(manager, _dates_between(start, end))
+
+        conflicts: Dict[str, Interval] = {}
+        with self._lock:
+            for index in days.values():
+                for interval in index.overlapping(start, end):
+                    if interval.busy:
+                        conflicts.setdefault(interval.key, interval)
+
+        report = ConflictReport(event=event, conflicts=sorted(conflicts.values(), key=lambda i: i.start))
+        if report.has_conflicts:
+            report.nearest_free = self._nearest_free(manager, start, end)
+        return report
+
+    def record_created(self, event: Dict[str, Any]) -> None:
+        """
+        作成されたイベントを、キャッシュ済みの日のインデックスに追加します。
+
+        Args:
+            event: 作成されたイベントのリソース。
+        """
+        if "start" not in event or "end" not in event:
+            return
+        interval = Interval.from_event(event)
+        with self._lock:
+            # 更新で日付が変わった場合に備え、古い区間はすべての日から取り除く
+            for index, _ in self._days.values():
+                index.remove(interval.key)
+            for date in _dates_between(interval.start, interval.end):
+                cached = self._days.get(date)
+                if cached is not None:
+                    cached[0].add(interval)
+
+    def record_deleted(self, event_id: str) -> None:
+        """
+        削除されたイベントを、キャッシュ済みの日のインデックスから取り除きます。
+
+        Args:
+            event_id: 削除されたイベントのID。
+        """
+        with self._lock:
+            for index, _ in self._days.values():
+                index.remove(event_id)
+
+    def prime(self, index: IntervalIndex, start: datetime.datetime, end: datetime.datetime) -> None:
+        """
+        別に読み込んだ期間のイベントを、日ごとのキャッシュに登録します。
+
+        期間に丸ごと含まれる日だけを登録します。先読み(prefetch)した結果を使い、
+        予定の登録時にAPIを呼び出さずに重なりを判定するためのものです。
+
+        Args:
+            index: 期間内のすべてのイベントから作成したIntervalIndex。
+            start: 読み込んだ期間の開始日時。
+            end: 読み込んだ期間の終了日時。
+        """
+        start, end = localize(start), localize(end)
+        now = time.monotonic()
+        with self._lock:
+            for date in _dates_between(start, end):
+                day_start = _day_start(date)
+                day_end = day_start + datetime.timedelta(days=1)
+                if day_start < start or day_end > end:
+                    continue
+                self._days[date] = (IntervalIndex(index.overlapping(day_start, day_end)), now)
+
+    def invalidate(self) -> None:
+        """
+        キャッシュをすべて破棄します。
+        """
+        with self._lock:
+            self._days.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キャッシュのヒット・ミス数と、キャッシュしている日数を返します。
+        """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "days": len(self._days)}
+
+    def _ensure_days(self, manager: Any, dates: List[datetime.date]) -> Dict[datetime.date, IntervalIndex]:
+        """
+        日ごとのインデックスを返します。キャッシュにない（または期限切れの）日は、まとめて1回の検索で読み込みます。
+        """
+        now = time.monotonic()
+        with self._lock:
+            days = {d: self._days[d][0] for d in dates if d in self._days and now - self._days[d][1] < self.ttl}
+            missing = [d for d in dates if d not in days]
+            self._hits += len(days)
+            self._misses += len(missing)
+        if not missing:
+            return days
+
+        window_start = _day_start(missing[0])
+        window_end = _day_start(missing[-1] + datetime.timedelta(days=1))
+        index = IntervalIndex.from_events(manager.iter_events(window_start, window_end, fields=_FIELDS))
+
+        with self._lock:
+            for date in missing:
+                day_start = _day_start(date)
+                day = IntervalIndex(index.overlapping(day_start, day_start + datetime.timedelta(days=1)))
+                self._days[date] = (day, now)
+                days[date] = day
+        return days
+
+    def _nearest_free(
+        self,
+        manager: Any,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> Tuple[datetime.datetime, datetime.datetime] | None:
+        """
+        希望の時間と同じ長さの空き時間のうち、希望の開始時刻に最も近いものを探します。
+
+        予定の日の勤務時間内で探し、見つからなければ後ろの日を順に探します。
+        """
+        duration = end - start
+        now = datetime.datetime.now(TIME_ZONE)
+        first = start.astimezone(TIME_ZONE).date()
+        for offset in range(self.search_days + 1):
+            date = first + datetime.timedelta(days=offset)
+            day = self._ensure_days(manager, [date])[date]
+            window_start = max(datetime.datetime.combine(date, WORK_START, tzinfo=TIME_ZONE), now)
+            window_end = datetime.datetime.combine(date, WORK_END, tzinfo=TIME_ZONE)
+            if window_start >= window_end:
+                continue
+            with self._lock:
+                intervals = list(day)
+            candidates = []
+            for gap_start, gap_end in free_gaps(intervals, window_start, window_end, duration):
+                # 空き時間の中で、希望の開始時刻に最も近い開始時刻を選ぶ
+                slot_start = min(max(start, gap_start), gap_end - duration)
+                candidates.append((abs(slot_start - start), slot_start))
+            if candidates:
+                slot_start = min(candidates)[1]
+                return slot_start, slot_start + duration
+        return None
+
+
+def _day_start(date: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(date, datetime.time(0, 0), tzinfo=TIME_ZONE)
+
+
+def _dates_between(start: datetime.datetime, end: datetime.datetime) -> List[datetime.date]:
+    """
+    期間が含まれる日付のリストを返します（終了が0時ちょうどの場合、その日は含めません）。
+    """
+    first = start.astimezone(TIME_ZONE).date()
+    last = (end - datetime.timedelta(microseconds=1)).astimezone(TIME_ZONE).date()
+    return [first + datetime.timedelta(days=i) for i in range((last - first).days + 1)] or [first]
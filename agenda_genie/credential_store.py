@@ -0,0 +1,237 @@
+"""
+LINEのユーザーごとにGoogleの認証情報を保存するモジュール。
+
+認証情報はSQLiteにユーザーIDをキーとして1行ずつ保存し、更新は行単位で行います。
+トークンの更新はユーザーごとのロックで1つのスレッドだけが行い、さらに行のバージョン番号で
+他のプロセスが先に更新していないかを確かめるため、同じユーザーの更新が重複して書き込まれることはありません。
+"""
+import datetime
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, List
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from .google_calendar import SCOPES
+
+
+class CredentialsNotFoundError(LookupError):
+    """
+    ユーザーの認証情報が登録されていない場合に送出される例外。
+    """
+
+    def __init__(self, user_id: str):
+        super().__init__(f"ユーザーの認証情報が登録されていません: {user_id}")
+        self.user_id = user_id
+
+
+class CredentialStore:
+    """
+    LINEのユーザーIDとOAuthの認証情報を対応付けて保存する、スレッドセーフなストア。
+    """
+
+    def __init__(self, path: str | Path, refresh_margin: float = 300.0):
+        """
+        Args:
+            path: SQLiteデータベースファイルのパス。
+            refresh_margin: 有効期限の何秒前から更新の対象とするか。
+        """
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        # ユーザーごとの更新用ロック（同じユーザーの更新を1つにまとめる）
+        # 更新中のスレッドが参照している間だけ保持し、ユーザー数に応じて増え続けないようにする
+        self._refresh_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._refreshes = 0
+        self._refresh_failures = 0
+
+        # 複数のプロセスから読み書きできるよう、WALモードで開き、書き込みの競合は待機する
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30.0)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS credentials ("
+                " user_id TEXT PRIMARY KEY,"
+                " token TEXT NOT NULL,"
+                " version INTEGER NOT NULL DEFAULT 0,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def get(self, user_id: str) -> Credentials:
+        """
+        ユーザーの認証情報を読み込みます。
+
+        Args:
+            user_id: LINEのユーザーID。
+
+        Returns:
+            保存されている認証情報。
+
+        Raises:
+            CredentialsNotFoundError: 認証情報が登録されていない場合。
+        """
+        token, _ = self._load(user_id)
+        return Credentials.from_authorized_user_info(json.loads(token), SCOPES)
+
+    def exists(self, user_id: str) -> bool:
+        """
+        ユーザーの認証情報が登録されているかどうかを返します。
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM credentials WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None
+
+    def save(self, user_id: str, creds: Credentials) -> None:
+        """
+        ユーザーの認証情報を保存します（登録済みの場合は置き換えます）。
+
+        Args:
+            user_id: LINEのユーザーID。
+            creds: 保存する認証情報。
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO credentials (user_id, token, version, updated_at) VALUES (?, ?, 0, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET"
+                " token = excluded.token, version = credentials.version + 1, updated_at = excluded.updated_at",
+                (user_id, creds.to_json(), time.time()),
+            )
+
+    def delete(self, user_id: str) -> None:
+        """
+        ユーザーの認証情報を削除します。
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+
+    def users(self) -> List[str]:
+        """
+        認証情報が登録されているユーザーIDの一覧を返します。
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM credentials ORDER BY user_id")]
+
+    def needs_refresh(self, creds: Credentials) -> bool:
+        """
+        認証情報が期限切れ、または期限が近いかどうかを返します。
+        """
+        if creds.expiry is None:
+            return not creds.valid
+        remaining = (creds.expiry - datetime.datetime.utcnow()).total_seconds()
+        return remaining < self.refresh_margin
+
+    def refresh(self, user_id: str, creds: Credentials) -> Credentials:
+        """
+        必要であればユーザーの認証情報を更新し、保存します。
+
+        同じユーザーの更新はプロセス内で1つにまとめ、待っていたスレッドは更新後の認証情報を使います。
+        他のプロセスが先に更新していた場合は、その結果を読み込みます。
+        渡された認証情報はその場で更新するため、それを使っているサービスにもそのまま反映されます。
+
+        Args:
+            user_id: LINEのユーザーID。
+            creds: 現在使用している認証情報。
+
+        Returns:
+            有効な認証情報（渡されたオブジェクト）。
+        """
+        with self._refresh_lock(user_id):
+            # 待っている間に他のスレッドが更新を済ませていれば、何もしない
+            if not self.needs_refresh(creds):
+                return creds
+
+            token, version = self._load(user_id)
+            stored = Credentials.from_authorized_user_info(json.loads(token), SCOPES)
+            if not self.needs_refresh(stored):
+                # 他のプロセスが更新済み
+                _copy_token(stored, creds)
+                return creds
+
+            try:
+                creds.refresh(Request())
+            except Exception:
+                with self._lock:
+                    self._refresh_failures += 1
+                raise
+
+            with self._lock, self._conn:
+                updated = self._conn.execute(
+                    "UPDATE credentials SET token = ?, version = version + 1, updated_at = ?"
+                    " WHERE user_id = ? AND version = ?",
+                    (creds.to_json(), time.time(), user_id, version),
+                ).rowcount
+                self._refreshes += 1
+            if not updated:
+                # 更新中に他のプロセスが書き込んでいた場合は、保存されている方を正とする
+                token, _ = self._load(user_id)
+                _copy_token(Credentials.from_authorized_user_info(json.loads(token), SCOPES), creds)
+            return creds
+
+    def record_refresh(self, user_id: str, creds: Credentials) -> None:
+        """
+        refreshを通さずに更新された認証情報を保存します。
+
+        google-authはAPI呼び出しが401で失敗するとその場でトークンを更新するため、
+        その結果もバージョンを上げて保存し、他のプロセスや次回の読み込みで使えるようにします。
+        保存されている方が新しい（有効期限が後の）場合は上書きしません。
+
+        Args:
+            user_id: LINEのユーザーID。
+            creds: 更新された認証情報。
+        """
+        with self._refresh_lock(user_id):
+            try:
+                token, version = self._load(user_id)
+            except CredentialsNotFoundError:
+                # 更新中に登録が削除された
+                return
+            stored = Credentials.from_authorized_user_info(json.loads(token), SCOPES)
+            if stored.token == creds.token or (
+                stored.expiry is not None and creds.expiry is not None and stored.expiry >= creds.expiry
+            ):
+                return
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "UPDATE credentials SET token = ?, version = version + 1, updated_at = ?"
+                    " WHERE user_id = ? AND version = ?",
+                    (creds.to_json(), time.time(), user_id, version),
+                )
+                self._refreshes += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        登録ユーザー数と、トークンの更新回数を返します。
+        """
+        with self._lock:
+            users = self._conn.execute("SELECT COUNT(*) FROM credentials").fetchone()[0]
+            return {"users": users, "refreshes": self._refreshes, "refresh_failures": self._refresh_failures}
+
+    def _load(self, user_id: str) -> tuple[str, int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT token, version FROM credentials WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            raise CredentialsNotFoundError(user_id)
+        return row[0], row[1]
+
+    def _refresh_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            lock = self._refresh_locks.get(user_id)
+            if lock is None:
+                lock = self._refresh_locks[user_id] = threading.Lock()
+            return lock
+
+
+def _copy_token(source: Credentials, target: Credentials) -> None:
+    """
+    アクセストークンと有効期限を別の認証情報オブジェクトにコピーします。
+    """
+    target.token = source.token
+    target.expiry = source.expiry
+    if source.refresh_token:
+        target._refresh_token = source.refresh_token
@@ -0,0 +1,214 @@
+"""
+CLIからのリクエストを受け付ける常駐プロセス(デーモン)を提供するモジュール。
+
+デーモンはGeminiパーサーとGoogleカレンダーのクライアントを初期化した状態で待機し、
+Unixドメインソケット経由で受け取ったテキストを解析・登録します。
+CLIは重いライブラリを読み込まずにテキストを送るだけで済むため、繰り返し呼び出す場合の起動時間を省けます。
+
+通信は1接続につき1リクエストで、リクエストと応答はそれぞれ改行で終わる1行のJSONです。
+"""
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+from .schemas import ActionType
+
+# ソケットのパスを指定する環境変数
+SOCKET_ENV = "AGENDA_GENIE_SOCKET"
+
+
+def default_socket_path() -> Path:
+    """
+    デーモンのソケットのパスを返します。環境変数 AGENDA_GENIE_SOCKET があればそれを使います。
+    """
+    path = os.getenv(SOCKET_ENV)
+    if path:
+        return Path(path)
+    return Path(tempfile.gettempdir()) / f"agenda_genie-{os.getuid()}.sock"
+
+
+def request(payload: Dict[str, Any], socket_path: str | Path | None = None, timeout: float = 120.0) -> Dict[str, Any]:
+    """
+    デーモンにリクエストを送り、応答を返します。
+
+    Args:
+        payload: 送信するリクエスト（例: {"command": "create", "text": "..."}）。
+        socket_path: デーモンのソケットのパス。指定されない場合は既定のパスを使います。
+        timeout: 応答を待つ最大秒数。
+
+    Returns:
+        デーモンからの応答。
+
+    Raises:
+        OSError: デーモンに接続できない、または応答がない場合。
+    """
+    path = Path(socket_path) if socket_path is not None else default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("デーモンから応答がありませんでした。")
+    return json.loads(line)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self.server.agenda_daemon.handle_request(json.loads(line))  # type: ignore[attr-defined]
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+class AgendaDaemon:
+    """
+    初期化済みのパーサーとカレンダーのクライアントを保持し、リクエストを処理するクラス。
+
+    handle_requestはソケットを介さずにも呼び出せるため、CLIはデーモンが起動していない場合に
+    同じ処理をプロセス内で実行します。
+    """
+
+    def __init__(self, socket_path: str | Path | None = None, parser: Any = None, calendar_pool: Any = None):
+        """
+        パーサーを初期化します。カレンダーのクライアントは最初に必要になったときに構築します。
+
+        Args:
+            socket_path: 待ち受けるソケットのパス。指定されない場合は既定のパスを使います。
+            parser: 使用するパーサー（任意）。指定されない場合はGeminiParserを生成します。
+            calendar_pool: 使用するCalendarClientPool（任意）。
+
+        Raises:
+            ValueError: GeminiのAPIキーが設定されていない場合。
+            FileNotFoundError: プロンプトファイルが見つからない場合。
+        """
+        self.socket_path = Path(socket_path) if socket_path is not None else default_socket_path()
+        if parser is None:
+            from .natural_language_parser import GeminiParser
+
+            parser = GeminiParser()
+        self.parser = parser
+        self._calendar_pool = calendar_pool
+        self._pool_lock = threading.Lock()
+        self._server: socketserver.ThreadingUnixStreamServer | None = None
+
+    @property
+    def calendar_pool(self) -> Any:
+        """
+        カレンダーのクライアントプール。初回のアクセス時に生成します。
+        """
+        with self._pool_lock:
+            if self._calendar_pool is None:
+                from .calendar_pool import CalendarClientPool
+
+                self._calendar_pool = CalendarClientPool()
+            return self._calendar_pool
+
+    def handle_request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        1件のリクエストを処理します。
+
+        コマンドは次のいずれかです。
+            "ping": デーモンが応答できるかを確認します。
+            "parse": "text" を解析した結果を返します。
+            "create": "text" を解析し、予定の作成であればカレンダーに登録します。
+            "stop": デーモンを停止します。
+
+        Args:
+            payload: "command" と、コマンドに応じて "text" を持つ辞書。
+
+        Returns:
+            "ok" と、成功した場合は "result"、失敗した場合は "error" を持つ辞書。
+        """
+        command = payload.get("command")
+        if command == "ping":
+            return {"ok": True, "result": {"pid": os.getpid()}}
+        if command == "stop":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"ok": True, "result": None}
+        if command not in ("parse", "create"):
+            return {"ok": False, "error": f"不明なコマンドです: {command}"}
+
+        text = payload.get("text") or ""
+        parsed = self.parser.parse_event_text(text)
+        result: Dict[str, Any] = {"parsed": parsed.to_dict() if parsed else None, "created": False, "link": None}
+        if command == "create" and parsed is not None and parsed.action == ActionType.CREATE:
+            with self.calendar_pool.acquire() as manager:
+                created = manager.create_event(parsed.event)
+            if created is None:
+                return {"ok": False, "error": "Googleカレンダーへのイベント登録に失敗しました。", "result": result}
+            result["created"] = True
+            result["link"] = created.get("htmlLink")
+        return {"ok": True, "result": result}
+
+    def serve_forever(self) -> None:
+        """
+        ソケットで待ち受け、停止されるまでリクエストを処理します。
+
+        Raises:
+            RuntimeError: 同じソケットで別のデーモンがすでに起動している場合。
+        """
+        self._remove_stale_socket()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 他のユーザーから接続されないよう、ソケットは所有者だけが読み書きできるように作成する
+        old_umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        server.daemon_threads = True
+        server.agenda_daemon = self  # type: ignore[attr-defined]
+        self._server = server
+
+        self._warm_up()
+        print(f"デーモンを起動しました: {self.socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+            print("デーモンを停止しました。")
+
+    def shutdown(self) -> None:
+        """
+        待ち受けを停止します。
+        """
+        if self._server is not None:
+            self._server.shutdown()
+
+    def _warm_up(self) -> None:
+        """
+        認証とカレンダーのサービスの構築を起動時に済ませておきます。
+        """
+        try:
+            with self.calendar_pool.acquire():
+                pass
+        except Exception as e:
+            print(f"警告: Googleカレンダーへの接続に失敗しました。登録時に再試行します。 {e}")
+
+    def _remove_stale_socket(self) -> None:
+        """
+        以前のデーモンが残したソケットファイルを削除します。
+        """
+        if not self.socket_path.exists():
+            return
+        try:
+            request({"command": "ping"}, self.socket_path, timeout=1.0)
+        except OSError:
+            self.socket_path.unlink()
+            return
+        raise RuntimeError(f"デーモンはすでに起動しています: {self.socket_path}")
@@ -0,0 +1,261 @@
+"""
+LINEから再送されたwebhookイベントを重複して処理しないためのモジュール。
+
+/callbackの応答が遅れるとLINEプラットフォームは同じイベントを再送します。イベントごとに
+一意なwebhookEventIdを記録しておき、処理済みのイベントは読み飛ばします。再送が最初の処理の
+途中で届いた場合は、最初の処理が終わるのを待ってから判定するため、Geminiの解析や予定の登録が
+二重に行われることはありません。
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+# イベントの処理状態
+IN_FLIGHT = "in_flight"
+DONE = "done"
+
+
+class EventDeduplicator:
+    """
+    処理中・処理済みのイベントIDをメモリ上に保持する重複排除。
+
+    処理済みのIDはttl秒の間保持し、max_entriesを超えた場合は古いものから削除します。
+    処理中のIDはlease秒が過ぎると、処理していたスレッドが失われたものとみなして引き継ぎます。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 3600.0,
+        lease: float = 120.0,
+        wait_timeout: float = 60.0,
+        poll_interval: float = 0.2,
+    ):
+        """
+        Args:
+            max_entries: 保持するイベントIDの最大数。
+            ttl: 処理済みのイベントIDを保持する秒数。
+            lease: 処理中のイベントを、他の処理が引き継げるようになるまでの秒数。
+            wait_timeout: 再送されたイベントが、最初の処理の完了を待つ最大秒数。
+            poll_interval: 最初の処理の完了を確認する間隔（秒）。
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        # イベントID -> (状態, 有効期限)
+        self._entries: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._done = threading.Condition(threading.Lock())
+        self._processed = 0
+        self._duplicates = 0
+        self._waits = 0
+        self._timeouts = 0
+
+    @contextmanager
+    def process(self, event_id: str | None) -> Iterator[bool]:
+        """
+        イベントを処理してよいかを判定し、処理の完了(または失敗)を記録します。
+
+        同じイベントが処理中の場合は、その処理が終わるまで待ちます。
+        ブロック内で例外が発生した場合は記録を取り消し、再送されたイベントで処理をやり直せるようにします。
+
+        Args:
+            event_id: webhookEventId。Noneの場合は重複を判定せずに処理します。
+
+        Yields:
+            処理すべき場合はTrue、処理済み（または待ちきれなかった）重複の場合はFalse。
+
+        Example:
+            with deduplicator.process(event.webhook_event_id) as fresh:
+                if fresh:
+                    handle(event)
+        """
+        if not event_id:
+            yield True
+            return
+
+        claimed = self._wait_for_claim(event_id)
+        if not claimed:
+            yield False
+            return
+
+        try:
+            yield True
+        except BaseException:
+            self._release(event_id)
+            raise
+        self._complete(event_id)
+        with self._lock:
+            self._processed += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        処理したイベント・読み飛ばした重複・完了を待った回数などを返します。
+
+        Returns:
+            各カウンターの値を持つ辞書。
+        """
+        with self._lock:
+            return {
+                "processed": self._processed,
+                "duplicates": self._duplicates,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "entries": self._count_entries(),
+            }
+
+    def _wait_for_claim(self, event_id: str) -> bool:
+        """
+        イベントの処理を引き受けられるまで待ちます。処理済みの場合や待ちきれない場合はFalseを返します。
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            state = self._claim(event_id)
+            if state is None:
+                return True
+            if state == DONE:
+                with self._lock:
+                    self._duplicates += 1
+                return False
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"処理中のイベントの完了を待ちきれませんでした: {event_id}")
+                with self._lock:
+                    self._timeouts += 1
+                return False
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._waits += 1
+            with self._done:
+                self._done.wait(min(self.poll_interval, remaining))
+
+    def _notify(self) -> None:
+        with self._done:
+            self._done.notify_all()
+
+    def _claim(self, event_id: str) -> str | None:
+        """
+        イベントを処理中として記録します。
+
+        Returns:
+            記録できた場合はNone、すでに記録されている場合はその状態(IN_FLIGHT / DONE)。
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(event_id)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            self._entries[event_id] = (IN_FLIGHT, now + self.lease)
+            self._entries.move_to_end(event_id)
+            return None
+
+    def _complete(self, event_id: str) -> None:
+        with self._lock:
+            self._entries[event_id] = (DONE, time.monotonic() + self.ttl)
+            self._entries.move_to_end(event_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._notify()
+
+    def _release(self, event_id: str) -> None:
+        with self._lock:
+            self._entries.pop(event_id, None)
+        self._notify()
+
+    def _count_entries(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteEventDeduplicator(EventDeduplicator):
+    """
+    SQLiteに記録し、同じデータベースを使う複数のプロセスの間で重複を排除する重複排除。
+
+    別のプロセスで処理中のイベントは、poll_intervalごとに状態を確認して完了を待ちます。
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int = 100000,
+        ttl: float = 3600.0,
+        lease: float = 120.0,
+        wait_timeout: float = 60.0,
+        poll_interval: float = 0.2,
+    ):
+        """
+        Args:
+            path: SQLiteデータベースファイルのパス。
+            max_entries: 保持するイベントIDの最大数。
+            ttl: 処理済みのイベントIDを保持する秒数。
+            lease: 処理中のイベントを、他の処理が引き継げるようになるまでの秒数。
+            wait_timeout: 再送されたイベントが、最初の処理の完了を待つ最大秒数。
+            poll_interval: 最初の処理の完了を確認する間隔（秒）。
+        """
+        super().__init__(
+            max_entries=max_entries, ttl=ttl, lease=lease, wait_timeout=wait_timeout, poll_interval=poll_interval
+        )
+        # 複数のプロセスから読み書きできるよう、WALモードで開き、書き込みの競合は待機する
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30.0)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_events ("
+                " event_id TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS webhook_events_expires_at ON webhook_events (expires_at)"
+            )
+
+    def _claim(self, event_id: str) -> str | None:
+        now = time.time()
+        with self._lock, self._conn:
+            # 未登録、または期限切れの場合だけ処理中として記録する（1つの文で行い、プロセス間で競合しないようにする）
+            claimed = self._conn.execute(
+                "INSERT INTO webhook_events (event_id, state, expires_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(event_id) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at"
+                " WHERE webhook_events.expires_at <= ?",
+                (event_id, IN_FLIGHT, now + self.lease, now),
+            ).rowcount
+            if claimed:
+                return None
+            row = self._conn.execute(
+                "SELECT state FROM webhook_events WHERE event_id = ?", (event_id,)
+            ).fetchone()
+        # 確認の間に記録が取り消された場合は、次の確認で処理を引き受ける
+        return row[0] if row is not None else IN_FLIGHT
+
+    def _complete(self, event_id: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE webhook_events SET state = ?, expires_at = ? WHERE event_id = ?",
+                (DONE, now + self.ttl, event_id),
+            )
+            self._conn.execute("DELETE FROM webhook_events WHERE expires_at <= ? AND state = ?", (now, DONE))
+            self._conn.execute(
+                "DELETE FROM webhook_events WHERE event_id IN ("
+                " SELECT event_id FROM webhook_events WHERE state = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (DONE, self.max_entries),
+            )
+        self._notify()
+
+    def _release(self, event_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM webhook_events WHERE event_id = ? AND state = ?", (event_id, IN_FLIGHT)
+            )
+        self._notify()
+
+    def _count_entries(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM webhook_events").fetchone()[0]
@@ -0,0 +1,130 @@
+"""
+Webhookで受け取ったイベントを非同期に処理するためのワーカーキューを提供するモジュール。
+
+エンドポイントはイベントをキューに積んですぐに応答し、
+解析・カレンダー操作・返信はワーカースレッドで実行します。
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+# ワーカーに停止を伝えるための番兵
+_STOP = object()
+
+
+class EventQueue:
+    """
+    上限付きのキューと固定数のワーカースレッドからなる処理プール。
+
+    キューが満杯の場合、submitは待たずにFalseを返します（バックプレッシャー）。
+    """
+
+    def __init__(self, num_workers: int = 4, max_size: int = 100, name: str = "event-worker"):
+        """
+        キューを初期化し、ワーカースレッドを起動します。
+
+        Args:
+            num_workers: ワーカースレッドの数。
+            max_size: キューに積めるタスクの最大数。
+            name: ワーカースレッド名の接頭辞。
+        """
+        self.num_workers = num_workers
+        self.max_size = max_size
+        self._queue: queue.Queue[Any] = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._closed = False
+
+        self._submitted = 0
+        self._rejected = 0
+        self._processed = 0
+        self._failed = 0
+
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> bool:
+        """
+        タスクをキューに追加します。
+
+        Args:
+            func: ワーカーで実行する関数。
+            *args: 関数に渡す引数。
+
+        Returns:
+            追加できた場合はTrue、キューが満杯または停止済みの場合はFalse。
+        """
+        task: Tuple[Callable[..., Any], Tuple[Any, ...]] = (func, args)
+        with self._lock:
+            if self._closed:
+                self._rejected += 1
+                return False
+            try:
+                self._queue.put_nowait(task)
+            except queue.Full:
+                self._rejected += 1
+                return False
+            self._submitted += 1
+        return True
+
+    def qsize(self) -> int:
+        """
+        キューで待機中のタスク数を返します。
+        """
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キューの状態と処理件数のカウンターを返します。
+
+        Returns:
+            各カウンターの値を持つ辞書。
+        """
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "processed": self._processed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self, wait: bool = True, timeout: float | None = None) -> None:
+        """
+        新しいタスクの受け付けを止め、積まれているタスクを処理し終えてからワーカーを停止します。
+
+        Args:
+            wait: ワーカーの終了を待つかどうか。
+            timeout: すべてのワーカーの終了を待つ最大秒数。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            for worker in self._workers:
+                worker.join(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _run(self) -> None:
+        """
+        キューからタスクを取り出して実行し続けるワーカーのメインループ。
+        """
+        while True:
+            task = self._queue.get()
+            if task is _STOP:
+                return
+            func, args = task
+            try:
+                func(*args)
+                with self._lock:
+                    self._processed += 1
+            except Exception as e:
+                print(f"キューのタスク実行中にエラーが発生しました: {e}")
+                with self._lock:
+                    self._failed += 1
@@ -5,70 +5,300 @@ CalendarEventオブジェクトを受け取り、Google Calendar APIを呼び出
 カレンダーへのイベント登録・操作を行います。
 """
 import datetime
+import json
 import os.path
-from typing import List, Dict, Any
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from . import metrics
+from .calendar_mirror import CalendarMirror
+from .conflicts import ConflictChecker, ConflictReport
+from .resilience import Upstream, UpstreamUnavailableError, backoff_delay, get_upstream
 from .schemas import CalendarEvent
+from .time_utils import TIME_ZONE_NAME, to_rfc3339
 
 # Google Calendar APIのスコープを定義
 # 読み書き両方の権限を与える
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# 1回のバッチリクエストにまとめられるリクエスト数の上限(Calendar APIの推奨値)
+MAX_BATCH_SIZE = 50
+
+# 再試行すれば成功する可能性があるHTTPステータス
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# 403のうち、再試行すれば成功する可能性があるレート制限の理由（_error_reasonsで正規化した形）
+RATE_LIMIT_REASONS = {"ratelimitexceeded", "userratelimitexceeded"}
+
+# 同じIDのイベントが既に存在する場合のHTTPステータス
+CONFLICT_STATUS = 409
+
+
+@dataclass
+class BatchItemResult:
+    """
+    バッチ処理における1件ごとの結果。
+
+    Attributes:
+        index: 入力における位置。
+        success: 処理が成功したかどうか。
+        response: APIの応答（作成されたイベントのリソースなど）。
+        error: 失敗した場合のエラー内容。
+    """
+
+    index: int
+    success: bool
+    response: Dict[str, Any] | None = None
+    error: str | None = None
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    再試行すべきエラーかどうかを判定します。
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    # 403はレート制限を超えた場合にも返される
+    return status == 403 and not _error_reasons(error).isdisjoint(RATE_LIMIT_REASONS)
+
+
+def _error_reasons(error: HttpError) -> Set[str]:
+    """
+    エラー応答のJSONに含まれる理由(reason)を、大文字・小文字と区切り文字を無視した形で返します。
+
+    Calendar APIは error.errors[].reason に "rateLimitExceeded" などを、
+    新しい形式では error.details[].reason に "RATE_LIMIT_EXCEEDED" などを返します。
+    """
+    try:
+        data = json.loads(error.content or b"")
+    except (ValueError, UnicodeDecodeError):
+        return set()
+    if isinstance(data, list) and data:
+        data = data[0]
+    body = data.get("error") if isinstance(data, dict) else None
+    if not isinstance(body, dict):
+        return set()
+    reasons = set()
+    for item in [*(body.get("errors") or []), *(body.get("details") or [])]:
+        if isinstance(item, dict) and isinstance(item.get("reason"), str):
+            reasons.add(item["reason"].replace("_", "").casefold())
+    return reasons
+
+
+def load_credentials(credentials_file: str = "credentials.json", token_file: str = "token.json") -> Credentials:
+    """
+    トークンファイルから認証情報を読み込み、必要であれば更新・再認証します。
+
+    Args:
+        credentials_file: OAuthクライアントの認証情報ファイルのパス。
+        token_file: 保存済みトークンファイルのパス。
+
+    Returns:
+        有効な認証情報。
+    """
+    creds = None
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            # 対話的な認証は初回のみ必要なため、使うときだけ読み込む
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
+            creds = flow.run_console()
+
+        save_credentials(creds, token_file)
+
+    return creds
+
+
+def save_credentials(creds: Credentials, token_file: str = "token.json") -> None:
+    """
+    認証情報をトークンファイルに保存します。
+
+    同じファイルを読み込む他のプロセスが書きかけの内容を読まないよう、一時ファイルに書き込んでから置き換えます。
+
+    Args:
+        creds: 保存する認証情報。
+        token_file: 保存先のトークンファイルのパス。
+    """
+    directory = os.path.dirname(os.path.abspath(token_file))
+    fd, tmp_path = tempfile.mkstemp(prefix=".token-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as token:
+            token.write(creds.to_json())
+        os.replace(tmp_path, token_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 
 class GoogleCalendarManager:
     """
     Googleカレンダーの操作を管理するクラス。
     """
     
-    def __init__(self, credentials_file="credentials.json", token_file ="token.json"):
+    def __init__(
+        self,
+        credentials_file="credentials.json",
+        token_file ="token.json",
+        service=None,
+        mirror: CalendarMirror | None = None,
+        conflict_checker: ConflictChecker | None = None,
+        upstream: Upstream | None = None,
+    ):
         """
         認証情報を初期化し、Google Calendar APIへの接続を準備します。
+
+        Args:
+            credentials_file: OAuthクライアントの認証情報ファイルのパス。
+            token_file: 保存済みトークンファイルのパス。
+            service: 構築済みのCalendar APIサービス（任意）。
+                指定された場合は認証とサービスの構築を省略します。
+            mirror: カレンダーのローカル複製（任意）。
+                指定された場合、search_eventsはAPIを呼び出さずに複製から検索します。
+            conflict_checker: 予定の重なりを調べるためのキャッシュ（任意）。
+                指定された場合、作成・削除したイベントをキャッシュに反映します。
+            upstream: API呼び出しのレート制限・再試行・サーキットブレーカー（任意）。
+                指定しない場合はプロセス全体で共有する"calendar"のUpstreamを使います。
+
+        Raises:
+            UpstreamUnavailableError: 各メソッドで、APIが一時的に使えない場合に送出されます。
         """
-        creds = None
-        if os.path.exists(token_file):
-            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
-                creds = flow.run_console()
-        
-            with open(token_file, 'w') as token:
-                token.write(creds.to_json())
-            
-        self.service = build("calendar", "v3", credentials=creds)
+        if service is None:
+            creds = load_credentials(credentials_file, token_file)
+            service = build("calendar", "v3", credentials=creds)
+        self.service = service
+        self.mirror = mirror
+        self.conflict_checker = conflict_checker
+        self.upstream = upstream or get_upstream("calendar", is_retryable=_is_retryable)
+
+    def check_conflicts(self, event: CalendarEvent) -> ConflictReport | None:
+        """
+        登録しようとしている予定が既存の予定と重なるかどうかを調べます。
 
-    def create_event(self, event: CalendarEvent) -> None:
+        Returns:
+            判定結果のConflictReport。conflict_checkerが設定されていない場合や、予定を読み込めなかった場合はNone。
+        """
+        if self.conflict_checker is None:
+            return None
+        try:
+            with metrics.span("calendar.check_conflicts"):
+                return self.conflict_checker.check(self, event)
+        except HttpError as error:
+            # 予定の一部しか読み込めなかった場合は、重なりを判定せずに登録を続ける
+            print(f"An error occurred while checking conflicts: {error}")
+            return None
+
+    @metrics.timed("calendar.create_event")
+    def create_event(self, event: CalendarEvent) -> Dict[str, Any] | None:
         """
         新しいイベントをGoogleカレンダーに登録します。
+
+        Returns:
+            作成されたイベントのリソース。失敗した場合はNone。
         """
-        event_body = {
-            "summary": event.title,
-            "description": event.description,
-            "start": {
-                "dateTime": event.start_time.isoformat(),
-                "timeZone": "Asia/Tokyo",
-            },
-            "end": {
-                "dateTime": event.end_time.isoformat(),
-                "timeZone": "Asia/Tokyo",
-            },
-        }
-        
+        event_body = self._build_event_body(event)
+
         try:
-            created_event = self.service.events().insert(calendarId='primary', body=event_body).execute()
+            request = self.service.events().insert(calendarId='primary', body=event_body)
+            try:
+                created_event = self.upstream.call(request.execute)
+            except HttpError as error:
+                # IDはここで生成したものなので、409は再試行の前の送信で登録済みであることを示す
+                if error.resp.status != CONFLICT_STATUS:
+                    raise
+                created_event = self._get_created(event_body)
             print(f"Event created: {created_event.get('htmlLink')}")
         except HttpError as error:
+            metrics.inc("agenda_genie_api_errors_total", {"api": "calendar", "method": "insert"})
             print(f"An error occurred: {error}")
+            return None
+
+        self._record_created(created_event)
+        return created_event
+
+    @metrics.timed("calendar.create_events")
+    def create_events(
+        self,
+        events: Iterable[CalendarEvent],
+        batch_size: int = MAX_BATCH_SIZE,
+        max_retries: int = 3,
+    ) -> List[BatchItemResult]:
+        """
+        複数のイベントをバッチリクエストでまとめて登録します。
+
+        Args:
+            events: 登録するイベント。
+            batch_size: 1回のバッチリクエストにまとめる件数。
+            max_retries: 一時的なエラーで失敗した項目を再試行する最大回数。
+
+        Returns:
+            入力と同じ順序の、1件ごとの結果のリスト。
+        """
+        bodies = [self._build_event_body(event) for event in events]
+        results = self._execute_batch(
+            lambda i: self.service.events().insert(calendarId='primary', body=bodies[i]),
+            len(bodies),
+            batch_size,
+            max_retries,
+            # 再送した項目の409は、前回の送信で登録済みであることを示す
+            conflict_response=lambda i: bodies[i],
+        )
+        for result in results:
+            if result.success and result.response:
+                self._record_created(result.response)
+        print(f"Batch create finished: {sum(r.success for r in results)}/{len(results)} succeeded.")
+        return results
 
+    @metrics.timed("calendar.delete_events")
+    def delete_events(
+        self,
+        event_ids: Iterable[str],
+        batch_size: int = MAX_BATCH_SIZE,
+        max_retries: int = 3,
+    ) -> List[BatchItemResult]:
+        """
+        複数のイベントをバッチリクエストでまとめて削除します。
+
+        Args:
+            event_ids: 削除するイベントのID。
+            batch_size: 1回のバッチリクエストにまとめる件数。
+            max_retries: 一時的なエラーで失敗した項目を再試行する最大回数。
+
+        Returns:
+            入力と同じ順序の、1件ごとの結果のリスト。
+        """
+        ids = list(event_ids)
+        results = self._execute_batch(
+            lambda i: self.service.events().delete(calendarId='primary', eventId=ids[i]),
+            len(ids),
+            batch_size,
+            max_retries,
+        )
+        for result in results:
+            if result.success:
+                self._record_deleted(ids[result.index])
+        print(f"Batch delete finished: {sum(r.success for r in results)}/{len(results)} succeeded.")
+        return results
+
+    @metrics.timed("calendar.search_events")
     def search_events(
         self, 
         start_time: datetime.datetime, 
@@ -78,28 +308,104 @@ class GoogleCalendarManager:
         """
         指定された期間とクエリでイベントを検索します。
 
+        すべてのページを読み込んでリストで返します。大きな期間を扱う場合や、
+        一部の結果だけが必要な場合は iter_events を使用してください。
+
         Args:
-            start_time: 検索範囲の開始日時。
-            end_time: 検索範囲の終了日時。
+            start_time: 検索範囲の開始日時。タイムゾーンがない場合は日本時間として扱います。
+            end_time: 検索範囲の終了日時。タイムゾーンがない場合は日本時間として扱います。
             query: 検索キーワード（任意）。
 
         Returns:
             見つかったイベントのリスト。
+
+        Raises:
+            HttpError: 2ページ目以降の取得に失敗した場合。
         """
-        try:
-            events_result = self.service.events().list(
-                calendarId='primary', 
-                timeMin=start_time.isoformat() + 'Z', # 'Z'はUTCを示す
-                timeMax=end_time.isoformat() + 'Z',
-                q=query,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            return events_result.get('items', [])
-        except HttpError as error:
-            print(f"An error occurred: {error}")
-            return []
+        return list(self.iter_events(start_time, end_time, query))
+
+    def iter_events(
+        self,
+        start_time: datetime.datetime,
+        end_time: datetime.datetime,
+        query: str | None = None,
+        fields: Iterable[str] | None = None,
+        page_size: int = 250,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        指定された期間とクエリでイベントを検索し、開始時刻順に1件ずつ返します。
+
+        次のページは必要になった時点で取得するため、呼び出し側は必要な件数が
+        揃った時点で読み込みを打ち切ることができます。
+        ローカル複製が有効で、複製している期間から検索できる場合は、必要に応じて差分同期してから複製を検索します。
 
+        Args:
+            start_time: 検索範囲の開始日時。タイムゾーンがない場合は日本時間として扱います。
+            end_time: 検索範囲の終了日時。タイムゾーンがない場合は日本時間として扱います。
+            query: 検索キーワード（任意）。
+            fields: 取得するイベントのフィールド（例: ("id", "summary", "start", "end")）。
+                指定しない場合はすべてのフィールドを取得します。
+            page_size: 1ページあたりの最大件数(maxResults)。
+
+        Yields:
+            見つかったイベント。最初のページの取得に失敗した場合は何も返しません。
+
+        Raises:
+            HttpError: 2ページ目以降の取得に失敗した場合（それまでに返したイベントだけでは結果が欠けているため）。
+        """
+        fields = tuple(fields) if fields is not None else None
+
+        if self.mirror is not None and self.mirror.covers(start_time):
+            try:
+                with metrics.span("calendar.mirror_sync"):
+                    # 同期が必要な場合に送るリクエストだけをレート制限と再試行の対象にする
+                    self.mirror.refresh_if_stale(
+                        self.service, execute=lambda request: self.upstream.call(request.execute)
+                    )
+                with metrics.span("calendar.mirror_search"):
+                    events = self.mirror.search(start_time, end_time, query)
+            except HttpError as error:
+                metrics.inc("agenda_genie_api_errors_total", {"api": "calendar", "method": "sync"})
+                # 同期に失敗した場合はAPIで直接検索する
+                print(f"An error occurred while syncing the calendar mirror: {error}")
+            else:
+                for event in events:
+                    yield event if fields is None else {k: event[k] for k in fields if k in event}
+                return
+
+        params: Dict[str, Any] = {
+            "calendarId": 'primary',
+            "timeMin": to_rfc3339(start_time),
+            "timeMax": to_rfc3339(end_time),
+            "q": query,
+            "singleEvents": True,
+            "orderBy": 'startTime',
+            "maxResults": page_size,
+        }
+        if fields is not None:
+            params["fields"] = f"nextPageToken,items({','.join(fields)})"
+
+        page_token = None
+        while True:
+            try:
+                with metrics.span("calendar.list_page"):
+                    request = self.service.events().list(pageToken=page_token, **params)
+                    events_result = self.upstream.call(request.execute)
+            except HttpError as error:
+                metrics.inc("agenda_genie_api_errors_total", {"api": "calendar", "method": "list"})
+                print(f"An error occurred: {error}")
+                # 途中のページで失敗した場合は、結果が欠けていることを呼び出し側に知らせる
+                if page_token is not None:
+                    raise
+                return
+
+            yield from events_result.get('items', [])
+
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return
+
+    @metrics.timed("calendar.delete_event")
     def delete_event(self, event_id: str) -> bool:
         """
         指定されたIDのイベントを削除します。
@@ -111,9 +417,153 @@ class GoogleCalendarManager:
             削除が成功した場合はTrue、失敗した場合はFalse。
         """
         try:
-            self.service.events().delete(calendarId='primary', eventId=event_id).execute()
+            request = self.service.events().delete(calendarId='primary', eventId=event_id)
+            self.upstream.call(request.execute)
             print(f"Event with ID: {event_id} deleted successfully.")
+            self._record_deleted(event_id)
             return True
         except HttpError as error:
+            metrics.inc("agenda_genie_api_errors_total", {"api": "calendar", "method": "delete"})
             print(f"An error occurred while deleting event {event_id}: {error}")
             return False
+
+    def _record_created(self, event: Dict[str, Any]) -> None:
+        """
+        作成したイベントをローカル複製と重なり判定のキャッシュに反映します。
+        """
+        if self.mirror is not None:
+            self.mirror.upsert(event)
+        if self.conflict_checker is not None:
+            self.conflict_checker.record_created(event)
+
+    def _record_deleted(self, event_id: str) -> None:
+        """
+        削除したイベントをローカル複製と重なり判定のキャッシュから取り除きます。
+        """
+        if self.mirror is not None:
+            self.mirror.remove(event_id)
+        if self.conflict_checker is not None:
+            self.conflict_checker.record_deleted(event_id)
+
+    def _get_created(self, event_body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        登録済みだったイベントのリソースを取得します。取得できない場合は送信したリソースを返します。
+        """
+        try:
+            request = self.service.events().get(calendarId='primary', eventId=event_body["id"])
+            return self.upstream.call(request.execute)
+        except HttpError as error:
+            print(f"An error occurred while fetching event {event_body['id']}: {error}")
+            return event_body
+
+    def _build_event_body(self, event: CalendarEvent) -> Dict[str, Any]:
+        """
+        CalendarEventをGoogle Calendar APIのイベントリソースに変換します。
+
+        再試行で同じイベントが二重に登録されないよう、IDはクライアントで生成します
+        (Calendar APIのIDに使える文字は0-9とa-vのため、UUIDの16進表記を使います)。
+        """
+        return {
+            "id": uuid.uuid4().hex,
+            "summary": event.title,
+            "description": event.description,
+            "start": {
+                "dateTime": event.start_time.isoformat(),
+                "timeZone": TIME_ZONE_NAME,
+            },
+            "end": {
+                "dateTime": event.end_time.isoformat(),
+                "timeZone": TIME_ZONE_NAME,
+            },
+        }
+
+    def _execute_batch(
+        self,
+        make_request: Callable[[int], Any],
+        count: int,
+        batch_size: int,
+        max_retries: int,
+        conflict_response: Callable[[int], Dict[str, Any]] | None = None,
+    ) -> List[BatchItemResult]:
+        """
+        count件のリクエストをbatch_size件ずつバッチで送信し、一時的なエラーで失敗した項目だけを再試行します。
+
+        各バッチはupstreamのレート制限に含まれる件数分のトークンを消費します（トークンが貯まるまで待ちます）。
+        サーキットブレーカーが開いている間は送信せず、そのバッチの項目を失敗として扱います。
+
+        Args:
+            make_request: 入力の位置を受け取り、APIリクエストを生成する関数。
+            count: リクエストの件数。
+            batch_size: 1回のバッチリクエストにまとめる件数。
+            max_retries: 再試行の最大回数。
+            conflict_response: 再送した項目が409で失敗した場合に、成功として扱うための応答を返す関数（任意）。
+
+        Returns:
+            入力と同じ順序の、1件ごとの結果のリスト。
+        """
+        batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        sent: Set[int] = set()
+        results: List[BatchItemResult | None] = [None] * count
+        pending = list(range(count))
+
+        for attempt in range(max_retries + 1):
+            retry: List[int] = []
+
+            for offset in range(0, len(pending), batch_size):
+                chunk = pending[offset:offset + batch_size]
+                try:
+                    self.upstream.before_request(len(chunk), block=True)
+                except UpstreamUnavailableError as error:
+                    for index in chunk:
+                        results[index] = BatchItemResult(index=index, success=False, error=str(error))
+                    continue
+
+                def callback(request_id, response, exception):
+                    index = int(request_id)
+                    if (
+                        isinstance(exception, HttpError)
+                        and exception.resp.status == CONFLICT_STATUS
+                        and conflict_response is not None
+                        and index in sent
+                    ):
+                        results[index] = BatchItemResult(index=index, success=True, response=conflict_response(index))
+                    elif exception is None:
+                        results[index] = BatchItemResult(index=index, success=True, response=response or None)
+                    else:
+                        metrics.inc("agenda_genie_api_errors_total", {"api": "calendar", "method": "batch_item"})
+                        results[index] = BatchItemResult(index=index, success=False, error=str(exception))
+                        if _is_retryable(exception):
+                            retry.append(index)
+
+                batch = self.service.new_batch_http_request(callback=callback)
+                for index in chunk:
+                    batch.add(make_request(index), request_id=str(index))
+                retry_before = len(retry)
+                try:
+                    with metrics.span("calendar.batch"):
+                        batch.execute()
+                except HttpError as error:
+                    metrics.inc("agenda_genie_api_errors_total", {"api": "calendar", "method": "batch"})
+                    # バッチ全体が失敗した場合は、含まれる全項目を失敗として扱う
+                    print(f"An error occurred while executing a batch: {error}")
+                    for index in chunk:
+                        results[index] = BatchItemResult(index=index, success=False, error=str(error))
+                    if _is_retryable(error):
+                        retry.extend(chunk)
+                sent.update(chunk)
+                # 一時的なエラーを含むバッチは、1回の失敗としてサーキットブレーカーに記録する
+                if len(retry) > retry_before:
+                    self.upstream.record_failure()
+                else:
+                    self.upstream.record_success()
+
+            if not retry or attempt == max_retries:
+                break
+            pending = sorted(retry)
+            # ジッター付きの指数バックオフで待ってから、失敗した項目だけを再送する
+            time.sleep(backoff_delay(attempt))
+
+        return [
+            result if result is not None else BatchItemResult(index=i, success=False, error="no response")
+            for i, result in enumerate(results)
+        ]
@@ -0,0 +1,190 @@
+"""
+予定の時間帯(区間)を保持し、重なりと空き時間を高速に求めるためのインデックスを提供するモジュール。
+
+区間を開始時刻順に並べた配列と、各位置までの終了時刻の最大値(接頭辞最大値)を持つことで、
+区間木と同じく「ある期間と重なる区間」を二分探索で絞り込んでから列挙します。
+"""
+import bisect
+import datetime
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from .time_utils import localize, parse_event_time
+
+
+@dataclass
+class Interval:
+    """
+    インデックスに格納する1つの区間。
+
+    Attributes:
+        start: 開始日時（タイムゾーン付き）。
+        end: 終了日時（タイムゾーン付き）。
+        key: 区間を識別するキー（イベントIDなど）。
+        busy: この区間を予定あり(busy)として扱うかどうか。
+        all_day: 終日の予定かどうか。
+        data: 元のイベントリソースなど、任意のデータ。
+    """
+
+    start: datetime.datetime
+    end: datetime.datetime
+    key: str
+    busy: bool = True
+    all_day: bool = False
+    data: Any = field(default=None, compare=False, repr=False)
+
+    @classmethod
+    def from_event(cls, event: Dict[str, Any]) -> "Interval":
+        """
+        Google Calendar APIのイベントリソースから区間を作成します。
+
+        終日の予定と、「予定なし」として登録された予定(transparency="transparent")は
+        空き時間の計算では予定ありとして扱いません。
+        """
+        all_day = "date" in event["start"]
+        return cls(
+            start=parse_event_time(event["start"]),
+            end=parse_event_time(event["end"]),
+            key=event.get("id", ""),
+            busy=not all_day and event.get("transparency") != "transparent",
+            all_day=all_day,
+            data=event,
+        )
+
+
+def free_gaps(
+    intervals: Iterable[Interval],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    min_duration: datetime.timedelta = datetime.timedelta(0),
+) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """
+    開始時刻順に並んだ区間のうち予定ありのものを除いた、期間内の空き時間を求めます。
+
+    Args:
+        intervals: 開始時刻順に並んだ区間。
+        start: 対象期間の開始日時。
+        end: 対象期間の終了日時。
+        min_duration: 空き時間として扱う最小の長さ。
+
+    Returns:
+        (開始, 終了) の組のリスト。
+    """
+    start, end = localize(start), localize(end)
+    gaps: List[Tuple[datetime.datetime, datetime.datetime]] = []
+    cursor = start
+    for interval in intervals:
+        if not interval.busy or interval.end <= cursor:
+            continue
+        if interval.start >= end:
+            break
+        if interval.start - cursor >= min_duration and interval.start > cursor:
+            gaps.append((cursor, interval.start))
+        cursor = max(cursor, interval.end)
+        if cursor >= end:
+            return gaps
+    if end - cursor >= min_duration and end > cursor:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class IntervalIndex:
+    """
+    区間を開始時刻順に保持し、期間と重なる区間を列挙するインデックス。
+
+    検索は二分探索で候補の範囲を絞り込むため、区間の数が多くても期間外の区間はほとんど調べません。
+    追加・削除は挿入位置以降の接頭辞最大値を更新するため、区間の数に比例する時間がかかります。
+    """
+
+    def __init__(self, intervals: Iterable[Interval] = ()):
+        """
+        Args:
+            intervals: 最初に登録する区間。
+        """
+        self._intervals: List[Interval] = sorted(intervals, key=lambda i: (i.start, i.key))
+        self._starts: List[Tuple[datetime.datetime, str]] = [(i.start, i.key) for i in self._intervals]
+        self._max_ends: List[datetime.datetime] = []
+        self._rebuild_max_ends(0)
+
+    @classmethod
+    def from_events(cls, events: Iterable[Dict[str, Any]]) -> "IntervalIndex":
+        """
+        Google Calendar APIのイベントリソースからインデックスを作成します。
+        開始・終了日時を持たないイベントは無視します。
+        """
+        return cls(Interval.from_event(e) for e in events if "start" in e and "end" in e)
+
+    def add(self, interval: Interval) -> None:
+        """
+        区間を追加します。
+        """
+        position = bisect.bisect_left(self._starts, (interval.start, interval.key))
+        self._intervals.insert(position, interval)
+        self._starts.insert(position, (interval.start, interval.key))
+        self._max_ends.insert(position, interval.end)
+        self._rebuild_max_ends(position)
+
+    def remove(self, key: str) -> bool:
+        """
+        キーが一致する区間を削除します。
+
+        Returns:
+            削除した場合はTrue、見つからなかった場合はFalse。
+        """
+        for position, interval in enumerate(self._intervals):
+            if interval.key == key:
+                del self._intervals[position]
+                del self._starts[position]
+                del self._max_ends[position]
+                self._rebuild_max_ends(position)
+                return True
+        return False
+
+    def overlapping(self, start: datetime.datetime, end: datetime.datetime) -> List[Interval]:
+        """
+        期間と重なる区間を開始時刻順に返します。
+
+        Args:
+            start: 期間の開始日時。
+            end: 期間の終了日時。
+        """
+        start, end = localize(start), localize(end)
+        # 接頭辞最大値が期間の開始以下の位置までの区間は、すべて期間より前に終わっている
+        left = bisect.bisect_right(self._max_ends, start)
+        right = bisect.bisect_left(self._starts, (end, ""))
+        return [i for i in self._intervals[left:right] if i.end > start]
+
+    def free_slots(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        min_duration: datetime.timedelta = datetime.timedelta(0),
+    ) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        """
+        期間内で予定の入っていない時間帯を返します。
+
+        Args:
+            start: 期間の開始日時。
+            end: 期間の終了日時。
+            min_duration: 空き時間として扱う最小の長さ。
+
+        Returns:
+            (開始, 終了) の組のリスト。
+        """
+        return free_gaps(self.overlapping(start, end), start, end, min_duration)
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __iter__(self) -> Iterator[Interval]:
+        return iter(self._intervals)
+
+    def _rebuild_max_ends(self, position: int) -> None:
+        """
+        position以降の接頭辞最大値を計算し直します。
+        """
+        del self._max_ends[position:]
+        current = self._max_ends[-1] if self._max_ends else None
+        for interval in self._intervals[position:]:
+            current = interval.end if current is None else max(current, interval.end)
+            self._max_ends.append(current)
@@ -1,8 +1,18 @@
+import csv
+import datetime
+import json
+import os
 import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
 from dotenv import load_dotenv
 
-from .google_calendar import GoogleCalendarManager
-from .natural_language_parser import GeminiParser
+from .resilience import UpstreamUnavailableError
+from .schemas import ActionType, CalendarEvent
+
+# GeminiやGoogle Calendar APIのライブラリは読み込みに時間がかかるため、
+# 必要になった関数の中で読み込む（デーモンのクライアントとして動く場合は読み込まない）
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
@@ -13,6 +23,8 @@ def test_parser():
     GeminiParserの動作をテストするための関数。
     いくつかの例文を解析し、結果を表示する。
     """
+    from .natural_language_parser import GeminiParser
+
     print("--- GeminiParserのテストを開始します ---")
     
     # テスト用の例文リスト
@@ -34,8 +46,9 @@ def test_parser():
         print(f"\n[テストケース {i}]")
         print(f"入力テキスト: '{text}'")
         
-        event = parser.parse_event_text(text)
-        
+        result = parser.parse_event_text(text)
+        event = result.event if result and result.action == ActionType.CREATE else None
+
         if event:
             print("-> 解析成功:")
             print(f"   タイトル: {event.title}")
@@ -44,25 +57,270 @@ def test_parser():
             print(f"   説明: {event.description or 'なし'}")
         else:
             print("-> 解析失敗または情報不十分")
+
+    if parser.fast_parser is not None:
+        stats = parser.fast_parser.stats()
+        print(f"\nルールベース解析: {stats['hits']}件 / Gemini呼び出し: {stats['misses']}件 (ヒット率 {stats['hit_rate']:.0%})")
     
     print("\n--- テストを終了します ---")
 
 
+def load_events(path: str | Path) -> List[CalendarEvent]:
+    """
+    ファイルからイベントの一覧を読み込む。
+
+    JSONファイルの場合はオブジェクトの配列、CSVファイルの場合はヘッダー付きの表として読み込む。
+    いずれも title, start_time, end_time, description(任意) の項目を持ち、
+    日時は「YYYY-MM-DDTHH:MM」の形式で記述する。
+
+    Args:
+        path: 読み込むファイルのパス。
+
+    Returns:
+        読み込んだイベントのリスト。
+
+    Raises:
+        ValueError: 必要な項目が不足している、または日時の形式が正しくない場合。
+    """
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+
+    events = []
+    for i, row in enumerate(rows, 1):
+        try:
+            events.append(CalendarEvent(
+                title=row["title"],
+                start_time=datetime.datetime.fromisoformat(row["start_time"]),
+                end_time=datetime.datetime.fromisoformat(row["end_time"]),
+                description=row.get("description") or None,
+            ))
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"{i}件目のイベントを読み込めませんでした: {e}")
+    return events
+
+
+def parse_text_file(path: str | Path) -> List[CalendarEvent]:
+    """
+    1行に1件の予定を自然言語で書いたテキストファイルを読み込み、まとめて解析する。
+
+    解析はGeminiParser.parse_manyで複数行をまとめて行う。予定の作成として解析できなかった行は表示して読み飛ばす。
+
+    Args:
+        path: 読み込むファイルのパス。
+
+    Returns:
+        解析できたイベントのリスト。
+
+    Raises:
+        ValueError: パーサーを初期化できない場合。
+    """
+    from .natural_language_parser import GeminiParser
+
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    try:
+        parser = GeminiParser()
+    except FileNotFoundError as e:
+        raise ValueError(str(e))
+
+    events = []
+    for line, result in zip(lines, parser.parse_many(lines)):
+        if result.action == ActionType.CREATE and result.event is not None:
+            events.append(result.event)
+        else:
+            print(f"予定として解析できなかったため読み飛ばします: {line}")
+    return events
+
+
+def bulk_load(path: str) -> None:
+    """
+    ファイルから読み込んだイベントを、バッチリクエストでまとめてGoogleカレンダーに登録する。
+
+    Args:
+        path: 読み込むファイルのパス(.json, .csv、または1行に1件の予定を書いた .txt)。
+    """
+    try:
+        if Path(path).suffix.lower() == ".txt":
+            events = parse_text_file(path)
+        else:
+            events = load_events(path)
+    except (OSError, ValueError, UpstreamUnavailableError) as e:
+        print(f"エラー: {e}")
+        return
+
+    print(f"{len(events)}件のイベントを登録します...")
+    try:
+        from .google_calendar import GoogleCalendarManager
+
+        manager = GoogleCalendarManager()
+        results = manager.create_events(events)
+    except Exception as e:
+        print(f"Googleカレンダーへのイベント登録中にエラーが発生しました: {e}")
+        return
+
+    failed = [r for r in results if not r.success]
+    print(f"登録完了: 成功 {len(results) - len(failed)}件 / 失敗 {len(failed)}件")
+    for result in failed:
+        print(f"  - {events[result.index].title}: {result.error}")
+
+
+def register_user(user_id: str, token_file: str | None = None) -> None:
+    """
+    LINEのユーザーにGoogleアカウントの認証情報を登録する。
+
+    保存先は環境変数 CREDENTIALS_DB のSQLiteファイル(既定は credentials.db)。
+    トークンファイルが指定された場合はその内容を登録し、指定されない場合は
+    credentials.json を使ってOAuthの認可を行う。
+
+    Args:
+        user_id: LINEのユーザーID。
+        token_file: 登録するトークンファイルのパス(任意)。
+    """
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    from .credential_store import CredentialStore
+    from .google_calendar import SCOPES
+
+    try:
+        if token_file:
+            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
+            creds = flow.run_console()
+    except (OSError, ValueError) as e:
+        print(f"エラー: 認証情報を取得できませんでした。 {e}")
+        return
+
+    store = CredentialStore(os.getenv("CREDENTIALS_DB", "credentials.db"))
+    store.save(user_id, creds)
+    print(f"ユーザー {user_id} の認証情報を登録しました。")
+
+
+def print_result(response: Dict[str, Any]) -> None:
+    """
+    テキストの解析・登録結果を表示する。
+
+    Args:
+        response: AgendaDaemon.handle_requestの応答。
+    """
+    if not response.get("ok") and not response.get("result"):
+        print(f"エラー: {response.get('error')}")
+        return
+
+    result = response.get("result") or {}
+    parsed = result.get("parsed")
+    event = parsed.get("event") if parsed and parsed["action"] == ActionType.CREATE.value else None
+
+    if not event:
+        print("テキストからイベント情報を抽出できませんでした。")
+        return
+
+    start_time = datetime.datetime.fromisoformat(event["start_time"])
+    end_time = datetime.datetime.fromisoformat(event["end_time"])
+    print("\n--- 解析結果 ---")
+    print(f"タイトル: {event['title']}")
+    print(f"開始時刻: {start_time.strftime('%Y-%m-%d %H:%M')}")
+    print(f"終了時刻: {end_time.strftime('%Y-%m-%d %H:%M')}")
+    print(f"説明: {event.get('description') or 'なし'}")
+    print("-----------------\n")
+
+    if result.get("created"):
+        print("イベントの登録が完了しました。")
+        if result.get("link"):
+            print(f"リンク: {result['link']}")
+    else:
+        print(f"Googleカレンダーへのイベント登録中にエラーが発生しました: {response.get('error')}")
+
+
+def request_daemon(payload: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    起動中のデーモンにリクエストを送る。デーモンが起動していない場合はNoneを返す。
+    """
+    from . import daemon
+
+    if not daemon.default_socket_path().exists():
+        return None
+    try:
+        return daemon.request(payload)
+    except OSError as e:
+        print(f"デーモンに接続できなかったため、このプロセスで処理します。 ({e})")
+        return None
+
+
+def run_daemon() -> None:
+    """
+    パーサーとカレンダーのクライアントを初期化した状態で、デーモンとして待ち受ける。
+    """
+    from .daemon import AgendaDaemon
+
+    try:
+        agenda_daemon = AgendaDaemon()
+    except (ValueError, FileNotFoundError) as e:
+        print(f"エラー: {e}")
+        return
+    try:
+        agenda_daemon.serve_forever()
+    except RuntimeError as e:
+        print(f"エラー: {e}")
+    except KeyboardInterrupt:
+        pass
+
+
 def main():
     """
     コマンドラインから受け取った自然言語のテキストを解析し、
     Googleカレンダーにイベントを登録するメイン関数。
     --test-parser フラグが指定された場合は、パーサーのテストを実行する。
+    --bulk-load <ファイル> が指定された場合は、ファイルのイベントをまとめて登録する。
+    --daemon フラグが指定された場合は、デーモンとして起動する。--stop-daemon で停止する。
+    --register-user <LINEユーザーID> [トークンファイル] が指定された場合は、そのユーザーの認証情報を登録する。
+
+    デーモンが起動している場合は、テキストをデーモンに送って処理させる。
+    --no-daemon フラグが指定された場合は、常にこのプロセスで処理する。
     """
     # --test-parser フラグがあるかチェック
     if "--test-parser" in sys.argv:
         test_parser()
         return
 
+    # --bulk-load フラグがあるかチェック
+    if "--bulk-load" in sys.argv:
+        index = sys.argv.index("--bulk-load")
+        if index + 1 >= len(sys.argv):
+            print("使い方: python -m agenda_genie.main --bulk-load <events.json|events.csv|events.txt>")
+            return
+        bulk_load(sys.argv[index + 1])
+        return
+
+    # --register-user フラグがあるかチェック
+    if "--register-user" in sys.argv:
+        index = sys.argv.index("--register-user")
+        if index + 1 >= len(sys.argv):
+            print("使い方: python -m agenda_genie.main --register-user <LINEユーザーID> [token.json]")
+            return
+        token_file = sys.argv[index + 2] if index + 2 < len(sys.argv) else None
+        register_user(sys.argv[index + 1], token_file)
+        return
+
+    # --daemon / --stop-daemon フラグがあるかチェック
+    if "--daemon" in sys.argv:
+        run_daemon()
+        return
+    if "--stop-daemon" in sys.argv:
+        if request_daemon({"command": "stop"}) is None:
+            print("デーモンは起動していません。")
+        return
+
     # --- 通常のイベント登録処理 ---
     
     # コマンドライン引数からテキストを取得 (フラグは除外)
-    args = [arg for arg in sys.argv[1:] if arg != "--test-parser"]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
     if args:
         event_text = " ".join(args)
     else:
@@ -70,40 +328,33 @@ def main():
         print("コマンドライン引数が指定されなかったため、テスト用のテキストを使用します。")
         print(f"テキスト: '{event_text}'")
 
-    # 1. 自然言語解析器を初期化
-    try:
-        print("Geminiパーサーを初期化しています...")
-        parser = GeminiParser()
-        print("初期化完了。")
-    except (ValueError, FileNotFoundError) as e:
-        print(f"エラー: {e}")
-        print("環境変数 'GEMINI_API_KEY' やプロンプトファイルのパスを確認してください。")
-        return
+    payload = {"command": "create", "text": event_text}
+
+    # 1. デーモンが起動していれば、解析と登録をデーモンに任せる
+    response = None if "--no-daemon" in sys.argv else request_daemon(payload)
 
-    # 2. テキストを解析してCalendarEventオブジェクトを取得
-    print(f"'{event_text}' の解析を開始します...")
-    calendar_event = parser.parse_event_text(event_text)
+    # 2. デーモンがなければ、このプロセスでパーサーを初期化して処理する
+    if response is None:
+        from .daemon import AgendaDaemon
 
-    # 3. 解析結果の確認とイベント登録
-    if calendar_event:
-        print("\n--- 解析結果 ---")
-        print(f"タイトル: {calendar_event.title}")
-        print(f"開始時刻: {calendar_event.start_time.strftime('%Y-%m-%d %H:%M')}")
-        print(f"終了時刻: {calendar_event.end_time.strftime('%Y-%m-%d %H:%M')}")
-        print(f"説明: {calendar_event.description or 'なし'}")
-        print("-----------------\n")
+        try:
+            print("Geminiパーサーを初期化しています...")
+            agenda_daemon = AgendaDaemon()
+            print("初期化完了。")
+        except (ValueError, FileNotFoundError) as e:
+            print(f"エラー: {e}")
+            print("環境変数 'GEMINI_API_KEY' やプロンプトファイルのパスを確認してください。")
+            return
 
-        # 4. Googleカレンダーにイベントを登録
+        print(f"'{event_text}' の解析を開始します...")
         try:
-            print("Googleカレンダーへの接続を開始します...")
-            manager = GoogleCalendarManager()
-            print("接続完了。イベントを登録しています...")
-            manager.create_event(calendar_event)
-            print("イベントの登録が完了しました。")
+            response = agenda_daemon.handle_request(payload)
         except Exception as e:
             print(f"Googleカレンダーへのイベント登録中にエラーが発生しました: {e}")
-    else:
-        print("テキストからイベント情報を抽出できませんでした。")
+            return
+
+    # 3. 解析結果と登録結果を表示
+    print_result(response)
 
 
 if __name__ == "__main__":
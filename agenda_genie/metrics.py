@@ -0,0 +1,265 @@
+"""
+処理の段階ごとの所要時間とカウンターを記録し、Prometheus形式で出力するモジュール。
+
+spanで囲んだ処理の所要時間をヒストグラムに記録し、incでカウンターを増やします。
+traceで囲んだ範囲では、その中で記録したspanをまとめて1行の構造化ログとして出力できます。
+常時有効にしておけるよう、記録はロックで保護した辞書の更新だけで行います。
+"""
+import bisect
+import contextvars
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# ヒストグラムのバケット（秒）。LLMやAPIの呼び出しを含むため、数秒までを細かく分ける
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_HISTOGRAM = "agenda_genie_stage_duration_seconds"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str] | None) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    カウンターとヒストグラムを保持し、Prometheusのテキスト形式で出力するクラス。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Tuple[str, Callable[[], Dict[str, float]]]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        """
+        メトリクスの説明(HELP)を登録します。
+        """
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Dict[str, str] | None = None, value: float = 1.0) -> None:
+        """
+        カウンターを増やします。
+
+        Args:
+            name: メトリクス名。
+            labels: ラベル（任意）。
+            value: 増やす量。
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] | None = None) -> None:
+        """
+        ヒストグラムに値を記録します。
+
+        Args:
+            name: メトリクス名。
+            value: 記録する値（秒）。
+            labels: ラベル（任意）。
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def register_collector(self, prefix: str, collect: Callable[[], Dict[str, float]]) -> None:
+        """
+        出力時に呼び出して値を取得する関数を登録します。
+
+        CalendarClientPool.statsのように、各コンポーネントが持つカウンターを出力するために使います。
+
+        Args:
+            prefix: メトリクス名の接頭辞。
+            collect: {名前: 値} の辞書を返す関数。
+        """
+        with self._lock:
+            self._collectors = [(p, c) for p, c in self._collectors if p != prefix]
+            self._collectors.append((prefix, collect))
+
+    def counter_value(self, name: str, labels: Dict[str, str] | None = None) -> float:
+        """
+        カウンターの現在値を返します。
+        """
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def render(self) -> str:
+        """
+        すべてのメトリクスをPrometheusのテキスト形式で出力します。
+        """
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+            collectors = list(self._collectors)
+
+        for name in sorted(counters):
+            self._header(lines, name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+        for name in sorted(histograms):
+            self._header(lines, name, "histogram")
+            for key, (counts, total, count) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        for prefix, collect in collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"メトリクスの収集中にエラーが発生しました({prefix}): {e}")
+                continue
+            for key, value in sorted(values.items()):
+                name = f"{prefix}_{key}"
+                self._header(lines, name, "gauge")
+                lines.append(f"{name} {float(value):g}")
+
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+# アプリケーション全体で共有するレジストリ
+REGISTRY = MetricsRegistry()
+REGISTRY.describe(STAGE_HISTOGRAM, "Duration of each processing stage.")
+
+# 実行中のトレース（traceで開始したリクエスト単位のspanの記録）
+_current_trace: contextvars.ContextVar[Dict[str, Any] | None] = contextvars.ContextVar(
+    "agenda_genie_trace", default=None
+)
+_trace_sink: Callable[[str], None] | None = None
+
+
+def inc(name: str, labels: Dict[str, str] | None = None, value: float = 1.0) -> None:
+    """
+    共有レジストリのカウンターを増やします。
+    """
+    REGISTRY.inc(name, labels, value)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    ブロックの所要時間を段階名のラベル付きで記録します。
+
+    Args:
+        stage: 段階の名前（例: "parse.gemini", "calendar.create_event"）。
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.observe(STAGE_HISTOGRAM, elapsed, {"stage": stage})
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["spans"].append({
+                "stage": stage,
+                "start_ms": round((started - trace["_started"]) * 1000, 3),
+                "duration_ms": round(elapsed * 1000, 3),
+            })
+
+
+def timed(stage: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    関数の所要時間をspanとして記録するデコレーター。
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_trace_sink(sink: Callable[[str], None] | None) -> None:
+    """
+    リクエストごとのトレースを出力する関数を設定します。Noneの場合は出力しません。
+
+    Args:
+        sink: JSON文字列を受け取る関数（例: app.logger.info）。
+    """
+    global _trace_sink
+    _trace_sink = sink
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    ブロック内で記録したspanを1つのトレースにまとめ、終了時に構造化ログとして出力します。
+
+    トレースの出力先が設定されていない場合は、spanの記録だけを行います。
+
+    Args:
+        name: トレースの名前（例: "handle_message"）。
+        **attributes: ログに含める追加の属性。
+
+    Yields:
+        トレースの内容を持つ辞書。属性を追加で書き込めます。
+    """
+    if _trace_sink is None:
+        yield {}
+        return
+
+    record: Dict[str, Any] = {"trace": name, **attributes, "spans": [], "_started": time.perf_counter()}
+    token = _current_trace.set(record)
+    try:
+        yield record
+    finally:
+        _current_trace.reset(token)
+        started = record.pop("_started")
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        sink = _trace_sink
+        if sink is not None:
+            sink(json.dumps(record, ensure_ascii=False, default=str))
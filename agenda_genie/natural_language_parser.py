@@ -7,11 +7,68 @@ CalendarEventデータに変換します。
 import datetime
 import json
 import os
+import threading
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence, Tuple
 
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
-from .schemas import CalendarEvent, ParsedResult, ActionType
+from . import metrics
+from .parse_cache import ParseCache, cache_key
+from .resilience import Upstream, UpstreamUnavailableError, get_upstream
+from .rule_based_parser import RuleBasedParser
+from .schemas import REQUIRED_EVENT_FIELDS, CalendarEvent, ParsedResult, ActionType, response_schema
+
+
+# 再試行すべき（一時的な）Gemini APIのエラー
+# （TooManyRequestsはResourceExhaustedを、GatewayTimeoutはDeadlineExceededを含む）
+_RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+# 1件の解析結果(JSON)の出力に見込むトークン数
+_OUTPUT_TOKENS_PER_ITEM = 120
+
+# eventに必要な項目が欠けた応答を、同じ入力で解析し直す回数
+_MAX_REASKS = 1
+
+
+class IncompleteResponseError(ValueError):
+    """
+    Geminiの応答が、actionに必要なeventの項目を含んでいない場合に送出される例外。
+    """
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    再試行すべきエラーかどうかを判定します。
+    """
+    return isinstance(error, _RETRYABLE_ERRORS)
+
+
+def _extract_json(text: str) -> str:
+    """
+    応答テキストから、コードブロックの囲み(```json ... ```)を取り除いたJSON文字列を返します。
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.removeprefix("```").removeprefix("json").removesuffix("```")
+    return text.strip()
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を大まかに見積もります（日本語は1文字あたり1トークン程度として多めに数えます）。
+    """
+    return len(text)
 
 
 class GeminiParser:
@@ -19,87 +76,443 @@ class GeminiParser:
     Geminiモデルを使用して自然言語を解析し、CalendarEventを生成するクラス。
     """
 
-    def __init__(self, prompt_template_path: str | Path | None = None):
+    def __init__(
+        self,
+        prompt_template_path: str | Path | None = None,
+        structured_output: bool | None = None,
+        use_fast_path: bool = True,
+        cache: ParseCache | None = None,
+        use_cache: bool = True,
+        upstream: Upstream | None = None,
+        max_batch_size: int = 25,
+        max_batch_input_tokens: int = 30000,
+        max_batch_output_tokens: int = 8192,
+    ):
         """
         APIキーを環境変数から読み込み、Geminiモデルとプロンプトを初期化します。
 
+        構造化出力を使う場合は、変わらない指示をシステム指示としてモデルに設定し、応答スキーマで
+        JSONの形式を指定します。各リクエストでは現在日時とユーザー入力だけを送ります。
+
         Args:
-            prompt_template_path: プロンプトテンプレートファイルのパス。
-                指定されない場合、デフォルトのパス "prompts/parse_event.md" を使用します。
+            prompt_template_path: 指示と入力を1つにまとめたプロンプトテンプレートファイルのパス。
+                指定された場合は構造化出力を使わず、このテンプレートでプロンプトを作ります。
+            structured_output: システム指示と応答スキーマによる構造化出力を使うかどうか。
+                指定されない場合は、prompt_template_pathが指定されていなければ使います。
+            use_fast_path: 定型的な入力をルールベースで解析し、Geminiの呼び出しを省略するかどうか。
+            cache: 解析結果のキャッシュ。指定されない場合はメモリ上のキャッシュを使用します。
+            use_cache: 解析結果をキャッシュするかどうか。
+            upstream: Gemini呼び出しのレート制限・再試行・サーキットブレーカー（任意）。
+                指定しない場合はプロセス全体で共有する"gemini"のUpstreamを使います。
+            max_batch_size: parse_manyで1回のリクエストにまとめる入力の最大件数。
+            max_batch_input_tokens: parse_manyで1回のリクエストに含める入力の最大トークン数（見積もり）。
+            max_batch_output_tokens: parse_manyで1回のリクエストの応答に見込む最大トークン数。
         """
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("APIキーが環境変数 'GEMINI_API_KEY' に設定されていません。")
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-
-        # プロンプトテンプレートをファイルから読み込む
-        if prompt_template_path is None:
-            # このファイルからの相対パスでデフォルトのプロンプトパスを指定
-            base_dir = Path(__file__).parent
-            prompt_template_path = base_dir / "prompts" / "parse_event.md"
-            
-        try:
-            with open(prompt_template_path, 'r', encoding='utf-8') as f:
-                self.prompt_template = f.read()
-        except FileNotFoundError:
-            raise FileNotFoundError(f"プロンプトファイルが見つかりません: {prompt_template_path}")
+        self.upstream = upstream or get_upstream("gemini", is_retryable=_is_retryable)
+
+        # このファイルからの相対パスでプロンプトのディレクトリを指定
+        prompts_dir = Path(__file__).parent / "prompts"
+        if structured_output is None:
+            structured_output = prompt_template_path is None
+        self.structured_output = structured_output
+
+        if structured_output:
+            # 変わらない指示はシステム指示としてモデルに持たせ、リクエストごとには送らない
+            system_instruction = _read_prompt(prompts_dir / "system_instruction.md")
+            self.prompt_template = _read_prompt(prompt_template_path or prompts_dir / "parse_event_request.md")
+            self.model = genai.GenerativeModel(
+                'gemini-2.5-flash',
+                system_instruction=system_instruction,
+                generation_config={"response_mime_type": "application/json", "response_schema": response_schema()},
+            )
+            self._batch_generation_config = {
+                "response_mime_type": "application/json",
+                "response_schema": response_schema(batch=True),
+            }
+        else:
+            # プロンプトテンプレートをファイルから読み込む
+            self.prompt_template = _read_prompt(prompt_template_path or prompts_dir / "parse_event.md")
+            self.model = genai.GenerativeModel('gemini-2.5-flash')
+            self._batch_generation_config = None
+
+        # 複数の入力をまとめて解析するためのプロンプトテンプレート
+        self.batch_prompt_template = _read_prompt(prompts_dir / "parse_events_batch.md")
+        self.max_batch_size = max_batch_size
+        self.max_batch_input_tokens = max_batch_input_tokens
+        self.max_batch_output_tokens = max_batch_output_tokens
+        # 応答が不完全だった場合に小さくし、成功が続けば大きくする、現在のバッチの大きさ
+        self._batch_size = max_batch_size
+        self._batch_lock = threading.Lock()
 
+        # 定型的な入力を解析するルールベースのパーサー
+        self.fast_parser = RuleBasedParser() if use_fast_path else None
+        # 解析結果のキャッシュ
+        if use_cache:
+            self.cache = cache if cache is not None else ParseCache()
+        else:
+            self.cache = None
 
-    def parse_event_text(self, text: str) -> ParsedResult | None:
+
+    def parse_event_text(
+        self, text: str, before_gemini: Callable[[], Any] | None = None
+    ) -> ParsedResult | None:
         """
         与えられたテキストからユーザーの意図とイベント情報を抽出し、ParsedResultオブジェクトを生成します。
 
         Args:
             text: ユーザーによって入力された自然言語のテキスト。
+            before_gemini: Geminiを呼び出す直前に呼ぶ関数（任意）。ルールベースの解析やキャッシュで
+                解析できた場合は呼びません（Geminiの応答を待つ間だけ必要な処理を始めるために使います）。
 
         Returns:
-            抽出された情報を持つParsedResultオブジェクト。抽出に失敗した場合はNone。
+            抽出された情報を持つParsedResultオブジェクト。Geminiの呼び出しが一時的でないエラー
+            （権限・引数の誤り、安全性によるブロックなど）で失敗した場合や、解析し直しても
+            予定の作成・削除に必要な項目が応答に含まれない場合はNone。
+
+        Raises:
+            UpstreamUnavailableError: Geminiが一時的に使えない（レート制限・サーキットブレーカー・再試行の上限）場合。
         """
-        now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
+        now = datetime.datetime.now()
+        local_result, key = self._parse_locally(text, now)
+        if local_result is not None:
+            return local_result
+        if before_gemini is not None:
+            before_gemini()
 
-        # プロンプトテンプレートのプレースホルダーを実際の値で置換
-        prompt = self.prompt_template.format(now=now_str, user_text=text)
+        with metrics.span("parse.prompt_format"):
+            now_str = now.strftime('%Y-%m-%d %H:%M')
 
-        try:
-            response = self.model.generate_content(prompt)
-            # Geminiからの応答テキストをクリーンアップ
-            json_text = response.text.strip().lstrip("```json").rstrip("```").strip()
-            
-            # JSON文字列をPythonの辞書に変換
-            parsed_data = json.loads(json_text)
-            
-            action_str = parsed_data.get("action")
-            if not action_str:
-                raise ValueError("JSON応答に'action'キーが含まれていません。")
-
-            action = ActionType(action_str)
-
-            if action == ActionType.CREATE:
-                event_data = parsed_data["event"]
-                event = CalendarEvent(
-                    title=event_data["title"],
-                    start_time=datetime.datetime.fromisoformat(event_data["start_time"]),
-                    end_time=datetime.datetime.fromisoformat(event_data["end_time"]),
-                    description=event_data.get("description"),
-                )
-                return ParsedResult(action=action, event=event)
-            
-            elif action == ActionType.DELETE:
-                search_info = parsed_data["event"]
-                return ParsedResult(action=action, event=search_info)
-            
-            elif action in [ActionType.READ, ActionType.TALK]:
-                original_text = parsed_data.get("original_text", text)
-                return ParsedResult(action=action, original_text=original_text)
+            # プロンプトテンプレートのプレースホルダーを実際の値で置換
+            prompt = self.prompt_template.format(now=now_str, user_text=text)
 
-            else:
-                # 未知のactionタイプの場合は、TALKとして扱う
-                return ParsedResult(action=ActionType.TALK, original_text=text)
+        for attempt in range(_MAX_REASKS + 1):
+            try:
+                with metrics.span("parse.gemini"):
+                    try:
+                        response = self.upstream.call(self.model.generate_content, prompt)
+                    except UpstreamUnavailableError:
+                        metrics.inc("agenda_genie_api_errors_total", {"api": "gemini"})
+                        raise
+                    except Exception as e:
+                        # 再試行しても成功しないエラーは、呼び出し元に送出せず解析の失敗として扱う
+                        metrics.inc("agenda_genie_api_errors_total", {"api": "gemini"})
+                        metrics.inc("agenda_genie_parse_failures_total")
+                        print(f"Geminiの呼び出しに失敗しました: {e}")
+                        return None
 
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            print(f"イベント情報の解析中にエラーが発生しました: {e}")
-            if 'response' in locals():
+                with metrics.span("parse.json_cleanup"):
+                    # Geminiからの応答テキストをクリーンアップ（構造化出力の場合はJSONだけが返る）
+                    json_text = _extract_json(response.text)
+
+                    # JSON文字列をPythonの辞書に変換
+                    parsed_data = json.loads(json_text)
+                    result = self._build_result(parsed_data, text)
+
+            except IncompleteResponseError as e:
+                # 予定の作成・削除に必要な項目が欠けている。雑談として扱わず、解析し直すか失敗とする
+                print(f"Geminiの応答に必要な項目がありません({attempt + 1}回目): {e}")
                 print(f"Geminiからの応答: {response.text}")
+                continue
+            except (json.JSONDecodeError, KeyError, ValueError) as e:
+                print(f"イベント情報の解析中にエラーが発生しました: {e}")
+                if 'response' in locals():
+                    print(f"Geminiからの応答: {response.text}")
+                metrics.inc("agenda_genie_parse_failures_total")
+                # 解析に失敗した場合は、雑談として扱う
+                return ParsedResult(action=ActionType.TALK, original_text=text)
+            break
+        else:
+            metrics.inc("agenda_genie_parse_failures_total")
+            return None
+
+        metrics.inc("agenda_genie_parse_total", {"source": "gemini"})
+        if self.cache is not None:
+            self.cache.set(key, result)
+        return result
+
+    def parse_many(self, texts: Sequence[str], max_rounds: int = 3) -> List[ParsedResult]:
+        """
+        複数のテキストを解析します。Geminiが必要な入力は、1回のリクエストに複数件をまとめて送ります。
+
+        プロンプトの指示部分は1回のリクエストで1度だけ送るため、1件ずつ解析するよりも
+        送信するトークン数と呼び出し回数が少なくなります。応答は1件ごとに検証し、
+        解析できなかった入力だけを次の回で送り直します。応答が不完全だった場合はバッチを小さくします。
+
+        Args:
+            texts: ユーザーによって入力された自然言語のテキスト。
+            max_rounds: Geminiに送る最大回数（解析できなかった入力の再送を含む）。
+
+        Returns:
+            入力と同じ順序のParsedResultのリスト。最後まで解析できなかった入力は雑談として扱います。
+
+        Raises:
+            UpstreamUnavailableError: Geminiが一時的に使えない場合。
+        """
+        now = datetime.datetime.now()
+        results: List[ParsedResult | None] = [None] * len(texts)
+        keys: Dict[int, str | None] = {}
+        # 同じ内容の入力は1度だけ送る
+        groups: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            local_result, key = self._parse_locally(text, now)
+            if local_result is not None:
+                results[i] = local_result
+                continue
+            keys[i] = key
+            groups.setdefault(key or text, []).append(i)
+
+        pending = [(indexes[0], texts[indexes[0]]) for indexes in groups.values()]
+        for _ in range(max_rounds):
+            if not pending:
+                break
+            failed: List[Tuple[int, str]] = []
+            for batch in self._plan_batches(pending):
+                parsed = self._parse_batch(batch, now)
+                for index, text in batch:
+                    if index in parsed:
+                        results[index] = parsed[index]
+                    else:
+                        failed.append((index, text))
+            pending = failed
+
+        failed_indexes = {index for index, _ in pending}
+        for index, text in pending:
+            print(f"イベント情報を解析できませんでした: {text}")
+            metrics.inc("agenda_genie_parse_failures_total")
             # 解析に失敗した場合は、雑談として扱う
-            return ParsedResult(action=ActionType.TALK, original_text=text)
\ No newline at end of file
+            results[index] = ParsedResult(action=ActionType.TALK, original_text=text)
+
+        for indexes in groups.values():
+            first = indexes[0]
+            result = results[first]
+            if self.cache is not None and keys[first] is not None and first not in failed_indexes:
+                self.cache.set(keys[first], result)
+            for index in indexes[1:]:
+                results[index] = result
+        return results  # type: ignore[return-value]
+
+    def _parse_locally(self, text: str, now: datetime.datetime) -> Tuple[ParsedResult | None, str | None]:
+        """
+        Geminiを呼び出さずに解析できるかを試します（ルールベースの解析とキャッシュ）。
+
+        Returns:
+            (解析結果, キャッシュのキー) の組。解析できなかった場合、解析結果はNone。
+            キャッシュが無効の場合、キーはNone。
+        """
+        # ルールベースで確信を持って解析できた場合は、Geminiを呼び出さない
+        if self.fast_parser is not None:
+            with metrics.span("parse.fast_path"):
+                fast_result = self.fast_parser.parse(text, now)
+            if fast_result is not None:
+                metrics.inc("agenda_genie_parse_total", {"source": "fast_path"})
+                return fast_result, None
+
+        # 同じ内容のメッセージを最近解析していれば、その結果を再利用する
+        if self.cache is None:
+            return None, None
+        with metrics.span("parse.cache_lookup"):
+            key = cache_key(text, now)
+            cached = self.cache.get(key)
+        if cached is not None:
+            metrics.inc("agenda_genie_parse_total", {"source": "cache"})
+        return cached, key
+
+    def _plan_batches(self, items: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """
+        入力を、現在のバッチの大きさとトークン数の上限に収まるように分けます。
+        """
+        with self._batch_lock:
+            batch_size = self._batch_size
+        max_items = max(1, min(batch_size, self.max_batch_output_tokens // _OUTPUT_TOKENS_PER_ITEM))
+
+        batches: List[List[Tuple[int, str]]] = []
+        current: List[Tuple[int, str]] = []
+        tokens = 0
+        for item in items:
+            # idやJSONの記号の分を加えて見積もる
+            item_tokens = _estimate_tokens(item[1]) + 16
+            if current and (len(current) >= max_items or tokens + item_tokens > self.max_batch_input_tokens):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(item)
+            tokens += item_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _parse_batch(self, batch: List[Tuple[int, str]], now: datetime.datetime) -> Dict[int, ParsedResult]:
+        """
+        1回のリクエストで複数の入力を解析します。
+
+        Args:
+            batch: (入力の位置, テキスト) の組のリスト。
+            now: プロンプトに渡す現在日時。
+
+        Returns:
+            解析できた入力の位置と解析結果の辞書。
+        """
+        # 1件だけの場合は、通常のプロンプトで解析する
+        kwargs = {}
+        if len(batch) == 1:
+            index, text = batch[0]
+            prompt = self.prompt_template.format(now=now.strftime('%Y-%m-%d %H:%M'), user_text=text)
+        else:
+            inputs = json.dumps([{"id": i, "text": text} for i, (_, text) in enumerate(batch)], ensure_ascii=False)
+            prompt = self.batch_prompt_template.format(instructions=self._instructions(now), inputs=inputs)
+            if self._batch_generation_config is not None:
+                kwargs["generation_config"] = self._batch_generation_config
+
+        try:
+            with metrics.span("parse.gemini_batch"):
+                response = self.upstream.call(self.model.generate_content, prompt, **kwargs)
+        except UpstreamUnavailableError:
+            raise
+        except google_exceptions.InvalidArgument as e:
+            # 入力が大きすぎる場合など。バッチを小さくして送り直す
+            metrics.inc("agenda_genie_api_errors_total", {"api": "gemini"})
+            print(f"Geminiの呼び出しに失敗しました: {e}")
+            self._resize_batch(success=False)
+            return {}
+        except Exception as e:
+            # 権限の誤りや安全性によるブロックなど。バッチの大きさは変えずに、この回の項目を失敗として扱う
+            metrics.inc("agenda_genie_api_errors_total", {"api": "gemini"})
+            print(f"Geminiの呼び出しに失敗しました: {e}")
+            return {}
+
+        try:
+            data = json.loads(_extract_json(response.text))
+        except (json.JSONDecodeError, ValueError) as e:
+            # 応答が途中で切れた場合など。バッチを小さくして送り直す
+            print(f"イベント情報の解析中にエラーが発生しました: {e}")
+            self._resize_batch(success=False)
+            return {}
+        if len(batch) == 1:
+            data = [dict(data, id=0)] if isinstance(data, dict) else data
+        if not isinstance(data, list):
+            print(f"Geminiからの応答が配列ではありません: {response.text}")
+            self._resize_batch(success=False)
+            return {}
+
+        parsed: Dict[int, ParsedResult] = {}
+        for item in data:
+            try:
+                index, text = batch[int(item["id"])]
+                parsed[index] = self._build_result(item, text)
+            except (KeyError, ValueError, TypeError, IndexError) as e:
+                print(f"イベント情報の解析中にエラーが発生しました: {e}")
+        metrics.inc("agenda_genie_parse_total", {"source": "gemini_batch"}, len(parsed))
+        self._resize_batch(success=len(parsed) == len(batch))
+        return parsed
+
+    def _instructions(self, now: datetime.datetime) -> str:
+        """
+        複数の入力をまとめたプロンプトの先頭に置く、ユーザー入力より前の部分を返します。
+
+        構造化出力の場合、指示はシステム指示にあるため現在日時だけを返します。
+        そうでない場合は、単一入力のプロンプトからユーザー入力より前の指示部分を取り出します。
+        """
+        if self.structured_output:
+            return f"# 現在の日時\n{now.strftime('%Y-%m-%d %H:%M')}\n"
+        prompt = self.prompt_template.format(now=now.strftime('%Y-%m-%d %H:%M'), user_text="")
+        return prompt.split("# ユーザー入力", 1)[0]
+
+    def _resize_batch(self, success: bool) -> None:
+        """
+        応答が不完全だった場合はバッチの大きさを半分にし、すべて解析できた場合は1件ずつ大きくします。
+        """
+        with self._batch_lock:
+            if success:
+                self._batch_size = min(self.max_batch_size, self._batch_size + 1)
+            else:
+                self._batch_size = max(1, self._batch_size // 2)
+
+    def _build_result(self, parsed_data: dict, text: str) -> ParsedResult:
+        """
+        Geminiの応答(JSON)を検証し、ParsedResultオブジェクトに変換します。
+
+        Args:
+            parsed_data: Geminiの応答をデコードした辞書。
+            text: ユーザーによって入力された元のテキスト。
+
+        Returns:
+            変換されたParsedResultオブジェクト。
+
+        Raises:
+            IncompleteResponseError: 予定の作成・削除に必要なeventの項目が含まれていない場合。
+            KeyError, ValueError: その他、応答に必要な情報が含まれていない場合。
+        """
+        action_str = parsed_data.get("action")
+        if not action_str:
+            raise ValueError("JSON応答に'action'キーが含まれていません。")
+
+        action = ActionType(action_str)
+        _check_event_fields(action, parsed_data.get("event"))
+
+        if action == ActionType.CREATE:
+            event_data = parsed_data["event"]
+            start_time = datetime.datetime.fromisoformat(event_data["start_time"])
+            # 終了時刻が省略された場合は、プロンプトの指示どおり開始から1時間後とする
+            end_time_str = event_data.get("end_time")
+            if end_time_str:
+                end_time = datetime.datetime.fromisoformat(end_time_str)
+            else:
+                end_time = start_time + datetime.timedelta(hours=1)
+            event = CalendarEvent(
+                title=event_data["title"],
+                start_time=start_time,
+                end_time=end_time,
+                description=event_data.get("description"),
+            )
+            return ParsedResult(action=action, event=event)
+        
+        elif action == ActionType.DELETE:
+            search_info = parsed_data["event"]
+            return ParsedResult(action=action, event=search_info)
+        
+        elif action in [ActionType.READ, ActionType.TALK]:
+            original_text = parsed_data.get("original_text", text)
+            return ParsedResult(action=action, original_text=original_text)
+
+        else:
+            # 未知のactionタイプの場合は、TALKとして扱う
+            return ParsedResult(action=ActionType.TALK, original_text=text)
+
+
+def _check_event_fields(action: ActionType, event: Any) -> None:
+    """
+    actionに必要なeventの項目がそろっているかを確認します。
+
+    応答スキーマではactionごとの必須項目を表せないため、応答を受け取った後に確認します。
+    予定の作成では、タイトルと開始日時が空でないことも確認します。
+
+    Raises:
+        IncompleteResponseError: 必要な項目が欠けている場合。
+    """
+    required = REQUIRED_EVENT_FIELDS.get(action)
+    if required is None:
+        return
+    if not isinstance(event, dict):
+        raise IncompleteResponseError(f"action '{action.value}' の応答にeventがありません。")
+    missing = [name for name in required if event.get(name) is None]
+    if action == ActionType.CREATE:
+        missing += [name for name in ("title", "start_time") if name not in missing and not event[name]]
+    if missing:
+        raise IncompleteResponseError(f"action '{action.value}' の応答のeventに {', '.join(missing)} がありません。")
+
+
+def _read_prompt(path: str | Path) -> str:
+    """
+    プロンプトのファイルを読み込みます。
+
+    Raises:
+        FileNotFoundError: ファイルが見つからない場合。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"プロンプトファイルが見つかりません: {path}")
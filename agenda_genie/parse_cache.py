@@ -0,0 +1,209 @@
+"""
+Geminiによる解析結果をキャッシュするモジュール。
+
+同じ（または表記ゆれだけが異なる）メッセージや、LINEの再送による重複メッセージで
+Geminiを再度呼び出さないよう、正規化したテキストと基準時刻をキーに解析結果を保存します。
+"""
+import datetime
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Tuple
+
+from .schemas import ParsedResult
+
+# 表記ゆれとして無視する句読点や括弧
+_PUNCTUATION_RE = re.compile(r"[、。，．,.!！?？「」『』()（）\[\]【】・…♪\"'`]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+# 分単位の現在時刻に依存する表現（「30分後」「今から」など）
+_MINUTE_SENSITIVE_RE = re.compile(r"\d+\s*(分|時間)後|今から|今すぐ|さっき|このあと|この後")
+
+
+def normalize_text(text: str) -> str:
+    """
+    全角・半角の違い、空白、句読点の違いを吸収した文字列を返します。
+
+    Args:
+        text: ユーザーによって入力されたテキスト。
+
+    Returns:
+        正規化されたテキスト。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _PUNCTUATION_RE.sub("", text)
+    return _WHITESPACE_RE.sub("", text)
+
+
+def cache_key(text: str, now: datetime.datetime) -> str:
+    """
+    正規化したテキストと基準時刻のバケットからキャッシュのキーを作ります。
+
+    「明日」「来週の月曜」のような表現は日付だけに依存するため日単位、
+    「30分後」のような表現は分単位のバケットを使い、相対的な日時がずれないようにします。
+
+    Args:
+        text: ユーザーによって入力されたテキスト。
+        now: プロンプトに渡す現在日時。
+
+    Returns:
+        キャッシュのキー。
+    """
+    normalized = normalize_text(text)
+    if _MINUTE_SENSITIVE_RE.search(normalized):
+        bucket = now.strftime('%Y-%m-%d %H:%M')
+    else:
+        bucket = now.strftime('%Y-%m-%d')
+    return f"{bucket}|{normalized}"
+
+
+class ParseCache:
+    """
+    TTLとLRUによる追い出しを行う、メモリ上の解析結果キャッシュ。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        """
+        Args:
+            max_entries: 保持するエントリの最大数。超えた場合は最も古く使われたものから削除します。
+            ttl: エントリの有効期間（秒）。
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, ParsedResult]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: str) -> ParsedResult | None:
+        """
+        キャッシュされた解析結果を取得します。
+
+        Args:
+            key: cache_keyで作成したキー。
+
+        Returns:
+            有効期限内の解析結果。見つからない場合はNone。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key: str, result: ParsedResult) -> None:
+        """
+        解析結果を保存します。
+
+        Args:
+            key: cache_keyで作成したキー。
+            result: 保存する解析結果。
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """
+        すべてのエントリを削除します。
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キャッシュのヒット・ミス・追い出しの件数を返します。
+
+        Returns:
+            各カウンターの値を持つ辞書。
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+            }
+
+
+class SQLiteParseCache(ParseCache):
+    """
+    SQLiteに保存し、プロセスの再起動後も有効な解析結果キャッシュ。
+    """
+
+    def __init__(self, path: str | Path, max_entries: int = 10000, ttl: float = 3600.0):
+        """
+        Args:
+            path: SQLiteデータベースファイルのパス。
+            max_entries: 保持するエントリの最大数。
+            ttl: エントリの有効期間（秒）。
+        """
+        super().__init__(max_entries=max_entries, ttl=ttl)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS parse_cache_last_access ON parse_cache (last_access)"
+            )
+
+    def get(self, key: str) -> ParsedResult | None:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM parse_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._conn.execute("UPDATE parse_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._hits += 1
+        return ParsedResult.from_dict(json.loads(row[0]))
+
+    def set(self, key: str, result: ParsedResult) -> None:
+        now = time.time()
+        value = json.dumps(result.to_dict(), ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parse_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._conn.execute("DELETE FROM parse_cache WHERE expires_at <= ?", (now,))
+            evicted = self._conn.execute(
+                "DELETE FROM parse_cache WHERE key IN ("
+                " SELECT key FROM parse_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._evictions += max(evicted, 0)
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM parse_cache")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": entries,
+            }
@@ -0,0 +1,203 @@
+"""
+Geminiでメッセージを解析している間に、対象になりそうな期間のカレンダーを先読みするモジュール。
+
+解析が終わってからカレンダーを読み込むと、Google Calendarの応答時間がGeminiの応答時間に加算されます。
+「明日」「来週の月曜」のように期間がテキストから明らかな場合は、解析と並行してクライアントを用意し
+(認証情報の更新やサービスの構築も済ませる)、その期間のイベントを読み込んでおきます。
+解析の結果の期間が先読みした期間に含まれていれば、予定の削除・重なりの判定・予定の確認でその結果を使い、
+含まれていなければ結果を捨てて通常どおりAPIで検索します。
+"""
+import datetime
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import AbstractContextManager
+from typing import Any, Callable, Dict, List
+
+from . import metrics
+from .agenda import find_period
+from .interval_index import IntervalIndex
+from .time_utils import localize
+
+# 先読みするイベントのフィールド（予定の確認・重なりの判定・削除の検索で使うもの）
+_FIELDS = ("id", "summary", "description", "start", "end", "transparency")
+
+
+class Prefetch:
+    """
+    1件のメッセージについての先読み。CalendarPrefetcher.startで作成します。
+    """
+
+    def __init__(
+        self,
+        prefetcher: "CalendarPrefetcher",
+        start: datetime.datetime,
+        end: datetime.datetime,
+        future: "Future[IntervalIndex]",
+    ):
+        self.prefetcher = prefetcher
+        self.start = start
+        self.end = end
+        self._future = future
+
+    def covers(self, start: datetime.datetime, end: datetime.datetime) -> bool:
+        """
+        期間が先読みした期間に含まれるかどうかを返します。
+        """
+        return self.start <= localize(start) and localize(end) <= self.end
+
+    def index(self, start: datetime.datetime, end: datetime.datetime) -> IntervalIndex | None:
+        """
+        期間と重なるイベントのIntervalIndexを、先読みの結果から作成します。
+
+        読み込み中の場合は、最大でwait_timeout秒待ちます。スレッドが空かずにまだ始まっていない場合は、
+        待つよりAPIで直接検索する方が速いため、取り消してNoneを返します。
+
+        Args:
+            start: 期間の開始日時。
+            end: 期間の終了日時。
+
+        Returns:
+            IntervalIndex。期間が先読みした期間に含まれない場合、読み込みがまだ始まっていない場合、
+            読み込みに失敗した場合はNone。
+        """
+        if not self.covers(start, end):
+            self.prefetcher._count("misses")
+            return None
+        index = self._result()
+        if index is None:
+            return None
+        self.prefetcher._count("hits")
+        return IntervalIndex(index.overlapping(start, end))
+
+    def events(
+        self, start: datetime.datetime, end: datetime.datetime, query: str | None = None
+    ) -> List[Dict[str, Any]] | None:
+        """
+        期間と重なり、queryのすべての語を件名か説明に含むイベントを開始時刻順に返します。
+
+        APIの検索(q)は場所や参加者にも一致するため、ここで1件も見つからない場合はNoneを返し、
+        呼び出し側にAPIで検索し直させます。
+
+        Args:
+            start: 期間の開始日時。
+            end: 期間の終了日時。
+            query: 検索キーワード（任意）。
+
+        Returns:
+            見つかったイベントのリスト。先読みの結果を使えない場合や、一致するものがない場合はNone。
+        """
+        index = self.index(start, end)
+        if index is None:
+            return None
+        terms = (query or "").casefold().split()
+        events = [
+            interval.data for interval in index
+            if all(term in _searchable_text(interval.data) for term in terms)
+        ]
+        return events or None
+
+    def discard(self) -> None:
+        """
+        先読みの結果を使わないことが分かった場合に、まだ始まっていない読み込みを取り消します。
+        """
+        self._future.cancel()
+
+    def _result(self) -> IntervalIndex | None:
+        if not self._future.running() and self._future.cancel():
+            self.prefetcher._count("cancelled")
+            return None
+        try:
+            return self._future.result(timeout=self.prefetcher.wait_timeout)
+        except TimeoutError:
+            self.prefetcher._count("timeouts")
+        except Exception as e:
+            print(f"カレンダーの先読みに失敗しました: {e}")
+            self.prefetcher._count("failures")
+        return None
+
+
+def _searchable_text(event: Dict[str, Any]) -> str:
+    return f"{event.get('summary') or ''}\n{event.get('description') or ''}".casefold()
+
+
+class CalendarPrefetcher:
+    """
+    メッセージのテキストから期間を推測し、その期間のイベントをスレッドプールで先読みするクラス。
+    """
+
+    def __init__(self, max_workers: int = 4, max_days: int = 31, wait_timeout: float = 10.0):
+        """
+        Args:
+            max_workers: 先読みを行うスレッドの数。
+            max_days: 先読みする期間の最大日数。これより長い期間は先読みしません。
+            wait_timeout: 先読みの結果を使うときに、読み込みの完了を待つ最大秒数。
+        """
+        self.max_days = max_days
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="calendar-prefetch")
+        self._lock = threading.Lock()
+        self._counts = {
+            "started": 0, "skipped": 0, "hits": 0, "misses": 0, "cancelled": 0, "timeouts": 0, "failures": 0,
+        }
+
+    def start(
+        self,
+        text: str,
+        acquire: Callable[[], AbstractContextManager[Any]],
+        now: datetime.datetime | None = None,
+    ) -> Prefetch | None:
+        """
+        テキストから期間を推測できれば、その期間のイベントの読み込みを開始します。
+
+        Args:
+            text: ユーザーのメッセージ。
+            acquire: GoogleCalendarManagerを借り出すコンテキストマネージャーを返す関数。
+            now: 基準となる現在日時（任意）。
+
+        Returns:
+            開始した先読み。期間を推測できない場合や、期間が長すぎる場合はNone。
+        """
+        window = find_period(text, now)
+        if window is None or window[1] - window[0] > datetime.timedelta(days=self.max_days):
+            self._count("skipped")
+            return None
+        start, end = window
+        try:
+            future = self._executor.submit(self._fetch, acquire, start, end)
+        except RuntimeError:
+            # 停止処理中
+            return None
+        self._count("started")
+        return Prefetch(self, start, end, future)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        開始・使用(hits)・期間の不一致(misses)・始まる前に取り消した回数・待ちきれなかった回数・失敗の件数を返します。
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        先読みのスレッドプールを停止します。始まっていない読み込みは取り消します。
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _fetch(
+        self,
+        acquire: Callable[[], AbstractContextManager[Any]],
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> IntervalIndex:
+        """
+        期間のイベントを読み込み、重なりの判定に使う日ごとのキャッシュにも登録します。
+        """
+        with metrics.span("calendar.prefetch"), acquire() as manager:
+            index = IntervalIndex.from_events(manager.iter_events(start, end, fields=_FIELDS))
+            if manager.conflict_checker is not None:
+                manager.conflict_checker.prime(index, start, end)
+        return index
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
@@ -0,0 +1,325 @@
+"""
+外部API(GeminiとGoogle Calendar)の呼び出しを保護するためのモジュール。
+
+上流ごとに次の3つを組み合わせたUpstreamを共有し、すべての呼び出しをそこを通して行います。
+
+- トークンバケットによる送信レートの制限（クォータを超えて429を受け取る前に自分で抑える）
+- 一時的なエラーの、ジッター付き指数バックオフによる再試行
+- 失敗が続いた上流への呼び出しをしばらく止めるサーキットブレーカー
+
+上流が使えない状態では UpstreamUnavailableError を送出するので、呼び出し元はすぐに
+「混み合っています」といった応答を返せます。
+"""
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from . import metrics
+
+
+class UpstreamUnavailableError(Exception):
+    """
+    上流のAPIが一時的に使えない（レート制限・サーキットブレーカー・再試行の上限）場合に送出される例外。
+    """
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream} is unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    attempt回目の再試行までの待ち時間を返します（フルジッター付きの指数バックオフ）。
+
+    多数のクライアントが同時に失敗した場合でも再試行のタイミングが揃わないよう、
+    0から上限までの一様乱数を使います。
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレート制限。
+
+    rate個/秒でトークンが補充され、最大capacity個まで貯まります。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: 1秒あたりに補充するトークン数。0以下の場合は制限しません。
+            capacity: 貯められるトークンの最大数（バーストの大きさ）。
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0, timeout: float | None = None) -> bool:
+        """
+        トークンを取得します。足りない場合は補充されるまで待ちます。
+
+        待つ必要がある場合は先にトークンを予約してから待つため、待っている呼び出しは到着順に処理されます。
+
+        Args:
+            tokens: 取得するトークン数。
+            timeout: 待つ最大秒数。Noneの場合は必要なだけ待ちます。
+
+        Returns:
+            取得できた場合はTrue、timeout秒以内に取得できない場合はFalse（この場合は待ちません）。
+        """
+        if self.rate <= 0:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return False
+            self._tokens -= tokens
+
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """
+    失敗が続いた上流への呼び出しを一定時間止めるサーキットブレーカー。
+
+    連続してfailure_threshold回失敗すると開いた状態(open)になり、reset_timeout秒の間は呼び出しを拒否します。
+    その後は1回だけ試しに呼び出し(half-open)、成功すれば閉じた状態(closed)に戻ります。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: 開いた状態になるまでの連続失敗回数。
+            reset_timeout: 開いた状態を続ける秒数。
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        呼び出してよいかどうかを返します。
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """
+        成功とも失敗とも数えない呼び出し（リクエストの内容による失敗など）の終了を記録します。
+
+        状態と連続失敗回数は変えず、half-openの試しの呼び出しだけを終わらせます。
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class Upstream:
+    """
+    1つの上流APIへの呼び出しに、レート制限・再試行・サーキットブレーカーを適用するクラス。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 0.0,
+        burst: float = 1.0,
+        max_retries: int = 3,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        acquire_timeout: float = 5.0,
+        is_retryable: Callable[[Exception], bool] = lambda error: False,
+    ):
+        """
+        Args:
+            name: 上流の名前（メトリクスのラベルに使います）。
+            rate: 1秒あたりの最大呼び出し回数。0の場合は制限しません。
+            burst: 一度に連続して呼び出せる回数。
+            max_retries: 一時的なエラーを再試行する最大回数。
+            failure_threshold: サーキットブレーカーが開くまでの連続失敗回数。
+            reset_timeout: サーキットブレーカーが開いている秒数。
+            acquire_timeout: レート制限で待つ最大秒数。これを超える場合は待たずに失敗します。
+            is_retryable: 例外が一時的なもの（再試行すべきもの）かどうかを判定する関数。
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.acquire_timeout = acquire_timeout
+        self.is_retryable = is_retryable
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0.0, "failures": 0.0, "retries": 0.0, "throttled": 0.0, "rejected": 0.0}
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        関数を呼び出します。一時的なエラーはバックオフしながら再試行します。
+
+        Returns:
+            関数の戻り値。
+
+        Raises:
+            UpstreamUnavailableError: サーキットブレーカーが開いている、レート制限で待ちきれない、
+                または一時的なエラーが再試行の上限まで続いた場合。
+            Exception: 再試行しても解決しない（一時的でない）エラーは、そのまま送出します。
+        """
+        for attempt in range(self.max_retries + 1):
+            self.before_request()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                if not self.is_retryable(error):
+                    # リクエストの内容による失敗は上流の不調ではないため、成功とも失敗とも数えない
+                    self.breaker.release()
+                    raise
+                self.record_failure()
+                if attempt == self.max_retries:
+                    raise UpstreamUnavailableError(self.name, f"retries exhausted: {error}") from error
+                self._count("retries")
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.record_success()
+            return result
+
+    def before_request(self, tokens: float = 1.0, block: bool = False) -> None:
+        """
+        サーキットブレーカーとレート制限を確認します。自前で再試行を行う呼び出し元(バッチ処理など)も使います。
+
+        Args:
+            tokens: 消費するトークン数（バッチに含まれるリクエスト数など）。
+            block: Trueの場合、レート制限ではacquire_timeoutを超えても必要なだけ待ちます。
+
+        Raises:
+            UpstreamUnavailableError: 呼び出せない場合。
+        """
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise UpstreamUnavailableError(self.name, "circuit open")
+        if not self.bucket.acquire(tokens, timeout=None if block else self.acquire_timeout):
+            self._count("throttled")
+            raise UpstreamUnavailableError(self.name, "rate limited")
+        self._count("calls", tokens)
+
+    def record_success(self) -> None:
+        """
+        呼び出しの成功を記録します。
+        """
+        self.breaker.record_success()
+
+    def record_failure(self) -> None:
+        """
+        一時的なエラーによる失敗を記録します。
+        """
+        self.breaker.record_failure()
+        self._count("failures")
+        metrics.inc("agenda_genie_upstream_failures_total", {"upstream": self.name})
+
+    def stats(self) -> Dict[str, float]:
+        """
+        呼び出し回数・失敗回数・再試行回数などのカウンターと、ブレーカーが開いているかどうかを返します。
+        """
+        with self._lock:
+            stats: Dict[str, float] = dict(self._counts)
+        stats["circuit_open"] = 0.0 if self.breaker.state == CircuitBreaker.CLOSED else 1.0
+        return stats
+
+    def _count(self, key: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._counts[key] += value
+
+
+# 上流ごとのレート制限の既定値。制限はプロセスごと(gunicornのワーカーごと)で、全ユーザーが共有するため、
+# 既定では制限せず、クォータに合わせて環境変数で設定する
+_DEFAULTS: Dict[str, Dict[str, float]] = {
+    "gemini": {"rate": 0.0, "burst": 10.0},
+    "calendar": {"rate": 0.0, "burst": 20.0},
+}
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def get_upstream(name: str, is_retryable: Callable[[Exception], bool] | None = None) -> Upstream:
+    """
+    プロセス全体で共有するUpstreamを返します。初回は環境変数の設定で作成します。
+
+    レート制限はこのプロセスの中だけで共有されます。複数のプロセスで動かす場合は、
+    クォータをプロセス数で割った値を設定してください。
+
+    環境変数（<NAME>は GEMINI または CALENDAR）:
+        <NAME>_RATE_LIMIT: 1秒あたりの最大呼び出し回数（既定値は0で、制限しない）
+        <NAME>_BURST: 連続して呼び出せる回数
+        <NAME>_MAX_RETRIES: 一時的なエラーを再試行する最大回数
+        <NAME>_BREAKER_THRESHOLD: サーキットブレーカーが開くまでの連続失敗回数
+        <NAME>_BREAKER_RESET: サーキットブレーカーが開いている秒数
+
+    Args:
+        name: 上流の名前（"gemini" または "calendar"）。
+        is_retryable: 初回の作成時に使う、一時的なエラーの判定関数。
+    """
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            prefix = name.upper()
+            defaults = _DEFAULTS.get(name, {"rate": 0.0, "burst": 1.0})
+            upstream = Upstream(
+                name,
+                rate=_env_float(f"{prefix}_RATE_LIMIT", defaults["rate"]),
+                burst=_env_float(f"{prefix}_BURST", defaults["burst"]),
+                max_retries=int(_env_float(f"{prefix}_MAX_RETRIES", 3)),
+                failure_threshold=int(_env_float(f"{prefix}_BREAKER_THRESHOLD", 5)),
+                reset_timeout=_env_float(f"{prefix}_BREAKER_RESET", 30.0),
+                is_retryable=is_retryable or (lambda error: False),
+            )
+            _upstreams[name] = upstream
+            metrics.REGISTRY.register_collector(f"agenda_genie_upstream_{name}", upstream.stats)
+        return upstream
@@ -0,0 +1,434 @@
+"""
+よくある日本語の日時表現をルールベースで解析するモジュール。
+
+「明日の15時から30分」「来週の月曜、朝9時から」「1週間後の13時半」のような
+定型的な入力はGeminiを呼び出さずにローカルで解析し、ParsedResultを生成します。
+確信度が低い入力はNoneを返し、呼び出し元でGeminiに解析を任せます。
+"""
+import datetime
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Tuple
+
+from .schemas import ActionType, CalendarEvent, ParsedResult
+
+WEEKDAYS = "月火水木金土日"
+
+# 相対的な日付表現と、今日からの日数
+_RELATIVE_DAYS = {
+    "今日": 0, "本日": 0, "きょう": 0,
+    "明日": 1, "あした": 1, "あす": 1,
+    "明後日": 2, "あさって": 2,
+}
+_RELATIVE_DAY_RE = re.compile("|".join(sorted(_RELATIVE_DAYS, key=len, reverse=True)))
+_DAYS_LATER_RE = re.compile(r"(\d+)\s*(日|週間)後")
+_WEEKDAY_RE = re.compile(rf"(今週|来週|再来週|次の|今度の)?\s*の?\s*([{WEEKDAYS}])曜日?")
+_MONTH_DAY_RE = re.compile(r"(\d{1,2})\s*月\s*(\d{1,2})\s*日|(?<![\d:])(\d{1,2})/(\d{1,2})(?![\d:])")
+
+# 時刻表現: 「午後8時」「朝9時」「13時半」「15時30分」「9:30」「夜12時」
+_TIME_RE = re.compile(
+    r"(午前|午後|朝|昼|夕方|深夜|夜)?\s*(?:(\d{1,2})\s*時(?!間)\s*(半|\d{1,2}\s*分(?!間))?|(\d{1,2}):(\d{2}))"
+)
+_NOON_RE = re.compile(r"正午")
+_RANGE_SEPARATOR_RE = re.compile(r"^\s*(から|〜|~|-|－)\s*")
+_UNTIL_RE = re.compile(r"\s*まで")
+
+# 所要時間: 「30分間」「1時間半」「2時間」
+_DURATION_RE = re.compile(r"(?:(\d+)\s*時間(半)?)?\s*(?:(\d+)\s*分)?\s*間?")
+
+_DELETE_VERB_RE = re.compile(r"(の予定)?\s*(を|は)?\s*(削除|キャンセル|取り消|取りやめ|消して|消す|消去|中止)")
+# 「削除しないで」「消さないで」「やめないで」のような打ち消し
+_NEGATION_RE = re.compile(r"ないで|しない|さない|めない|ません|なくて")
+_QUESTION_RE = re.compile(r"[?？]|教えて|空いて|空き|予定は|確認")
+_VAGUE_RE = re.compile(r"頃|ごろ|くらい|ぐらい|未定|かも|たぶん|多分")
+_RECURRING_RE = re.compile(r"毎日|毎週|毎月|毎年|隔週")
+# 「会議を予約して」「打ち合わせを入れといて」のような、タイトルの末尾に付く依頼の表現
+_REQUEST_SUFFIX_RE = re.compile(
+    r"\s*(?:を|の)?\s*(?:(?:予約|登録|追加|設定|入力|記録)(?:して|しといて|しておいて)|(?:入れ|いれ)(?:て|といて|ておいて))"
+    r"(?:ください|下さい|くれる|ほしい|欲しい)?$"
+    r"|\s*(?:を|の)?\s*(?:お願い|おねがい)(?:します|ね)?$"
+)
+# 取り除いた後も残っている依頼の表現
+_REQUEST_LEFT_RE = re.compile(r"して|入れて|いれて|ください|下さい|お願い|おねがい")
+
+# タイトルの前後から取り除く助詞や記号
+_EDGE_PARTICLES = ("から", "まで", "の", "に", "は", "を", "、", ",", "，", " ", "　", "・")
+
+
+def normalize(text: str) -> str:
+    """
+    全角英数字などを半角に揃え、前後の空白を取り除きます。
+    """
+    return unicodedata.normalize("NFKC", text).strip()
+
+
+def _strip_edges(fragment: str) -> str:
+    """
+    文字列の前後にある助詞や区切り記号を取り除きます。
+    """
+    changed = True
+    while changed and fragment:
+        changed = False
+        for particle in _EDGE_PARTICLES:
+            if fragment.startswith(particle):
+                fragment = fragment[len(particle):]
+                changed = True
+            if fragment.endswith(particle):
+                fragment = fragment[: -len(particle)]
+                changed = True
+    return fragment
+
+
+def _next_weekday(today: datetime.date, weekday: int, prefix: str | None) -> datetime.date:
+    """
+    修飾語（今週・来週など）に応じて、指定された曜日の日付を求めます。
+    """
+    monday = today - datetime.timedelta(days=today.weekday())
+    if prefix == "今週":
+        return monday + datetime.timedelta(days=weekday)
+    if prefix == "来週":
+        return monday + datetime.timedelta(days=7 + weekday)
+    if prefix == "再来週":
+        return monday + datetime.timedelta(days=14 + weekday)
+    days_ahead = (weekday - today.weekday()) % 7
+    return today + datetime.timedelta(days=days_ahead or 7)
+
+
+def find_date(text: str, now: datetime.datetime) -> Tuple[datetime.date | None, List[Tuple[int, int]]]:
+    """
+    テキストから日付表現を探し、対応する日付を求めます。
+
+    Args:
+        text: 正規化済みのテキスト。
+        now: 相対的な日付の基準となる現在日時。
+
+    Returns:
+        見つかった日付（複数の日付が見つかった場合や見つからない場合はNone）と、
+        日付表現が占める文字範囲のリスト。
+    """
+    today = now.date()
+    found: List[Tuple[datetime.date, Tuple[int, int]]] = []
+
+    for m in _MONTH_DAY_RE.finditer(text):
+        month = int(m.group(1) or m.group(3))
+        day = int(m.group(2) or m.group(4))
+        try:
+            date = datetime.date(today.year, month, day)
+        except ValueError:
+            return None, []
+        if date < today:
+            date = date.replace(year=today.year + 1)
+        found.append((date, m.span()))
+
+    for m in _WEEKDAY_RE.finditer(text):
+        date = _next_weekday(today, WEEKDAYS.index(m.group(2)), m.group(1))
+        found.append((date, m.span()))
+
+    for m in _DAYS_LATER_RE.finditer(text):
+        unit = 7 if m.group(2) == "週間" else 1
+        found.append((today + datetime.timedelta(days=int(m.group(1)) * unit), m.span()))
+
+    for m in _RELATIVE_DAY_RE.finditer(text):
+        found.append((today + datetime.timedelta(days=_RELATIVE_DAYS[m.group(0)]), m.span()))
+
+    spans = [span for _, span in found]
+    dates = {date for date, _ in found}
+    if len(dates) != 1:
+        return None, spans
+    return dates.pop(), spans
+
+
+def _match_time(text: str, pos: int = 0) -> Tuple[datetime.timedelta | None, Tuple[int, int] | None, bool]:
+    """
+    pos以降で最初に現れる時刻表現を解析します。
+
+    「夜12時」「深夜1時」のように日付をまたぐ時刻は、24時間を超える値(翌日の時刻)として返します。
+
+    Returns:
+        その日の0時からの経過時間で表した時刻、その表現が占める文字範囲、
+        午前か午後か（または何日の深夜か）判別できないかどうか。
+    """
+    m = _TIME_RE.search(text, pos)
+    noon = _NOON_RE.search(text, pos)
+    if noon and (not m or noon.start() < m.start()):
+        return datetime.timedelta(hours=12), noon.span(), False
+    if not m:
+        return None, None, False
+
+    period, hour_str, minute_part, colon_hour, colon_minute = m.groups()
+    if hour_str is not None:
+        hour = int(hour_str)
+        if minute_part is None:
+            minute = 0
+        elif minute_part == "半":
+            minute = 30
+        else:
+            minute = int(minute_part.rstrip("分").strip())
+    else:
+        hour, minute = int(colon_hour), int(colon_minute)
+
+    # 「3時」のように午前午後の指定がない早朝の時刻は、午後の意味で使われることが多い
+    ambiguous = period is None and hour_str is not None and 1 <= hour <= 6
+    days = 0
+
+    if period in ("夜", "深夜") and hour in (0, 12):
+        # 「夜12時」「深夜0時」は翌日の0時
+        hour, days = 0, 1
+    elif period == "深夜" and hour < 6:
+        # 「深夜2時」は翌日の2時を指すことが多いが、当日の未明の意味でも使われる
+        days = 1
+        ambiguous = True
+    elif period in ("午後", "夕方", "夜", "深夜") and hour < 12:
+        hour += 12
+    elif period == "昼" and hour < 6:
+        hour += 12
+
+    if hour == 24 and minute == 0:
+        hour = 23
+        minute = 59
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None, None, False
+    return datetime.timedelta(days=days, hours=hour, minutes=minute), m.span(), ambiguous
+
+
+def find_times(
+    text: str,
+) -> Tuple[datetime.timedelta | None, datetime.timedelta | None, List[Tuple[int, int]], bool]:
+    """
+    テキストから開始時刻と（あれば）終了時刻を探します。
+
+    時刻はその日の0時からの経過時間で表します（翌日にまたがる場合は24時間以上）。
+
+    Args:
+        text: 正規化済みのテキスト。
+
+    Returns:
+        開始時刻、終了時刻、時刻表現が占める文字範囲のリスト、
+        午前か午後か判別できない時刻を含むかどうか。
+    """
+    start, span, ambiguous = _match_time(text)
+    if start is None or span is None:
+        return None, None, [], False
+
+    spans = [span]
+    end = None
+    separator = _RANGE_SEPARATOR_RE.match(text[span[1]:])
+    if separator:
+        end_pos = span[1] + separator.end()
+        end_time, end_span, _ = _match_time(text, end_pos)
+        if end_time is not None and end_span is not None and end_span[0] == end_pos:
+            until = _UNTIL_RE.match(text, end_span[1])
+            end = end_time
+            spans.append((span[1], until.end() if until else end_span[1]))
+            # 「10時から1時」のように終了時刻が開始時刻より前なら午後とみなし、
+            # 「22時から2時」のように午後としても前なら翌日とみなす
+            if end <= start:
+                afternoon = end + datetime.timedelta(hours=12)
+                if end < datetime.timedelta(hours=12) and afternoon > start:
+                    end = afternoon
+                else:
+                    end += datetime.timedelta(days=1)
+    return start, end, spans, ambiguous
+
+
+def find_duration(
+    text: str, exclude: List[Tuple[int, int]] | None = None
+) -> Tuple[datetime.timedelta | None, List[Tuple[int, int]]]:
+    """
+    「30分間」「1時間半」のような所要時間の表現を探します。
+
+    Args:
+        text: 正規化済みのテキスト。
+        exclude: 時刻表現など、所要時間として扱わない文字範囲。
+
+    Returns:
+        所要時間と、その表現が占める文字範囲のリスト。
+    """
+    exclude = exclude or []
+    for m in _DURATION_RE.finditer(text):
+        hours, half, minutes = m.group(1), m.group(2), m.group(3)
+        if hours is None and minutes is None:
+            continue
+        if any(start < m.end() and m.start() < end for start, end in exclude):
+            continue
+        total = int(hours or 0) * 60 + int(minutes or 0) + (30 if half else 0)
+        if total <= 0:
+            continue
+        return datetime.timedelta(minutes=total), [m.span()]
+    return None, []
+
+
+def _remove_spans(text: str, spans: List[Tuple[int, int]]) -> List[str]:
+    """
+    指定された範囲を取り除き、残った断片を前後の助詞を除いて返します。
+    """
+    fragments = []
+    pos = 0
+    for start, end in sorted(spans):
+        if start < pos:
+            continue
+        fragments.append(text[pos:start])
+        pos = end
+    fragments.append(text[pos:])
+    return [f for f in (_strip_edges(f.strip()) for f in fragments) if f]
+
+
+class RuleBasedParser:
+    """
+    定型的な日本語の予定表現をGeminiを使わずに解析するクラス。
+    """
+
+    def __init__(self, min_confidence: float = 0.8):
+        """
+        Args:
+            min_confidence: 解析結果を採用する確信度の下限(0.0〜1.0)。
+        """
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def parse(self, text: str, now: datetime.datetime | None = None) -> ParsedResult | None:
+        """
+        テキストを解析し、確信度が十分であればParsedResultを返します。
+
+        Args:
+            text: ユーザーによって入力された自然言語のテキスト。
+            now: 相対的な日時の基準となる現在日時。省略時は現在時刻。
+
+        Returns:
+            解析結果。確信度が低い場合はNone。
+        """
+        if now is None:
+            now = datetime.datetime.now()
+
+        result, confidence = self._parse(normalize(text), now)
+        with self._lock:
+            if result is not None and confidence >= self.min_confidence:
+                self._hits += 1
+                return result
+            self._misses += 1
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        """
+        ルールベースで解析できた件数（Gemini呼び出しを省略できた件数）を返します。
+
+        Returns:
+            hits, misses, hit_rate を持つ辞書。
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / total if total else 0.0,
+            }
+
+    def _parse(self, text: str, now: datetime.datetime) -> Tuple[ParsedResult | None, float]:
+        """
+        解析結果とその確信度を返します。
+        """
+        if not text or _QUESTION_RE.search(text) or _RECURRING_RE.search(text):
+            return None, 0.0
+        # 「削除しないで」のような打ち消しは、予定の登録・削除のどちらとも判断できない
+        if _NEGATION_RE.search(text):
+            return None, 0.0
+
+        # 最初の文を予定の本体、残りを説明として扱う
+        main, _, rest = text.partition("。")
+        description = rest.strip() or None
+
+        confidence = 1.0
+        if _VAGUE_RE.search(main):
+            confidence *= 0.5
+
+        date, date_spans = find_date(main, now)
+        if date is None:
+            return None, 0.0
+
+        delete = _DELETE_VERB_RE.search(main)
+        if delete:
+            if date < now.date():
+                confidence *= 0.5
+            return self._parse_delete(main, date, date_spans, delete, confidence)
+
+        start, end, time_spans, ambiguous = find_times(main)
+        if start is None:
+            return None, 0.0
+        if ambiguous:
+            confidence *= 0.5
+
+        start_time = datetime.datetime.combine(date, datetime.time(0, 0)) + start
+        # 「今週の金曜」が今日より前の日を指すなど、過去の日時になった場合は解釈を誤っている可能性が高い
+        if start_time < now.replace(tzinfo=None):
+            confidence *= 0.5
+        duration, duration_spans = find_duration(main, exclude=date_spans + time_spans)
+        fragments = _remove_spans(main, date_spans + time_spans + duration_spans)
+
+        if end is not None:
+            end_time = datetime.datetime.combine(date, datetime.time(0, 0)) + end
+        elif duration is not None:
+            end_time = start_time + duration
+        else:
+            end_time = start_time + datetime.timedelta(hours=1)
+
+        title = _strip_edges(_REQUEST_SUFFIX_RE.sub("", "".join(f for f in fragments if f)))
+        if not title:
+            return None, 0.0
+        # 数字が残っている場合は解釈しきれていない日時表現がある可能性が高い
+        if re.search(r"\d", title):
+            confidence *= 0.5
+        # 依頼の表現が残っている場合は、タイトルと依頼の区切りを誤っている可能性が高い
+        if _REQUEST_LEFT_RE.search(title):
+            confidence *= 0.5
+        if len(title) > 30:
+            confidence *= 0.5
+
+        event = CalendarEvent(
+            title=title,
+            start_time=start_time,
+            end_time=end_time,
+            description=description,
+        )
+        return ParsedResult(action=ActionType.CREATE, event=event), confidence
+
+    def _parse_delete(
+        self,
+        text: str,
+        date: datetime.date,
+        date_spans: List[Tuple[int, int]],
+        verb: re.Match,
+        confidence: float,
+    ) -> Tuple[ParsedResult | None, float]:
+        """
+        削除の指示を解析し、Geminiと同じ形式の検索情報を生成します。
+        """
+        target = text[: verb.start()]
+        start, _, time_spans, ambiguous = find_times(target)
+        if ambiguous:
+            confidence *= 0.5
+        start_time = datetime.datetime.combine(date, datetime.time(0, 0)) + (start or datetime.timedelta(0))
+        # 終了時刻が明記されていない場合は開始時刻から24時間後まで検索する
+        end_time = start_time + datetime.timedelta(hours=24)
+
+        # 「1時間の打ち合わせ」の所要時間は予定のタイトルに含まれないため、検索語から取り除く
+        _, duration_spans = find_duration(target, exclude=date_spans + time_spans)
+
+        key_word = "".join(_remove_spans(target, date_spans + time_spans + duration_spans))
+        key_word = _strip_edges(key_word.removesuffix("予定"))
+        if not key_word:
+            return None, 0.0
+        # 数字が残っている場合は解釈しきれていない日時表現がある可能性が高い
+        if re.search(r"\d", key_word):
+            confidence *= 0.5
+        if len(key_word) > 30:
+            confidence *= 0.5
+
+        search_info = {
+            "start_time": start_time.strftime("%Y-%m-%dT%H:%M"),
+            "end_time": end_time.strftime("%Y-%m-%dT%H:%M"),
+            "key_word": key_word,
+        }
+        return ParsedResult(action=ActionType.DELETE, event=search_info), confidence
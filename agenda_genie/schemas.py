@@ -5,11 +5,12 @@
 Google Calendar APIに渡すための一貫したデータ形式を提供します。
 """
 
-from dataclasses import dataclass
+import types
+from dataclasses import dataclass, fields
 from datetime import datetime
 
 from enum import Enum
-from typing import Optional
+from typing import Any, Dict, Optional, Union, get_args, get_origin, get_type_hints
 
 
 @dataclass
@@ -41,7 +42,7 @@ class Search_event_info:
     
     time_min: datetime | None = None
     time_max: datetime | None = None
-    key_word: str
+    key_word: str = ""
 
 class ActionType(Enum):
     """ユーザーが要求している操作の種類"""
@@ -56,4 +57,94 @@ class ParsedResult:
         self.action = action
         self.event = event
         self.original_text = original_text
-        
\ No newline at end of file
+
+    def to_dict(self) -> Dict[str, Any]:
+        """キャッシュなどに保存するため、JSONに変換できる辞書を返します。"""
+        event: Any = self.event
+        if isinstance(event, CalendarEvent):
+            event = {
+                "title": event.title,
+                "start_time": event.start_time.isoformat(),
+                "end_time": event.end_time.isoformat(),
+                "description": event.description,
+            }
+        return {"action": self.action.value, "event": event, "original_text": self.original_text}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ParsedResult":
+        """to_dictで変換した辞書からParsedResultを復元します。"""
+        action = ActionType(data["action"])
+        event = data.get("event")
+        if action == ActionType.CREATE and event is not None:
+            event = CalendarEvent(
+                title=event["title"],
+                start_time=datetime.fromisoformat(event["start_time"]),
+                end_time=datetime.fromisoformat(event["end_time"]),
+                description=event.get("description"),
+            )
+        return cls(action=action, event=event, original_text=data.get("original_text", ""))
+        
+
+
+# 予定の削除で、Geminiが抽出する検索情報の項目
+DELETE_SEARCH_FIELDS = ("start_time", "end_time", "key_word")
+
+# actionごとに、Geminiの応答のeventに必ず含まれていなければならない項目
+REQUIRED_EVENT_FIELDS = {
+    ActionType.CREATE: ("title", "start_time", "end_time"),
+    ActionType.DELETE: DELETE_SEARCH_FIELDS,
+}
+
+# 日時の項目として出力させる形式
+DATETIME_FORMAT_HINT = "YYYY-MM-DDTHH:MM"
+
+
+def _field_schema(annotation: Any) -> Dict[str, Any]:
+    """
+    データクラスの項目の型から、応答スキーマの項目を作ります。
+    """
+    schema: Dict[str, Any] = {"type": "string"}
+    args = get_args(annotation)
+    if get_origin(annotation) in (Union, types.UnionType) and type(None) in args:
+        schema["nullable"] = True
+        annotation = next(arg for arg in args if arg is not type(None))
+    if annotation is datetime:
+        schema["description"] = f"{DATETIME_FORMAT_HINT}形式の日時"
+    return schema
+
+
+def response_schema(batch: bool = False) -> Dict[str, Any]:
+    """
+    Geminiの構造化出力に渡す、ParsedResultに対応する応答スキーマを返します。
+
+    eventの項目は、予定の作成ではCalendarEventの項目、予定の削除ではDELETE_SEARCH_FIELDSの項目を使います。
+    スキーマは1つの形式しか表せないため、両方の項目を持ち、どちらのactionでも使う項目だけを必須にしています。
+    actionごとの必須項目(REQUIRED_EVENT_FIELDS)は、応答を受け取った後に確認します。
+
+    Args:
+        batch: 複数の入力をまとめて解析する場合はTrue。各要素に入力のidを持つ配列のスキーマを返します。
+
+    Returns:
+        OpenAPI形式のスキーマを表す辞書。
+    """
+    hints = get_type_hints(CalendarEvent)
+    event_properties = {f.name: _field_schema(hints[f.name]) for f in fields(CalendarEvent)}
+    for name in DELETE_SEARCH_FIELDS:
+        event_properties.setdefault(name, _field_schema(str))
+    required_sets = [set(names) for names in REQUIRED_EVENT_FIELDS.values()]
+    event_required = [name for name in event_properties if name in set.intersection(*required_sets)]
+
+    item: Dict[str, Any] = {
+        "type": "object",
+        "properties": {
+            "action": {"type": "string", "enum": [action.value for action in ActionType]},
+            "event": {"type": "object", "nullable": True, "properties": event_properties, "required": event_required},
+            "original_text": {"type": "string", "nullable": True},
+        },
+        "required": ["action"],
+    }
+    if not batch:
+        return item
+    item["properties"]["id"] = {"type": "integer"}
+    item["required"] = ["id", "action"]
+    return {"type": "array", "items": item}
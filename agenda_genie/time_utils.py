@@ -0,0 +1,45 @@
+"""
+カレンダーの日時を扱うための共通関数を定義するモジュール。
+
+パーサーが生成する日時はタイムゾーンを持たない（日本時間として扱う）ため、
+Google Calendar APIとの受け渡しではここで定義する関数を使って変換します。
+"""
+import datetime
+from typing import Any, Dict
+from zoneinfo import ZoneInfo
+
+# カレンダーのタイムゾーン
+TIME_ZONE_NAME = "Asia/Tokyo"
+TIME_ZONE = ZoneInfo(TIME_ZONE_NAME)
+
+
+def localize(dt: datetime.datetime) -> datetime.datetime:
+    """
+    タイムゾーンを持たない日時を日本時間として扱い、タイムゾーン付きの日時を返します。
+    """
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=TIME_ZONE)
+    return dt
+
+
+def to_rfc3339(dt: datetime.datetime) -> str:
+    """
+    日時をGoogle Calendar APIのtimeMin/timeMaxに渡せるRFC3339形式の文字列に変換します。
+    """
+    return localize(dt).isoformat()
+
+
+def parse_event_time(value: Dict[str, Any]) -> datetime.datetime:
+    """
+    イベントリソースのstart/endフィールドをタイムゾーン付きの日時に変換します。
+
+    Args:
+        value: {"dateTime": ...} または終日イベントの {"date": ...} 形式の辞書。
+
+    Returns:
+        タイムゾーン付きの日時。終日イベントの場合はその日の0時。
+    """
+    if "dateTime" in value:
+        return localize(datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00")))
+    date = datetime.date.fromisoformat(value["date"])
+    return datetime.datetime.combine(date, datetime.time(0, 0), tzinfo=TIME_ZONE)
@@ -0,0 +1,240 @@
+"""
+1回のwebhookで届いた複数のイベントを並行して処理するためのハンドラーを提供するモジュール。
+
+LINEのwebhookはグループチャットや障害後の再送などで複数のイベントをまとめて届けます。
+標準のWebhookHandlerはそれらを1件ずつ順番に処理しますが、ここではユーザーごとに
+イベントをまとめ、ユーザー間では並行に、同じユーザーのイベントは届いた順に処理します。
+重複排除が設定されている場合は、再送された処理済みのイベントを読み飛ばします。
+"""
+import inspect
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from linebot.v3 import WebhookHandler
+from linebot.v3.webhooks import MessageEvent
+
+from .dedupe import EventDeduplicator
+
+
+def ordering_key(event: Any) -> str:
+    """
+    処理順序を保つ単位となるキーを返します。
+
+    カレンダーはユーザーごとに操作するため、送信者のユーザーIDを優先し、
+    取得できない場合はグループ・トークルームのIDを使います。
+
+    Args:
+        event: webhookのイベント。
+
+    Returns:
+        順序を保つ単位のキー。
+    """
+    source = getattr(event, "source", None)
+    if source is None:
+        return ""
+    return (
+        getattr(source, "user_id", None)
+        or getattr(source, "group_id", None)
+        or getattr(source, "room_id", None)
+        or ""
+    )
+
+
+class _KeyedLocks:
+    """
+    キーごとのロック。使われていないキーのロックは破棄します。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[str, Tuple[threading.Lock, int]] = {}
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        with self._lock:
+            lock, users = self._locks.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._locks[key] = (lock, users + 1)
+
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._locks[key]
+                if users == 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, users - 1)
+
+
+class ConcurrentWebhookHandler(WebhookHandler):
+    """
+    1回のwebhookに含まれるイベントを、上限付きのスレッドプールで並行に処理するWebhookHandler。
+
+    同じユーザーのイベントは1つのタスクで順番に処理し、さらにユーザーごとのロックを取るため、
+    別々のwebhookで届いた同じユーザーのイベント（非同期モードで別のワーカーが処理する場合など）も
+    同時には実行されません。handleはすべてのイベントの処理が終わってから戻ります。
+    """
+
+    def __init__(
+        self,
+        channel_secret: str,
+        max_workers: int = 8,
+        deduplicator: EventDeduplicator | None = None,
+    ):
+        """
+        Args:
+            channel_secret: LINEチャネルのシークレット。
+            max_workers: イベントを並行して処理するスレッドの最大数。
+            deduplicator: webhookEventIdによる重複排除（任意）。
+                指定された場合、処理済みのイベントは処理関数を呼び出さずに読み飛ばします。
+        """
+        super().__init__(channel_secret)
+        self.max_workers = max_workers
+        self.deduplicator = deduplicator
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webhook-fanout")
+        self._user_locks = _KeyedLocks()
+        self._stats_lock = threading.Lock()
+        self._deliveries = 0
+        self._events = 0
+        self._fanned_out = 0
+        self._failed = 0
+        self._redeliveries = 0
+        self._skipped = 0
+
+    def handle(self, body: str, signature: str) -> None:
+        """
+        webhookを検証し、含まれるイベントをユーザーごとに並行して処理します。
+
+        Args:
+            body: リクエストボディ。
+            signature: X-Line-Signatureヘッダーの値。
+
+        Raises:
+            InvalidSignatureError: 署名が一致しない場合。
+            Exception: イベントの処理中に発生した最初の例外（すべてのイベントの処理後に送出します）。
+        """
+        payload = self.parser.parse(body, signature, as_payload=True)
+        events = payload.events or []
+
+        groups: Dict[str, List[Any]] = {}
+        for event in events:
+            groups.setdefault(ordering_key(event), []).append(event)
+
+        redeliveries = sum(1 for event in events if _is_redelivery(event))
+        with self._stats_lock:
+            self._deliveries += 1
+            self._events += len(events)
+            self._redeliveries += redeliveries
+            if len(groups) > 1:
+                self._fanned_out += 1
+
+        if len(groups) <= 1:
+            # 並行に処理するものがなければ、スレッドを切り替えずにその場で処理する
+            for key, group in groups.items():
+                self._run_group(key, group, payload.destination)
+            return
+
+        futures: List[Future] = [
+            self._executor.submit(self._run_group, key, group, payload.destination)
+            for key, group in groups.items()
+        ]
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def stats(self) -> Dict[str, int]:
+        """
+        処理したwebhookとイベントの件数を返します。
+
+        Returns:
+            各カウンターの値を持つ辞書。
+        """
+        with self._stats_lock:
+            return {
+                "deliveries": self._deliveries,
+                "events": self._events,
+                "fanned_out": self._fanned_out,
+                "failed": self._failed,
+                "redeliveries": self._redeliveries,
+                "skipped_duplicates": self._skipped,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        イベントを処理するスレッドプールを停止します。
+        """
+        self._executor.shutdown(wait=wait)
+
+    def _run_group(self, key: str, events: List[Any], destination: str) -> None:
+        """
+        同じユーザーのイベントを届いた順に処理します。途中で失敗しても残りのイベントは処理します。
+        """
+        first_error: Exception | None = None
+        with self._user_locks.hold(key):
+            for event in events:
+                try:
+                    self._dispatch_once(event, destination)
+                except Exception as e:
+                    print(f"イベントの処理中にエラーが発生しました: {e}")
+                    with self._stats_lock:
+                        self._failed += 1
+                    if first_error is None:
+                        first_error = e
+        if first_error is not None:
+            raise first_error
+
+    def _dispatch_once(self, event: Any, destination: str) -> None:
+        """
+        処理済みのイベントでなければ処理します。同じイベントが処理中の場合は、その完了を待ってから判定します。
+        """
+        if self.deduplicator is None:
+            self._dispatch(event, destination)
+            return
+        with self.deduplicator.process(getattr(event, "webhook_event_id", None)) as fresh:
+            if fresh:
+                self._dispatch(event, destination)
+                return
+        with self._stats_lock:
+            self._skipped += 1
+
+    def _dispatch(self, event: Any, destination: str) -> None:
+        """
+        イベントの種類に対応する処理関数を呼び出します（WebhookHandler.handleと同じ規則）。
+        """
+        func = None
+        if isinstance(event, MessageEvent):
+            func = self._handlers.get(f"{event.__class__.__name__}_{event.message.__class__.__name__}")
+        if func is None:
+            func = self._handlers.get(event.__class__.__name__)
+        if func is None:
+            func = self._default
+        if func is None:
+            return
+        _invoke(func, event, destination)
+
+
+def _is_redelivery(event: Any) -> bool:
+    """
+    LINEプラットフォームによって再送されたイベントかどうかを返します。
+    """
+    context = getattr(event, "delivery_context", None)
+    return bool(getattr(context, "is_redelivery", False))
+
+
+def _invoke(func: Callable[..., Any], event: Any, destination: str) -> None:
+    """
+    処理関数の引数の数に合わせて呼び出します。
+    """
+    spec = inspect.getfullargspec(func)
+    if spec.varargs is not None or len(spec.args) == 2:
+        func(event, destination)
+    elif len(spec.args) == 1:
+        func(event)
+    else:
+        func()
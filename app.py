@@ -1,11 +1,13 @@
 import os
+import atexit
 import datetime
+import itertools
+import json
+import threading
+import time
 from dotenv import load_dotenv
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort, jsonify
 
-from linebot.v3 import (
-    WebhookHandler
-)
 from linebot.v3.exceptions import (
     InvalidSignatureError
 )
@@ -14,7 +16,9 @@ from linebot.v3.messaging import (
     ApiClient,
     MessagingApi,
     ReplyMessageRequest,
+    PushMessageRequest,
     TextMessage,
+    ApiException,
 )
 from linebot.v3.webhooks import (
     MessageEvent,
@@ -22,135 +26,521 @@ from linebot.v3.webhooks import (
 )
 
 # このアプリケーションからのモジュールをインポート
-from agenda_genie.google_calendar import GoogleCalendarManager
+from agenda_genie import metrics
+from agenda_genie.agenda import render_agenda, resolve_read_query
+from agenda_genie.calendar_mirror import CalendarMirror
+from agenda_genie.calendar_pool import CalendarClientPool, MultiTenantCalendarPool
+from agenda_genie.conflicts import ConflictChecker
+from agenda_genie.credential_store import CredentialStore
+from agenda_genie.dedupe import EventDeduplicator, SQLiteEventDeduplicator
+from agenda_genie.event_queue import EventQueue
+from agenda_genie.interval_index import IntervalIndex
 from agenda_genie.natural_language_parser import GeminiParser
+from agenda_genie.parse_cache import SQLiteParseCache
+from agenda_genie.prefetch import CalendarPrefetcher
+from agenda_genie.resilience import UpstreamUnavailableError
 from agenda_genie.schemas import ActionType
+from agenda_genie.webhook_dispatcher import ConcurrentWebhookHandler
 
-# .envファイルから環境変数を読み込む
-load_dotenv()
+# リプライトークンの有効期限(秒)。これを過ぎたイベントにはプッシュメッセージで返信する
+REPLY_TOKEN_TTL = 50
 
-# Flaskアプリケーションのインスタンスを作成
-app = Flask(__name__)
+# GeminiやGoogle Calendarが一時的に使えない(レート制限・障害)ときの返信
+BUSY_REPLY = "ただいま混み合っています。少し時間をおいてからもう一度お試しください。"
 
-# 環境変数からLINE Botの認証情報を取得
-channel_secret = os.getenv('LINE_CHANNEL_SECRET')
-channel_access_token = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 
-if not channel_secret or not channel_access_token:
-    print("エラー： LINEの認証情報が.envファイルに設定されていません。")
-    exit()
+class AgendaGenie:
+    """
+    LINE Botの各コンポーネント(パーサー・カレンダーのクライアントプール・webhookの処理)と、その処理を持つクラス。
 
-# LINE Messaging APIへの接続を設定
-handler = WebhookHandler(channel_secret)
-configuration = Configuration(access_token=channel_access_token)
+    create_appがFlaskアプリケーションごとに1つ作成し、app.extensions["agenda_genie"]に格納する。
+    """
 
-# --- アプリケーションの中核部分 ---
-# AIパーサーを初期化(サーバー起動時に一度だけ実行)
-try:
-    parser = GeminiParser()
-    print("Geminiパーサーを初期化しました。")
-except (ValueError, FileNotFoundError) as e:
-    print(f"エラー: GeminiParserの初期化に失敗しました。{e}")
-    parser = None
-# --------------------------------
+    def __init__(self, app):
+        """
+        環境変数を読み込み、各コンポーネントを作成する。
 
+        Raises:
+            ValueError: LINEの認証情報が環境変数に設定されていない場合。
+        """
+        self.app = app
 
-@app.route("/callback", methods=['POST'])
-def callback():
-    """
-    LINEプラットフォームからのwebhookリクエストを処理するエンドポイント
-    """
-    # リクエストヘッダーから署名を検証
-    signature = request.headers['X-Line-Signature']
-    
-    # リクエストボディを取得
-    body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
-    
-    # 署名を検証し、リクエストを処理
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        app.logger.info("Invalid signature. Please check your channel secret.")
-        abort(400)
-    
-    return 'OK'
-
-def handle_create(calendar_event):
-    "イベント作成処理"
-    try:
-        manager = GoogleCalendarManager()
-        manager.create_event(calendar_event)
-        start_time = calendar_event.start_time.strftime("%Y/%m/%d %H:%M")
-        return f"カレンダーに予定を登録しました。\n\nタイトル: {calendar_event.title}\n開始: {start_time}"
-    except Exception as e:
-        app.logger.error(f"カレンダーへの登録中にエラー: {e}")
-        return "すみません。カレンダーへの登録中にエラーが発生しました。"
-
-
-def handle_delete(search_info):
-    "イベント削除処理"
-    try:
-        manager = GoogleCalendarManager()
-        app.logger.info(f"handle_delete done using {search_info}")
-        time_min = datetime.datetime.fromisoformat(search_info["start_time"])
-        time_max = datetime.datetime.fromisoformat(search_info["end_time"])
-        events = manager.search_events(start_time=time_min, end_time=time_max, query=search_info["key_word"])
-        
-        if not events:
-            return f"「{search_info.key_word}」に一致する予定が見当たりませんでした。"
-        elif len(events) > 1:
-            # 複数見つかった場合は、ユーザーに選択を促す（今回は未実装）
-            return "複数の予定が見つかりました。もう少し詳しく教えていただけますか？"
+        # 環境変数からLINE Botの認証情報を取得
+        channel_secret = os.getenv('LINE_CHANNEL_SECRET')
+        channel_access_token = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
+
+        if not channel_secret or not channel_access_token:
+            raise ValueError(
+                "LINEの認証情報(LINE_CHANNEL_SECRET, LINE_CHANNEL_ACCESS_TOKEN)が環境変数または.envファイルに設定されていません。"
+            )
+
+        # 再送されたwebhookイベントをwebhookEventIdで判定し、重複して処理しない
+        # WEBHOOK_DEDUPE_DBが設定されている場合は、複数のプロセスで共有できるようSQLiteに記録する
+        dedupe_db = os.getenv('WEBHOOK_DEDUPE_DB')
+        dedupe_ttl = float(os.getenv('WEBHOOK_DEDUPE_TTL', 3600))
+        if dedupe_db:
+            self.deduplicator = SQLiteEventDeduplicator(dedupe_db, ttl=dedupe_ttl)
         else:
-            event_to_delete = events[0]
-            event_id = event_to_delete["id"]
-            event_title = event_to_delete.get("summary", "無題の予定")
-            if manager.delete_event(event_id=event_id):
-                return f"「{event_title}」の予定を削除しました。"
-            else:
-                return "予定の削除に失敗しました。"            
+            self.deduplicator = EventDeduplicator(ttl=dedupe_ttl)
 
-    except Exception as e:
-        app.logger.error(f"イベント削除中にエラー: {e}")
-        return "予定の削除中にエラーが発生しました。"
+        # LINE Messaging APIへの接続を設定
+        # 1回のwebhookに含まれる複数のイベントは、ユーザーごとの順序を保ったまま並行に処理する
+        self.handler = ConcurrentWebhookHandler(
+            channel_secret,
+            max_workers=int(os.getenv('WEBHOOK_FANOUT_WORKERS', 8)),
+            deduplicator=self.deduplicator,
+        )
+        self.configuration = Configuration(access_token=channel_access_token)
+
+        # --- アプリケーションの中核部分 ---
+        # AIパーサーを初期化(アプリケーションの作成時に一度だけ実行)
+        # PARSE_CACHE_DBが設定されている場合は、解析結果のキャッシュをSQLiteに保存して再起動後も再利用する
+        parse_cache_db = os.getenv('PARSE_CACHE_DB')
+        try:
+            self.parser = GeminiParser(cache=SQLiteParseCache(parse_cache_db) if parse_cache_db else None)
+            print("Geminiパーサーを初期化しました。")
+        except (ValueError, FileNotFoundError) as e:
+            print(f"エラー: GeminiParserの初期化に失敗しました。{e}")
+            self.parser = None
+
+        # Googleカレンダーのクライアントプール(認証とサービスの構築は初回利用時に一度だけ行う)
+        # CALENDAR_MIRROR=1の場合は、カレンダーのローカル複製から予定を検索する
+        # 予定を登録する前に既存の予定との重なりを調べる。CONFLICT_POLICYで重なった場合の扱いを選ぶ
+        # "warn": 登録して重なる予定と近くの空き時間を添える（デフォルト） / "block": 登録せずにそれらを返す / "off": 調べない
+        self.conflict_policy = os.getenv('CONFLICT_POLICY', 'warn')
+        use_mirror = os.getenv('CALENDAR_MIRROR') == '1'
+        # CREDENTIALS_DBが設定されている場合は、LINEのユーザーごとに登録されたGoogleアカウントのカレンダーを操作する
+        # 設定されていない場合は、token.jsonの1つのアカウントを全員で共有する
+        credentials_db = os.getenv('CREDENTIALS_DB')
+        self.credential_store = None
+        if credentials_db:
+            self.credential_store = CredentialStore(credentials_db)
+            self.calendar_pool = MultiTenantCalendarPool(
+                self.credential_store,
+                max_users=int(os.getenv('CALENDAR_MAX_USERS', 256)),
+                mirror_factory=CalendarMirror if use_mirror else None,
+                conflict_checker_factory=ConflictChecker if self.conflict_policy != 'off' else None,
+            )
+        else:
+            self.calendar_pool = CalendarClientPool(
+                mirror=CalendarMirror() if use_mirror else None,
+                conflict_checker=ConflictChecker() if self.conflict_policy != 'off' else None,
+            )
 
+        # Geminiで解析している間に、テキストから推測した期間のカレンダーを先読みする(CALENDAR_PREFETCH=1で有効)
+        self.prefetcher = None
+        if os.getenv('CALENDAR_PREFETCH', '0') == '1':
+            self.prefetcher = CalendarPrefetcher(max_workers=int(os.getenv('CALENDAR_PREFETCH_WORKERS', 4)))
+
+        # Webhookの処理モード
+        # "sync": リクエスト内で解析から返信まで行う / "async": キューに積んで即座に応答する
+        self.event_queue = None
+        if os.getenv('WEBHOOK_MODE', 'sync') == 'async':
+            self.event_queue = EventQueue(
+                num_workers=int(os.getenv('WEBHOOK_WORKERS', 4)),
+                max_size=int(os.getenv('WEBHOOK_QUEUE_SIZE', 100)),
+                name="webhook-worker",
+            )
 
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
-    user_text = event.message.text
-    reply_text = ""
+        # WEBHOOK_CAPTURE_FILEが設定されている場合は、受け取ったwebhookを負荷試験ツール(benchmarks.loadgen)で
+        # 再生できるよう、受信時刻とボディを1行ずつ追記する。ユーザーの発話とIDが含まれるため取り扱いに注意すること
+        self.capture_file = os.getenv('WEBHOOK_CAPTURE_FILE')
+        self._capture_lock = threading.Lock()
 
-    if not parser:
-        reply_text = "すみません、Genieの呼び出しに失敗しました。管理者に連絡してください。"
-    else:
-        parsed_result = parser.parse_event_text(user_text)
+        # 起動時の準備(ウォームアップ)と停止処理の状態。/readyzで報告する
+        self.warmed_up = threading.Event()
+        self.draining = threading.Event()
+        self.drained = threading.Event()
+        self.warm_up_status = {"parser": "pending", "calendar": "pending"}
+        self._lifecycle_lock = threading.Lock()
+        self._warm_up_thread = None
+        # 停止時に、キューに積まれたイベントの処理を待つ最大秒数（gunicornのgraceful_timeoutより短くする）
+        self.drain_timeout = float(os.getenv('DRAIN_TIMEOUT', 20))
+        # --------------------------------
 
-        if not parsed_result:
-            reply_text = "すみません、メッセージを理解できませんでした。"
+    def register_metrics(self):
+        "各コンポーネントのカウンターを/metricsで出力する"
+        metrics.REGISTRY.register_collector("agenda_genie_calendar_pool", lambda: self.calendar_pool.stats())
+        if self.parser is not None and self.parser.fast_parser is not None:
+            metrics.REGISTRY.register_collector("agenda_genie_fast_path", self.parser.fast_parser.stats)
+        if self.parser is not None and self.parser.cache is not None:
+            metrics.REGISTRY.register_collector("agenda_genie_parse_cache", self.parser.cache.stats)
+        if self.event_queue is not None:
+            metrics.REGISTRY.register_collector("agenda_genie_event_queue", self.event_queue.stats)
+        metrics.REGISTRY.register_collector("agenda_genie_webhook", self.handler.stats)
+        metrics.REGISTRY.register_collector("agenda_genie_webhook_dedupe", self.deduplicator.stats)
+        if getattr(self.calendar_pool, 'conflict_checker', None) is not None:
+            metrics.REGISTRY.register_collector("agenda_genie_conflict_cache", self.calendar_pool.conflict_checker.stats)
+        if self.prefetcher is not None:
+            metrics.REGISTRY.register_collector("agenda_genie_prefetch", self.prefetcher.stats)
+        if self.credential_store is not None:
+            metrics.REGISTRY.register_collector("agenda_genie_credentials", self.credential_store.stats)
+
+    def start(self, warm_in_background=True):
+        "ウォームアップを開始し、プロセスの終了時にキューを処理し終えるよう停止処理を登録する"
+        with self._lifecycle_lock:
+            if self._warm_up_thread is not None:
+                return
+            if warm_in_background:
+                # ウォームアップの間も/healthzには応答し、/readyzで準備中であることを報告する
+                self._warm_up_thread = threading.Thread(target=self.warm_up, name="warm-up", daemon=True)
+                self._warm_up_thread.start()
+            else:
+                self._warm_up_thread = threading.current_thread()
+        if not warm_in_background:
+            self.warm_up()
+        atexit.register(self.shutdown)
+
+    def warm_up(self):
+        "最初のリクエストを待たずに、認証とカレンダーのサービスの構築を済ませておく"
+        self.warm_up_status["parser"] = "ok" if self.parser is not None else "unavailable"
+        if isinstance(self.calendar_pool, CalendarClientPool):
+            try:
+                with self.calendar_pool.acquire():
+                    pass
+                self.warm_up_status["calendar"] = "ok"
+            except Exception as e:
+                # 接続できなくても、最初の利用時に再試行する
+                self.app.logger.warning(f"Calendar warm-up failed: {e}")
+                self.warm_up_status["calendar"] = "error"
         else:
+            # ユーザーごとのクライアントは、各ユーザーの最初の利用時に構築する
+            self.warm_up_status["calendar"] = "per_user"
+        self.warmed_up.set()
+
+    def shutdown(self):
+        "新しいイベントの受け付けを止め、キューに積まれたイベントを処理し終えてから停止する"
+        with self._lifecycle_lock:
+            started = self.draining.is_set()
+            self.draining.set()
+        if started:
+            # 他のスレッドが停止処理中であれば、それが終わるまで待つ
+            self.drained.wait(self.drain_timeout)
+            return
+        self.app.logger.info("Draining queued webhook events before shutdown.")
+        try:
+            if self.event_queue is not None:
+                self.event_queue.shutdown(wait=True, timeout=self.drain_timeout)
+            self.handler.shutdown(wait=True)
+            if self.prefetcher is not None:
+                self.prefetcher.shutdown(wait=True)
+            if hasattr(self.calendar_pool, 'close'):
+                self.calendar_pool.close()
+        finally:
+            self.drained.set()
+
+    def callback(self):
+        """
+        LINEプラットフォームからのwebhookリクエストを処理するエンドポイント
+        """
+        # リクエストヘッダーから署名を検証
+        signature = request.headers['X-Line-Signature']
+
+        # リクエストボディを取得
+        body = request.get_data(as_text=True)
+        self.app.logger.info("Request body: " + body)
+        if self.capture_file:
+            self.capture_webhook(body)
+
+        if self.draining.is_set():
+            # 停止中は受け付けず、LINEプラットフォームに再送してもらう(再送は重複排除で1度だけ処理される)
+            abort(503)
+
+        # 非同期モードでは署名だけを検証し、処理はワーカーに任せてすぐに応答する
+        if self.event_queue is not None:
+            with metrics.span("webhook.verify_signature"):
+                valid = self.handler.parser.signature_validator.validate(body, signature)
+            if not valid:
+                self.app.logger.info("Invalid signature. Please check your channel secret.")
+                abort(400)
+            if not self.event_queue.submit(self.process_webhook, body, signature):
+                # キューが満杯の場合は503を返し、LINEプラットフォームに再送してもらう
+                self.app.logger.warning("Event queue is full. Rejecting webhook.")
+                abort(503)
+            return 'OK'
+
+        # 署名を検証し、リクエストを処理
+        try:
+            with metrics.span("webhook.handle"):
+                self.handler.handle(body, signature)
+        except InvalidSignatureError:
+            self.app.logger.info("Invalid signature. Please check your channel secret.")
+            abort(400)
+
+        return 'OK'
+
+    def healthz(self):
+        """
+        プロセスが応答できるかどうかを返すエンドポイント(liveness)
+        """
+        return jsonify(status="ok", pid=os.getpid())
+
+    def readyz(self):
+        """
+        リクエストを受け付けられるかどうかを返すエンドポイント(readiness)
+        ウォームアップが終わるまでと停止処理中は503を返す
+        """
+        ready = self.warmed_up.is_set() and not self.draining.is_set() and self.parser is not None
+        body = {
+            "status": "ready" if ready else "draining" if self.draining.is_set() else "not_ready",
+            "warmed_up": self.warmed_up.is_set(),
+            "checks": dict(self.warm_up_status),
+        }
+        if self.event_queue is not None:
+            body["queued"] = self.event_queue.qsize()
+        return jsonify(body), 200 if ready else 503
+
+    def metrics_endpoint(self):
+        """
+        Prometheus形式でメトリクスを出力するエンドポイント
+        """
+        return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    def capture_webhook(self, body):
+        "受け取ったwebhookを記録ファイルに追記する"
+        line = json.dumps({"t": time.time(), "body": body}, ensure_ascii=False)
+        try:
+            with self._capture_lock, open(self.capture_file, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        except OSError as e:
+            self.app.logger.warning(f"Failed to capture webhook: {e}")
+
+    def process_webhook(self, body, signature):
+        "ワーカースレッドでwebhookのイベントを処理する"
+        try:
+            self.handler.handle(body, signature)
+        except InvalidSignatureError:
+            self.app.logger.info("Invalid signature. Please check your channel secret.")
+
+    @metrics.timed("line.reply")
+    def send_reply(self, event, reply_text):
+        "イベントに返信する。リプライトークンが期限切れの場合はプッシュメッセージで送信する"
+        messages = [TextMessage(text=reply_text)]
+        token_age = time.time() - event.timestamp / 1000
+
+        with ApiClient(self.configuration) as api_client:
+            line_bot_api = MessagingApi(api_client)
+            if token_age < REPLY_TOKEN_TTL:
+                try:
+                    line_bot_api.reply_message(
+                        ReplyMessageRequest(reply_token=event.reply_token, messages=messages)
+                    )
+                    return
+                except ApiException as e:
+                    # 400はリプライトークンが無効(期限切れ・使用済み)であることを示す
+                    if e.status != 400:
+                        raise
+                    self.app.logger.warning(f"Reply token rejected, falling back to push: {e.reason}")
+
+            source = event.source
+            to = getattr(source, 'group_id', None) or getattr(source, 'room_id', None) or source.user_id
+            line_bot_api.push_message(PushMessageRequest(to=to, messages=messages))
+
+    def is_linked(self, user_id):
+        "ユーザーのGoogleカレンダーが連携済みかどうか"
+        return self.credential_store is None or self.credential_store.exists(user_id)
+
+    def acquire_calendar(self, user_id):
+        "ユーザーのカレンダーを操作するクライアントを借り出す"
+        if self.credential_store is not None:
+            return self.calendar_pool.acquire(user_id)
+        return self.calendar_pool.acquire()
+
+    @metrics.timed("calendar.create")
+    def handle_create(self, calendar_event, user_id, prefetch=None):
+        "イベント作成処理"
+        try:
+            if prefetch is not None and self.conflict_policy != 'off':
+                # 先読みが重なりの判定に使う日ごとのキャッシュを用意し終えるまで待つ
+                prefetch.index(calendar_event.start_time, calendar_event.end_time)
+            with self.acquire_calendar(user_id) as manager:
+                report = manager.check_conflicts(calendar_event)
+                if report is not None and report.has_conflicts and self.conflict_policy == 'block':
+                    return f"予定は登録していません。\n\n{report.describe()}\n\n時間を変えてもう一度送ってください。"
+                if manager.create_event(calendar_event) is None:
+                    return "すみません。カレンダーへの登録に失敗しました。"
+            start_time = calendar_event.start_time.strftime("%Y/%m/%d %H:%M")
+            reply_text = f"カレンダーに予定を登録しました。\n\nタイトル: {calendar_event.title}\n開始: {start_time}"
+            if report is not None and report.has_conflicts:
+                reply_text += f"\n\n{report.describe()}"
+            return reply_text
+        except UpstreamUnavailableError as e:
+            self.app.logger.warning(f"Upstream unavailable: {e}")
+            return BUSY_REPLY
+        except Exception as e:
+            self.app.logger.error(f"カレンダーへの登録中にエラー: {e}")
+            return "すみません。カレンダーへの登録中にエラーが発生しました。"
+
+    @metrics.timed("calendar.delete")
+    def handle_delete(self, search_info, user_id, prefetch=None):
+        "イベント削除処理"
+        try:
+            self.app.logger.info(f"handle_delete done using {search_info}")
+            time_min = datetime.datetime.fromisoformat(search_info["start_time"])
+            time_max = datetime.datetime.fromisoformat(search_info["end_time"])
+            # 先読みした期間に含まれていれば、その結果から候補を探す(見つからなければAPIで検索する)
+            events = prefetch.events(time_min, time_max, search_info["key_word"]) if prefetch is not None else None
+            with self.acquire_calendar(user_id) as manager:
+                if events is None:
+                    # 候補が2件見つかれば一意に特定できないと判断できるため、それ以上は読み込まない
+                    events = list(itertools.islice(
+                        manager.iter_events(
+                            start_time=time_min,
+                            end_time=time_max,
+                            query=search_info["key_word"],
+                            fields=("id", "summary", "start", "end"),
+                            page_size=10,
+                        ),
+                        2,
+                    ))
+
+                if not events:
+                    return f"「{search_info['key_word']}」に一致する予定が見当たりませんでした。"
+                elif len(events) > 1:
+                    # 複数見つかった場合は、ユーザーに選択を促す（今回は未実装）
+                    return "複数の予定が見つかりました。もう少し詳しく教えていただけますか？"
+                else:
+                    event_to_delete = events[0]
+                    event_id = event_to_delete["id"]
+                    event_title = event_to_delete.get("summary", "無題の予定")
+                    if manager.delete_event(event_id=event_id):
+                        return f"「{event_title}」の予定を削除しました。"
+                    else:
+                        return "予定の削除に失敗しました。"
+
+        except UpstreamUnavailableError as e:
+            self.app.logger.warning(f"Upstream unavailable: {e}")
+            return BUSY_REPLY
+        except Exception as e:
+            self.app.logger.error(f"イベント削除中にエラー: {e}")
+            return "予定の削除中にエラーが発生しました。"
+
+    @metrics.timed("calendar.read")
+    def handle_read(self, user_text, period_text, user_id, prefetch=None):
+        "予定の確認処理"
+        try:
+            query = resolve_read_query(user_text, hint=period_text)
+            index = prefetch.index(query.start, query.end) if prefetch is not None else None
+            if index is None:
+                with self.acquire_calendar(user_id) as manager:
+                    events = manager.iter_events(
+                        start_time=query.start,
+                        end_time=query.end,
+                        fields=("id", "summary", "start", "end", "transparency"),
+                    )
+                    index = IntervalIndex.from_events(events)
+            return render_agenda(index, query)
+        except UpstreamUnavailableError as e:
+            self.app.logger.warning(f"Upstream unavailable: {e}")
+            return BUSY_REPLY
+        except Exception as e:
+            self.app.logger.error(f"予定の確認中にエラー: {e}")
+            return "すみません。予定の確認中にエラーが発生しました。"
+
+    def process_message(self, user_text, user_id):
+        "メッセージを解析して処理し、返信テキストと処理の種類を返す"
+        prefetch = None
+
+        def start_prefetch():
+            # Geminiで解析する場合だけ、その間にテキストから推測した期間のカレンダーを先読みする
+            nonlocal prefetch
+            if self.prefetcher is not None and self.is_linked(user_id):
+                prefetch = self.prefetcher.start(user_text, lambda: self.acquire_calendar(user_id))
+
+        try:
+            try:
+                with metrics.span("parse"):
+                    parsed_result = self.parser.parse_event_text(user_text, before_gemini=start_prefetch)
+            except UpstreamUnavailableError as e:
+                self.app.logger.warning(f"Upstream unavailable: {e}")
+                return BUSY_REPLY, "unavailable"
+
+            if not parsed_result:
+                return "すみません、メッセージを理解できませんでした。", "unknown"
+
             action = parsed_result.action
-            if action == ActionType.CREATE:
-                reply_text = handle_create(parsed_result.event)
+            if action in (ActionType.CREATE, ActionType.DELETE, ActionType.READ) and not self.is_linked(user_id):
+                reply_text = "Googleカレンダーが連携されていません。管理者に連携を依頼してください。"
+            elif action == ActionType.CREATE:
+                reply_text = self.handle_create(parsed_result.event, user_id, prefetch)
             elif action == ActionType.DELETE:
-                reply_text = handle_delete(parsed_result.event)
+                reply_text = self.handle_delete(parsed_result.event, user_id, prefetch)
             elif action == ActionType.READ:
-                # TODO: 予定の読み取り機能を実装
-                reply_text = "すみません、予定の確認機能はまだ準備中です。"
+                reply_text = self.handle_read(user_text, parsed_result.original_text, user_id, prefetch)
             elif action == ActionType.TALK:
                 reply_text = parsed_result.original_text # 簡単なオウム返し
             else:
                 reply_text = "すみません、予期せぬエラーが発生しました。"
+            return reply_text, getattr(action, "value", action)
+        finally:
+            if prefetch is not None:
+                prefetch.discard()
+
+    def handle_message(self, event):
+        with metrics.trace("handle_message", event_id=event.webhook_event_id) as trace:
+            user_text = event.message.text
+            user_id = event.source.user_id
+            reply_text = ""
+
+            if not self.parser:
+                reply_text = "すみません、Genieの呼び出しに失敗しました。管理者に連絡してください。"
+            else:
+                try:
+                    reply_text, action = self.process_message(user_text, user_id)
+                except Exception:
+                    # 想定外のエラーでも、ユーザーには必ず返信する
+                    self.app.logger.exception("Failed to handle message")
+                    reply_text = "すみません、予期せぬエラーが発生しました。"
+                    action = "error"
+                metrics.inc("agenda_genie_actions_total", {"action": str(action)})
+                trace["action"] = action
+
+            self.send_reply(event, reply_text)
+
+
+def create_app(warm_in_background=True, start=True):
+    """
+    本番環境で使うアプリケーションを作成して返す（gunicornのエントリーポイント: "app:create_app()"）。
+
+    呼び出すたびに、環境変数から各コンポーネントを作成した新しいアプリケーションを返す。
+    コンポーネントは app.extensions["agenda_genie"] (AgendaGenie) から参照できる。
+
+    Args:
+        warm_in_background: ウォームアップを別のスレッドで行うかどうか。
+        start: Falseの場合はウォームアップと停止処理の登録を行わない（テストやベンチマークで使う）。
+
+    Raises:
+        ValueError: LINEの認証情報が環境変数に設定されていない場合。
+    """
+    # .envファイルから環境変数を読み込む
+    load_dotenv()
+
+    app = Flask(__name__)
+    genie = AgendaGenie(app)
+    app.extensions["agenda_genie"] = genie
+
+    app.add_url_rule("/callback", view_func=genie.callback, methods=['POST'])
+    app.add_url_rule("/healthz", view_func=genie.healthz, methods=['GET'])
+    app.add_url_rule("/readyz", view_func=genie.readyz, methods=['GET'])
+    app.add_url_rule("/metrics", view_func=genie.metrics_endpoint, methods=['GET'])
+
+    # WebhookHandlerは処理関数の引数の数で呼び出し方を決めるため、selfを含まない関数を登録する
+    @genie.handler.add(MessageEvent, message=TextMessageContent)
+    def handle_message(event):
+        genie.handle_message(event)
+
+    genie.register_metrics()
+    # TRACE_LOG=1の場合は、リクエストごとの各段階の所要時間を構造化ログとして出力する
+    if os.getenv('TRACE_LOG') == '1':
+        metrics.set_trace_sink(app.logger.info)
+
+    if start:
+        genie.start(warm_in_background)
+    return app
 
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        line_bot_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=event.reply_token, messages=[TextMessage(text=reply_text)]
-            )
-        )
 
 if __name__ == "__main__":
-    # ポート番号は環境変数'PORT'から取得、なければ8000をデフォルトとする
+    # 開発用のサーバー。本番環境では gunicorn -c gunicorn.conf.py "app:create_app()" で起動する
+    # リローダーはパーサーなどを2回作成するため使わない。デバッグモードはFLASK_DEBUG=1で有効にする
     port = int(os.environ.get('PORT', 8000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    create_app().run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_DEBUG') == '1', use_reloader=False)
@@ -0,0 +1,363 @@
+"""
+ベンチマーク用に、Gemini・Google Calendar・LINEの代わりをするローカルのスタブを定義するモジュール。
+
+Google CalendarとLINEはローカルで起動するHTTPサーバーとして実装し、
+本物のクライアントライブラリ(googleapiclient, line-bot-sdk)からHTTPで呼び出させます。
+Geminiはgenerate_contentを持つモデルオブジェクトとして差し替えます。
+いずれも応答の遅延とエラー率を設定できます。
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+import httplib2
+from google.api_core import exceptions as google_exceptions
+from googleapiclient.discovery import build_from_document
+
+
+@dataclass
+class LatencyProfile:
+    """
+    スタブの応答特性。
+
+    Attributes:
+        latency_ms: 平均応答時間（ミリ秒）。
+        jitter_ms: 応答時間のばらつき（ミリ秒、一様分布の幅の半分）。
+        error_rate: エラーを返す確率(0.0〜1.0)。
+    """
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    def wait(self) -> None:
+        """
+        設定された応答時間だけ待機します。
+        """
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def should_fail(self) -> bool:
+        """
+        今回の呼び出しをエラーにするかどうかを返します。
+        """
+        return random.random() < self.error_rate
+
+
+# --- Gemini ---------------------------------------------------------------
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    genai.GenerativeModelの代わりに、プロンプト中のユーザー入力から決まった形式のJSONを返すモデル。
+    """
+
+    _USER_TEXT_RE = re.compile(r"# ユーザー入力\s*\n(.*?)\n\s*# 出力", re.S)
+
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: Any, **kwargs: Any) -> _FakeResponse:
+        with self._lock:
+            self.calls += 1
+        self.profile.wait()
+        if self.profile.should_fail():
+            raise google_exceptions.ServiceUnavailable("fake gemini is unavailable")
+
+        match = self._USER_TEXT_RE.search(str(prompt))
+        user_text = match.group(1).strip() if match else str(prompt)[-40:]
+        # parse_manyのプロンプトでは、ユーザー入力がidとtextを持つ配列になっている
+        try:
+            inputs = json.loads(user_text)
+        except ValueError:
+            inputs = None
+        if isinstance(inputs, list):
+            payload: Any = [dict(self._result(item["text"]), id=item["id"]) for item in inputs]
+        else:
+            payload = self._result(user_text)
+        return _FakeResponse("```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```")
+
+    @staticmethod
+    def _result(user_text: str) -> Dict[str, Any]:
+        start = time.strftime("%Y-%m-%dT10:00", time.localtime(time.time() + 86400))
+        end = time.strftime("%Y-%m-%dT11:00", time.localtime(time.time() + 86400))
+        return {
+            "action": "create",
+            "event": {"title": user_text[:30], "start_time": start, "end_time": end, "description": ""},
+        }
+
+
+# --- 共通のHTTPサーバー -------------------------------------------------------
+
+class _StubServer:
+    """
+    バックグラウンドスレッドで動くローカルHTTPサーバーの基底クラス。
+    """
+
+    def __init__(self, handler_class: type, profile: LatencyProfile):
+        self.profile = profile
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self  # type: ignore[attr-defined]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "_StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, failed: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            if failed:
+                self.errors += 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書き込むため、Nagleアルゴリズムによる遅延を避ける
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    @property
+    def stub(self) -> Any:
+        return self.server.stub  # type: ignore[attr-defined]
+
+    def read_json(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else None
+
+    def send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate(self) -> bool:
+        """
+        遅延を入れ、エラーにする場合は503を返してTrueを返します。
+        """
+        self.stub.profile.wait()
+        failed = self.stub.profile.should_fail()
+        self.stub.count(failed)
+        if failed:
+            self.send_json(503, {"error": {"code": 503, "message": "Backend Error"}})
+        return failed
+
+
+# --- Google Calendar ------------------------------------------------------
+
+class _CalendarHandler(_StubHandler):
+    _EVENTS_RE = re.compile(r"^/calendar/v3/calendars/([^/]+)/events(?:/([^/?]+))?")
+
+    def _route(self) -> tuple[str | None, Dict[str, List[str]]]:
+        parsed = urllib.parse.urlparse(self.path)
+        match = self._EVENTS_RE.match(parsed.path)
+        if not match:
+            self.send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+            return None, {}
+        return match.group(2) or "", urllib.parse.parse_qs(parsed.query)
+
+    def do_POST(self) -> None:
+        event_id, _ = self._route()
+        body = self.read_json()
+        if event_id is None or self.simulate():
+            return
+        event = self.stub.insert(body)
+        if event is None:
+            self.send_json(409, {"error": {"code": 409, "message": "The requested identifier already exists."}})
+        else:
+            self.send_json(200, event)
+
+    def do_GET(self) -> None:
+        event_id, query = self._route()
+        if event_id is None or self.simulate():
+            return
+        self.send_json(200, self.stub.list(query))
+
+    def do_DELETE(self) -> None:
+        event_id, _ = self._route()
+        if not event_id or self.simulate():
+            return
+        if self.stub.delete(event_id):
+            self.send_json(204, None)
+        else:
+            self.send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+
+
+class FakeCalendarServer(_StubServer):
+    """
+    Calendar API v3のevents.insert/list/deleteだけを実装したローカルサーバー。
+    """
+
+    def __init__(self, profile: LatencyProfile):
+        super().__init__(_CalendarHandler, profile)
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+
+    def insert(self, body: Dict[str, Any]) -> Dict[str, Any] | None:
+        with self._lock:
+            event_id = body.get("id") or f"evt{next(self._ids)}"
+            if event_id in self.events:
+                return None
+            event = dict(body, id=event_id, status="confirmed")
+            self.events[event_id] = event
+            return event
+
+    def list(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        keyword = (query.get("q") or [""])[0]
+        page_size = int((query.get("maxResults") or ["250"])[0])
+        offset = int((query.get("pageToken") or ["0"])[0])
+        with self._lock:
+            items = [e for e in self.events.values() if keyword in e.get("summary", "")]
+        result: Dict[str, Any] = {"items": items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            result["nextPageToken"] = str(offset + page_size)
+        return result
+
+    def delete(self, event_id: str) -> bool:
+        with self._lock:
+            return self.events.pop(event_id, None) is not None
+
+    def discovery_document(self) -> Dict[str, Any]:
+        """
+        このサーバーを指す、Calendar API v3の最小限のディスカバリードキュメントを返します。
+        """
+        calendar_id = {"type": "string", "required": True, "location": "path"}
+        event_id = {"type": "string", "required": True, "location": "path"}
+        query = {"location": "query"}
+        return {
+            "kind": "discovery#restDescription",
+            "name": "calendar",
+            "version": "v3",
+            "rootUrl": self.url + "/",
+            "servicePath": "calendar/v3/",
+            "batchPath": "batch/calendar/v3",
+            "parameters": {"fields": {"type": "string", "location": "query"}},
+            "schemas": {
+                "Event": {"id": "Event", "type": "object"},
+                "Events": {"id": "Events", "type": "object"},
+            },
+            "resources": {
+                "events": {
+                    "methods": {
+                        "insert": {
+                            "id": "calendar.events.insert",
+                            "path": "calendars/{calendarId}/events",
+                            "httpMethod": "POST",
+                            "parameters": {"calendarId": calendar_id},
+                            "parameterOrder": ["calendarId"],
+                            "request": {"$ref": "Event"},
+                            "response": {"$ref": "Event"},
+                        },
+                        "list": {
+                            "id": "calendar.events.list",
+                            "path": "calendars/{calendarId}/events",
+                            "httpMethod": "GET",
+                            "parameters": {
+                                "calendarId": calendar_id,
+                                "timeMin": dict(query, type="string"),
+                                "timeMax": dict(query, type="string"),
+                                "q": dict(query, type="string"),
+                                "singleEvents": dict(query, type="boolean"),
+                                "showDeleted": dict(query, type="boolean"),
+                                "orderBy": dict(query, type="string"),
+                                "maxResults": dict(query, type="integer"),
+                                "pageToken": dict(query, type="string"),
+                                "syncToken": dict(query, type="string"),
+                            },
+                            "parameterOrder": ["calendarId"],
+                            "response": {"$ref": "Events"},
+                        },
+                        "delete": {
+                            "id": "calendar.events.delete",
+                            "path": "calendars/{calendarId}/events/{eventId}",
+                            "httpMethod": "DELETE",
+                            "parameters": {"calendarId": calendar_id, "eventId": event_id},
+                            "parameterOrder": ["calendarId", "eventId"],
+                        },
+                    }
+                }
+            },
+        }
+
+    def build_service(self) -> Any:
+        """
+        このサーバーに接続するCalendar APIサービスを構築します。
+        """
+        return build_from_document(self.discovery_document(), http=httplib2.Http())
+
+
+# --- LINE Messaging API ---------------------------------------------------
+
+class _LineHandler(_StubHandler):
+    def do_POST(self) -> None:
+        payload = self.read_json() or {}
+        if self.simulate():
+            return
+        if self.path.startswith("/v2/bot/message/"):
+            self.stub.record(self.path.rsplit("/", 1)[-1], payload)
+            self.send_json(200, {"sentMessages": [{"id": str(self.stub.requests), "quoteToken": "q"}]})
+        else:
+            self.send_json(404, {"message": "Not Found"})
+
+
+class FakeLineServer(_StubServer):
+    """
+    LINE Messaging APIのreply/pushエンドポイントだけを実装したローカルサーバー。
+    """
+
+    def __init__(self, profile: LatencyProfile):
+        super().__init__(_LineHandler, profile)
+        # 返信を受け取った時刻（リプライトークンごと）と回数。エンドツーエンドのレイテンシの計測に使う
+        self.replies: Dict[str, List[float]] = {}
+        # プッシュメッセージの宛先と受け取った時刻
+        self.pushes: List[tuple[str, float]] = []
+
+    def record(self, kind: str, payload: Dict[str, Any]) -> None:
+        """
+        送信に成功したメッセージを記録します。
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if kind == "reply":
+                self.replies.setdefault(payload.get("replyToken", ""), []).append(now)
+            elif kind == "push":
+                self.pushes.append((payload.get("to", ""), now))
+
+    def snapshot(self) -> tuple[Dict[str, List[float]], int]:
+        """
+        これまでに受け取った返信(リプライトークンごとの受信時刻)とプッシュメッセージの件数を返します。
+        """
+        with self._lock:
+            return {token: list(times) for token, times in self.replies.items()}, len(self.pushes)
@@ -0,0 +1,682 @@
+"""
+署名付きのwebhookを/callbackに送り、LINE Bot全体を負荷試験するツール。
+
+発話コーパスからLINEのテキストメッセージイベント(MessageEvent)を生成してX-Line-Signatureで署名し、
+目標のリクエストレート(オープンループ)または同時接続数(クローズドループ)で送信します。
+既定では、Gemini・Google Calendar・LINEをローカルのスタブに置き換えたapp.pyを同じプロセスで動かし、
+webhookの受信から返信がLINEのスタブに届くまでのエンドツーエンドのレイテンシを計測します。
+
+本番環境で記録したwebhook(app.pyのWEBHOOK_CAPTURE_FILE)を、元の間隔のまま再生することもできます。
+再生するボディはこのツールのチャネルシークレットで署名し直し、タイムスタンプ・リプライトークン・
+webhookEventIdを新しい値に置き換えます(同じイベントの再送は同じ値に置き換えるため、重複排除は再現されます)。
+
+使い方:
+    # 20 req/sで60秒間送信する
+    python -m benchmarks.loadgen --rps 20 --duration 60 --webhook-mode async
+    # 16並列で合計500回送信する
+    python -m benchmarks.loadgen --concurrency 16 --requests 500
+    # 記録したトラフィックを2倍速で再生する
+    python -m benchmarks.loadgen --replay captured.jsonl --speed 2
+    # 起動中のサーバーに送る(エンドツーエンドのレイテンシは計測できない)
+    python -m benchmarks.loadgen --url http://localhost:8000 --channel-secret "$LINE_CHANNEL_SECRET" --rps 5
+"""
+import argparse
+import contextlib
+import copy
+import datetime
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .run import (
+    CHANNEL_SECRET,
+    UTTERANCES_PATH,
+    BenchmarkEnvironment,
+    load_utterances,
+    message_event,
+    sign,
+    summarize,
+    webhook_body,
+)
+
+# /metricsから読み取るサーバー側のカウンター
+SERVER_METRIC_PREFIXES = ("agenda_genie_event_queue_", "agenda_genie_webhook_", "agenda_genie_prefetch_")
+QUEUE_DEPTH_METRIC = "agenda_genie_event_queue_queued"
+_GAUGE_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*) (\S+)$")
+
+
+def synthetic_bodies(
+    utterances: List[str], users: int, events_per_delivery: int, seed: int | None = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    コーパスの発話からwebhookのボディを無限に生成します。
+
+    Args:
+        utterances: 発話のリスト。
+        users: 送信元のユーザー数。
+        events_per_delivery: 1回のwebhookに含めるイベント数。
+        seed: 乱数のシード。
+
+    Yields:
+        webhookのボディ(辞書)。
+    """
+    rng = random.Random(seed)
+    while True:
+        events = [
+            message_event(rng.choice(utterances), f"U{rng.randrange(users):032x}")
+            for _ in range(events_per_delivery)
+        ]
+        yield json.loads(webhook_body(events))
+
+
+def load_capture(path: str | Path) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    記録したwebhookのファイルを読み込みます。
+
+    1行に1件、{"t": 受信時刻(UNIX時間), "body": ボディ(文字列またはオブジェクト)} の形式か、
+    webhookのボディのJSONそのものを書いたファイルを読み込めます。
+
+    Returns:
+        (最初のwebhookからの経過秒数, ボディ) のリスト。受信時刻の順に並べます。
+    """
+    records: List[Tuple[float | None, Dict[str, Any]]] = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                body = record.get("body", record)
+                if isinstance(body, str):
+                    body = json.loads(body)
+            except (json.JSONDecodeError, AttributeError) as e:
+                raise ValueError(f"{path}:{number}: webhookとして読み込めません: {e}") from e
+            if not isinstance(body, dict) or "events" not in body:
+                raise ValueError(f"{path}:{number}: eventsがありません")
+            records.append((record.get("t"), body))
+
+    # 受信時刻がない場合は、記録された順に間隔を空けずに送る
+    if any(t is None for t, _ in records):
+        return [(0.0, body) for _, body in records]
+    records.sort(key=lambda r: r[0])
+    start = records[0][0] if records else 0.0
+    return [(t - start, body) for t, body in records]
+
+
+def write_capture(path: str | Path, schedule: List[Tuple[float, Dict[str, Any]]]) -> None:
+    """
+    送信予定のwebhookを、load_captureで読み込める形式で保存します。
+    """
+    base = time.time()
+    with open(path, 'w', encoding='utf-8') as f:
+        for offset, body in schedule:
+            f.write(json.dumps({"t": base + offset, "body": body}, ensure_ascii=False) + "\n")
+
+
+def parse_gauges(text: str) -> Dict[str, float]:
+    """
+    Prometheus形式のメトリクスから、ラベルのない値を読み取ります。
+    """
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        match = _GAUGE_LINE.match(line)
+        if match:
+            try:
+                values[match.group(1)] = float(match.group(2))
+            except ValueError:
+                continue
+    return values
+
+
+class FlaskTarget:
+    """
+    同じプロセスで読み込んだFlaskアプリケーションにテストクライアントで送信します。
+    """
+
+    def __init__(self, flask_app: Any):
+        self.flask_app = flask_app
+        self._local = threading.local()
+
+    def _client(self) -> Any:
+        if not hasattr(self._local, "client"):
+            self._local.client = self.flask_app.test_client()
+        return self._local.client
+
+    def post(self, body: str, signature: str) -> int:
+        response = self._client().post(
+            "/callback", data=body, headers={"X-Line-Signature": signature, "Content-Type": "application/json"}
+        )
+        return response.status_code
+
+    def scrape(self) -> str:
+        return self._client().get("/metrics").get_data(as_text=True)
+
+
+class HttpTarget:
+    """
+    起動中のサーバーにHTTPで送信します。接続できなかった場合のステータスは0とします。
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def post(self, body: str, signature: str) -> int:
+        request = urllib.request.Request(
+            f"{self.url}/callback",
+            data=body.encode(),
+            headers={"X-Line-Signature": signature, "Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return 0
+
+    def scrape(self) -> str:
+        try:
+            with urllib.request.urlopen(f"{self.url}/metrics", timeout=self.timeout) as response:
+                return response.read().decode()
+        except OSError:
+            return ""
+
+
+class LoadGenerator:
+    """
+    webhookを予定どおりに送信し、応答・返信・再送を記録します。
+
+    オープンループでは、予定時刻からの経過時間をレイテンシとします。サーバーの応答が遅れても
+    送信の間隔は変わらないため、遅れた分もレイテンシに含まれます。
+    """
+
+    def __init__(
+        self,
+        target: Any,
+        channel_secret: str,
+        line: Any = None,
+        max_in_flight: int = 256,
+        redelivery_rate: float = 0.0,
+        redelivery_delay: float = 1.0,
+        redeliver_failed: bool = False,
+        max_redeliveries: int = 3,
+        seed: int | None = None,
+    ):
+        """
+        Args:
+            target: post(body, signature)とscrape()を持つ送信先。
+            channel_secret: 署名に使うチャネルシークレット。
+            line: 返信を記録するFakeLineServer。Noneの場合はエンドツーエンドのレイテンシを計測しない。
+            max_in_flight: 同時に送信中にできるwebhookの最大数(オープンループ)。
+            redelivery_rate: 受け付けられたwebhookを、LINEプラットフォームのように再送する確率。
+            redelivery_delay: 再送までの秒数。
+            redeliver_failed: 2xx以外の応答を受けたwebhookを再送するかどうか。
+            max_redeliveries: 1件のwebhookを再送する最大回数。
+            seed: 乱数のシード。
+        """
+        self.target = target
+        self.channel_secret = channel_secret
+        self.line = line
+        self.redelivery_rate = redelivery_rate
+        self.redelivery_delay = redelivery_delay
+        self.redeliver_failed = redeliver_failed
+        self.max_redeliveries = max_redeliveries
+        self._rng = random.Random(seed)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="loadgen")
+
+        # (予定時刻, 連番, ボディ, 再送の回数)
+        self._heap: List[Tuple[float, int, Dict[str, Any], int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._producers = 0
+
+        self._lock = threading.Lock()
+        self._ack_latencies: List[float] = []
+        self._statuses: Dict[str, int] = {}
+        self._errors = 0
+        self._sent = 0
+        self._redeliveries = 0
+        # webhookEventId -> {"reply_token", "sent_at", "accepted", "expects_reply"}
+        self._events: Dict[str, Dict[str, Any]] = {}
+        self._token_map: Dict[str, str] = {}
+        self._event_id_map: Dict[str, str] = {}
+        self._queue_samples: List[float] = []
+
+    # --- 送信 --------------------------------------------------------------
+
+    def run_open(self, schedule: List[Tuple[float, Dict[str, Any]]]) -> float:
+        """
+        (開始からの秒数, ボディ) の予定どおりに送信し、再送も含めてすべて終わるまで待ちます。
+
+        Returns:
+            送信にかかった秒数。
+        """
+        started = time.perf_counter()
+        with self._cond:
+            for offset, body in schedule:
+                heapq.heappush(self._heap, (started + offset, next(self._seq), body, 0))
+            self._cond.notify_all()
+        self._dispatch()
+        return time.perf_counter() - started
+
+    def run_closed(self, bodies: Iterator[Dict[str, Any]], concurrency: int) -> float:
+        """
+        concurrency個のスレッドから、応答を待って次のwebhookを送信します。
+
+        Returns:
+            送信にかかった秒数。
+        """
+        started = time.perf_counter()
+        bodies_lock = threading.Lock()
+
+        def worker() -> None:
+            try:
+                while True:
+                    with bodies_lock:
+                        body = next(bodies, None)
+                    if body is None:
+                        return
+                    self._send(time.perf_counter(), body, 0)
+            finally:
+                with self._cond:
+                    self._producers -= 1
+                    self._cond.notify_all()
+
+        with self._cond:
+            self._producers = concurrency
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        self._dispatch()
+        return time.perf_counter() - started
+
+    def _dispatch(self) -> None:
+        """
+        予定時刻になったwebhook(再送を含む)を送信します。送信すべきものがなくなると戻ります。
+        """
+        while True:
+            with self._cond:
+                if not self._heap:
+                    if self._in_flight == 0 and self._producers == 0:
+                        return
+                    self._cond.wait(0.1)
+                    continue
+                due = self._heap[0][0]
+                remaining = due - time.perf_counter()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                due, _, body, attempt = heapq.heappop(self._heap)
+                self._in_flight += 1
+            self._executor.submit(self._send_and_release, due, body, attempt)
+
+    def _send_and_release(self, due: float, body: Dict[str, Any], attempt: int) -> None:
+        try:
+            self._send(due, body, attempt)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _send(self, due: float, body: Dict[str, Any], attempt: int) -> None:
+        """
+        webhookを署名して送信し、結果を記録します。必要なら再送を予約します。
+        """
+        if attempt == 0:
+            body = self._prepare(body, due)
+        text = json.dumps(body, ensure_ascii=False)
+        try:
+            status = self.target.post(text, sign(text, self.channel_secret))
+        except Exception as e:
+            print(f"webhookの送信に失敗しました: {e}", file=sys.stderr)
+            status = 0
+        elapsed = time.perf_counter() - due
+        accepted = 200 <= status < 300
+
+        with self._lock:
+            self._sent += 1
+            self._ack_latencies.append(elapsed)
+            self._statuses[str(status)] = self._statuses.get(str(status), 0) + 1
+            if not accepted:
+                self._errors += 1
+            if attempt > 0:
+                self._redeliveries += 1
+            if accepted:
+                for event in body.get("events", []):
+                    tracked = self._events.get(event.get("webhookEventId"))
+                    if tracked is not None:
+                        tracked["accepted"] = True
+
+        if attempt >= self.max_redeliveries:
+            return
+        if (not accepted and self.redeliver_failed) or (accepted and self._rng.random() < self.redelivery_rate):
+            self._schedule_redelivery(body, attempt + 1)
+
+    def _schedule_redelivery(self, body: Dict[str, Any], attempt: int) -> None:
+        """
+        LINEプラットフォームと同じく、内容はそのままでisRedeliveryだけを変えて再送します。
+        """
+        redelivered = copy.deepcopy(body)
+        for event in redelivered.get("events", []):
+            event.setdefault("deliveryContext", {})["isRedelivery"] = True
+        with self._cond:
+            heapq.heappush(
+                self._heap, (time.perf_counter() + self.redelivery_delay, next(self._seq), redelivered, attempt)
+            )
+            self._cond.notify_all()
+
+    def _prepare(self, body: Dict[str, Any], due: float) -> Dict[str, Any]:
+        """
+        送信するボディのタイムスタンプ・リプライトークン・webhookEventIdを新しい値に置き換えます。
+
+        記録されたトラフィックに含まれる再送が同じ値になるよう、元の値ごとに置き換え先を覚えておきます。
+        """
+        body = copy.deepcopy(body)
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            for event in body.get("events", []):
+                event["timestamp"] = now_ms
+                if "replyToken" in event:
+                    event["replyToken"] = self._token_map.setdefault(event["replyToken"], uuid.uuid4().hex)
+                original_id = event.get("webhookEventId") or uuid.uuid4().hex
+                event_id = self._event_id_map.setdefault(original_id, uuid.uuid4().hex.upper())
+                event["webhookEventId"] = event_id
+                if event_id not in self._events:
+                    message = event.get("message") or {}
+                    self._events[event_id] = {
+                        "reply_token": event.get("replyToken"),
+                        "sent_at": due,
+                        "accepted": False,
+                        # 返信するのはテキストメッセージだけ
+                        "expects_reply": event.get("type") == "message" and message.get("type") == "text",
+                    }
+        return body
+
+    # --- 計測 --------------------------------------------------------------
+
+    def sample_queue_depth(self, stop: threading.Event, interval: float) -> None:
+        """
+        stopが設定されるまで、interval秒ごとにイベントキューの長さを記録します。
+        """
+        while not stop.wait(interval):
+            value = parse_gauges(self.target.scrape()).get(QUEUE_DEPTH_METRIC)
+            if value is not None:
+                with self._lock:
+                    self._queue_samples.append(value)
+
+    def wait_for_replies(self, timeout: float) -> None:
+        """
+        受け付けられたイベントへの返信がすべてLINEのスタブに届くまで、最大timeout秒待ちます。
+        """
+        if self.line is None:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                tokens = [
+                    e["reply_token"] for e in self._events.values() if e["accepted"] and e["expects_reply"]
+                ]
+            replies, _ = self.line.snapshot()
+            if all(token in replies for token in tokens):
+                return
+            time.sleep(0.1)
+
+    def report(self, wall: float) -> Dict[str, Any]:
+        """
+        送信・返信・キューの長さ・サーバーのカウンターをまとめます。
+        """
+        with self._lock:
+            deliveries = summarize(self._ack_latencies, self._errors, wall)
+            deliveries.update({
+                "sent": self._sent,
+                "redeliveries_sent": self._redeliveries,
+                "status": dict(sorted(self._statuses.items())),
+            })
+            events = list(self._events.values())
+            samples = list(self._queue_samples)
+
+        expected = [e for e in events if e["expects_reply"]]
+        result: Dict[str, Any] = {
+            "deliveries": deliveries,
+            "events": {
+                "total": len(events),
+                "expects_reply": len(expected),
+                # 再送を含めて1度も受け付けられなかったイベント
+                "rejected": sum(1 for e in expected if not e["accepted"]),
+            },
+            "queue_depth": {
+                "samples": len(samples),
+                "max": max(samples, default=0.0),
+                "mean": sum(samples) / len(samples) if samples else 0.0,
+            },
+            "server": {
+                name: value for name, value in parse_gauges(self.target.scrape()).items()
+                if name.startswith(SERVER_METRIC_PREFIXES)
+            },
+        }
+
+        if self.line is not None:
+            replies, pushes = self.line.snapshot()
+            e2e: List[float] = []
+            dropped = 0
+            duplicates = 0
+            for event in expected:
+                if not event["accepted"]:
+                    continue
+                times = replies.get(event["reply_token"])
+                if not times:
+                    dropped += 1
+                    continue
+                e2e.append(min(times) - event["sent_at"])
+                duplicates += len(times) - 1
+            e2e_stats = summarize(e2e, 0, wall)
+            e2e_stats.pop("errors")
+            e2e_stats.pop("error_rate")
+            result["events"].update({
+                "replied": len(e2e),
+                # 受け付けられたが返信が届かなかったイベント
+                "dropped": dropped,
+                # 同じイベントに2回以上返信したもの(重複排除の漏れ)
+                "duplicate_replies": duplicates,
+                # リプライトークンの期限切れなどでプッシュメッセージになった返信
+                "pushes": pushes,
+                "e2e": e2e_stats,
+            })
+        return result
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def build_schedule(args: argparse.Namespace) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    引数に応じて、(開始からの秒数, ボディ) の送信予定を作成します。
+    """
+    if args.replay:
+        schedule = load_capture(args.replay)
+        if args.concurrency:
+            return schedule
+        return [(offset / args.speed, body) for offset, body in schedule]
+
+    bodies = synthetic_bodies(load_utterances(args.corpus), args.users, args.events_per_delivery, args.seed)
+    if args.concurrency:
+        return [(0.0, next(bodies)) for _ in range(args.requests)]
+    count = max(1, int(args.rps * args.duration))
+    return [(i / args.rps, next(bodies)) for i in range(count)]
+
+
+def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    スタブを起動(または起動中のサーバーに接続)し、負荷をかけて結果を返します。
+    """
+    schedule = build_schedule(args)
+    if args.capture:
+        write_capture(args.capture, schedule)
+
+    env = None
+    if args.url:
+        target: Any = HttpTarget(args.url)
+        channel_secret = args.channel_secret or os.getenv("LINE_CHANNEL_SECRET") or CHANNEL_SECRET
+        line = None
+    else:
+        env = BenchmarkEnvironment(args)
+        target = FlaskTarget(env.app)
+        channel_secret = CHANNEL_SECRET
+        line = env.line
+
+    generator = LoadGenerator(
+        target,
+        channel_secret,
+        line=line,
+        max_in_flight=args.max_in_flight,
+        redelivery_rate=args.redelivery_rate,
+        redelivery_delay=args.redelivery_delay,
+        redeliver_failed=args.redeliver_failed,
+        seed=args.seed,
+    )
+    stop = threading.Event()
+    sampler = threading.Thread(
+        target=generator.sample_queue_depth, args=(stop, args.sample_interval), daemon=True
+    )
+    try:
+        # 計測中はアプリケーションやライブラリの出力を抑制する
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            sampler.start()
+            if args.concurrency:
+                wall = generator.run_closed(iter(body for _, body in schedule), args.concurrency)
+            else:
+                wall = generator.run_open(schedule)
+            generator.wait_for_replies(args.drain_timeout)
+            stop.set()
+            sampler.join()
+            result = generator.report(wall)
+    finally:
+        stop.set()
+        generator.close()
+        if env is not None:
+            env.close()
+
+    result["meta"] = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "target": args.url or "in-process",
+        "config": {
+            "mode": "closed" if args.concurrency else "replay" if args.replay else "open",
+            "rps": None if args.concurrency or args.replay else args.rps,
+            "duration": None if args.concurrency or args.replay else args.duration,
+            "concurrency": args.concurrency,
+            "replay": args.replay,
+            "speed": args.speed if args.replay else None,
+            "webhook_mode": args.webhook_mode,
+            "redelivery_rate": args.redelivery_rate,
+            "redeliver_failed": args.redeliver_failed,
+            "gemini_latency_ms": args.gemini_latency,
+            "calendar_latency_ms": args.calendar_latency,
+            "line_latency_ms": args.line_latency,
+            "error_rate": args.error_rate,
+        },
+    }
+    return result
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    deliveries = result["deliveries"]
+    events = result["events"]
+    print(
+        f"webhook   sent={deliveries['sent']} ({deliveries['throughput_rps']:.1f} req/s)  "
+        f"status={deliveries['status']}  error_rate={deliveries['error_rate']:.1%}  "
+        f"redeliveries={deliveries['redeliveries_sent']}"
+    )
+    print(
+        f"ack       p50={deliveries['p50_ms']:8.1f}ms p95={deliveries['p95_ms']:8.1f}ms "
+        f"p99={deliveries['p99_ms']:8.1f}ms"
+    )
+    if "e2e" in events:
+        e2e = events["e2e"]
+        print(
+            f"e2e       p50={e2e['p50_ms']:8.1f}ms p95={e2e['p95_ms']:8.1f}ms p99={e2e['p99_ms']:8.1f}ms"
+        )
+        print(
+            f"events    total={events['total']} replied={events['replied']} rejected={events['rejected']} "
+            f"dropped={events['dropped']} duplicate_replies={events['duplicate_replies']} "
+            f"pushes={events['pushes']}"
+        )
+    else:
+        print(f"events    total={events['total']} rejected={events['rejected']}")
+    queue = result["queue_depth"]
+    if queue["samples"]:
+        print(f"queue     max={queue['max']:g} mean={queue['mean']:.1f} ({queue['samples']} samples)")
+    for name, value in sorted(result["server"].items()):
+        print(f"  {name} {value:g}")
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="/callbackに署名付きのwebhookを送る負荷試験ツール")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rps", type=float, default=10.0, help="1秒あたりに送るwebhook数(オープンループ)")
+    load.add_argument("--concurrency", type=int, help="並列数。応答を待って次を送る(クローズドループ)")
+    parser.add_argument("--duration", type=float, default=30.0, help="送信を続ける秒数(--rps)")
+    parser.add_argument("--requests", type=int, default=200, help="送信するwebhookの合計数(--concurrency)")
+    parser.add_argument("--replay", help="再生する記録ファイル(JSONL)。--concurrencyを指定しない場合は元の間隔で送る")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生の速度の倍率")
+    parser.add_argument("--capture", help="送信予定のwebhookを、--replayで再生できる形式で保存するファイル")
+    parser.add_argument("--corpus", default=str(UTTERANCES_PATH), help="発話コーパスのファイル")
+    parser.add_argument("--users", type=int, default=50, help="送信元のユーザー数")
+    parser.add_argument("--events-per-delivery", type=int, default=1, help="1回のwebhookに含めるイベント数")
+    parser.add_argument("--redelivery-rate", type=float, default=0.0, help="受け付けられたwebhookを再送する確率")
+    parser.add_argument("--redelivery-delay", type=float, default=1.0, help="再送までの秒数")
+    parser.add_argument("--redeliver-failed", action="store_true", help="2xx以外の応答を受けたwebhookを再送する")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="同時に送信中にできるwebhookの最大数")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="送信の後、返信を待つ最大秒数")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="キューの長さを記録する間隔(秒)")
+    parser.add_argument("--seed", type=int, help="乱数のシード")
+    parser.add_argument("--url", help="起動中のサーバーのURL。省略した場合はスタブと同じプロセスで起動する")
+    parser.add_argument("--channel-secret", help="--urlのサーバーのチャネルシークレット")
+    parser.add_argument("--webhook-mode", choices=["sync", "async"], default="sync", help="app.pyのWEBHOOK_MODE")
+    parser.add_argument("--gemini-latency", type=float, default=800.0, help="Geminiスタブの平均応答時間(ms)")
+    parser.add_argument("--calendar-latency", type=float, default=120.0, help="Calendarスタブの平均応答時間(ms)")
+    parser.add_argument("--line-latency", type=float, default=50.0, help="LINEスタブの平均応答時間(ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="各スタブがエラーを返す確率")
+    parser.add_argument("--no-fast-path", action="store_true", help="ルールベースの高速解析を無効にする")
+    parser.add_argument("--no-cache", action="store_true", help="解析結果のキャッシュを無効にする")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    args = parser.parse_args(argv)
+    if args.rps <= 0 or args.speed <= 0:
+        parser.error("--rpsと--speedには正の値を指定してください。")
+    return args
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    try:
+        result = run_load(args)
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を {args.output} に保存しました。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
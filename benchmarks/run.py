@@ -0,0 +1,362 @@
+"""
+Gemini・Google Calendar・LINEをローカルのスタブに置き換えて性能を測定するベンチマーク。
+
+本物のGeminiParser、GoogleCalendarManager(CalendarClientPool経由)、app.pyのwebhookハンドラーを
+同時実行ユーザー数ごとに呼び出し、段階ごとのレイテンシ(p50/p95/p99)とスループットを計測します。
+結果はJSONで保存し、過去の結果と比較して性能の劣化を検出できます。
+
+使い方:
+    python -m benchmarks.run --users 1,8,32 --iterations 20 --output bench.json
+    python -m benchmarks.run --baseline bench_before.json --output bench_after.json
+"""
+import argparse
+import base64
+import contextlib
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from .fakes import FakeCalendarServer, FakeGeminiModel, FakeLineServer, LatencyProfile
+
+CHANNEL_SECRET = "benchmark-channel-secret"
+UTTERANCES_PATH = Path(__file__).parent / "utterances.txt"
+
+
+def load_utterances(path: str | Path = UTTERANCES_PATH) -> List[str]:
+    """
+    1行1発話のコーパスファイルを読み込みます。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def sign(body: str, channel_secret: str = CHANNEL_SECRET) -> str:
+    """
+    LINEプラットフォームと同じ方法でX-Line-Signatureを計算します。
+    """
+    digest = hmac.new(channel_secret.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def message_event(text: str, user_id: str, redelivery: bool = False, event_id: str | None = None) -> Dict[str, Any]:
+    """
+    LINEのテキストメッセージイベント(MessageEvent)のペイロードを生成します。
+    """
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": event_id or uuid.uuid4().hex.upper(),
+        "deliveryContext": {"isRedelivery": redelivery},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"id": str(uuid.uuid4().int)[:18], "type": "text", "quoteToken": uuid.uuid4().hex, "text": text},
+    }
+
+
+def webhook_body(events: List[Dict[str, Any]]) -> str:
+    """
+    webhookのリクエストボディを生成します。
+    """
+    return json.dumps({"destination": "Ubenchmark", "events": events}, ensure_ascii=False)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    ソート済みの値から最近順位法でパーセンタイルを求めます。
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> Dict[str, float]:
+    """
+    レイテンシ(秒)のリストから統計値(ミリ秒)を求めます。
+    """
+    values = sorted(v * 1000 for v in latencies)
+    count = len(values)
+    return {
+        "count": count,
+        "errors": errors,
+        "error_rate": errors / count if count else 0.0,
+        "mean_ms": sum(values) / count if count else 0.0,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "throughput_rps": count / wall if wall > 0 else 0.0,
+    }
+
+
+def run_stage(users: int, iterations: int, operation: Callable[[int, int], bool]) -> Dict[str, float]:
+    """
+    users個のスレッドからoperationをiterations回ずつ呼び出し、統計値を返します。
+
+    Args:
+        users: 同時実行ユーザー数。
+        iterations: ユーザー1人あたりの呼び出し回数。
+        operation: (ユーザー番号, 回数) を受け取り、成功した場合にTrueを返す関数。
+    """
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(user: int) -> None:
+        nonlocal errors
+        for i in range(iterations):
+            started = time.perf_counter()
+            try:
+                ok = operation(user, i)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(worker, range(users)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+class BenchmarkEnvironment:
+    """
+    スタブのサーバーを起動し、app.pyをそれらに接続した状態で読み込みます。
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.gemini_profile = LatencyProfile(args.gemini_latency, args.gemini_latency * 0.2, args.error_rate)
+        self.calendar = FakeCalendarServer(
+            LatencyProfile(args.calendar_latency, args.calendar_latency * 0.2, args.error_rate)
+        ).start()
+        self.line = FakeLineServer(
+            LatencyProfile(args.line_latency, args.line_latency * 0.2, args.error_rate)
+        ).start()
+
+        # 本物のサービスに接続しないよう、app.pyを読み込む前に環境変数を上書きする
+        os.environ.update({
+            "LINE_CHANNEL_SECRET": CHANNEL_SECRET,
+            "LINE_CHANNEL_ACCESS_TOKEN": "benchmark-access-token",
+            "GEMINI_API_KEY": "benchmark-api-key",
+            "WEBHOOK_MODE": getattr(args, "webhook_mode", "sync"),
+            # レート制限の待ち時間ではなくアプリケーションの性能を計測する
+            "GEMINI_RATE_LIMIT": "0",
+            "CALENDAR_RATE_LIMIT": "0",
+        })
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        import app as app_module
+        from agenda_genie.calendar_pool import CalendarClientPool
+
+        # ウォームアップは本物のGoogle Calendarに接続するため行わない
+        self.app = app_module.create_app(start=False)
+        self.genie = self.app.extensions["agenda_genie"]
+        if self.genie.parser is None:
+            raise RuntimeError("GeminiParserを初期化できませんでした。")
+        self.app_module = app_module
+        self.app.logger.setLevel(logging.CRITICAL)
+        self.parser = self.genie.parser
+        self.parser.model = FakeGeminiModel(self.gemini_profile)
+        if args.no_fast_path:
+            self.parser.fast_parser = None
+        if args.no_cache:
+            self.parser.cache = None
+
+        self.pool = CalendarClientPool(service_factory=self.calendar.build_service)
+        self.genie.calendar_pool = self.pool
+
+        line_url = self.line.url
+
+        class LocalMessagingApi(app_module.MessagingApi):
+            def __init__(self, api_client: Any = None):
+                super().__init__(api_client)
+                self.line_base_path = line_url
+
+        app_module.MessagingApi = LocalMessagingApi
+
+    def close(self) -> None:
+        self.calendar.stop()
+        self.line.stop()
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    同時実行ユーザー数ごとに各段階のベンチマークを実行します。
+    """
+    from agenda_genie.schemas import CalendarEvent
+
+    env = BenchmarkEnvironment(args)
+    utterances = load_utterances(args.corpus)
+    flask_app = env.app
+    clients = threading.local()
+
+    def parse(user: int, i: int) -> bool:
+        text = utterances[(user + i) % len(utterances)]
+        return env.parser.parse_event_text(text) is not None
+
+    def create(user: int, i: int) -> bool:
+        start = datetime.datetime(2030, 1, 1, 9) + datetime.timedelta(hours=user * 100 + i)
+        event = CalendarEvent(f"bench-{user}-{i}", start, start + datetime.timedelta(hours=1))
+        with env.pool.acquire() as manager:
+            return manager.create_event(event) is not None
+
+    def search(user: int, i: int) -> bool:
+        start = datetime.datetime(2030, 1, 1)
+        with env.pool.acquire() as manager:
+            manager.search_events(start, start + datetime.timedelta(days=30), query=f"bench-{user}-{i}")
+        return True
+
+    def delete(user: int, i: int) -> bool:
+        start = datetime.datetime(2030, 1, 1)
+        with env.pool.acquire() as manager:
+            events = manager.search_events(start, start + datetime.timedelta(days=30), query=f"bench-{user}-{i}")
+            return bool(events) and manager.delete_event(events[0]["id"])
+
+    def webhook(user: int, i: int) -> bool:
+        if not hasattr(clients, "client"):
+            clients.client = flask_app.test_client()
+        text = utterances[(user * 7 + i) % len(utterances)]
+        body = webhook_body([message_event(text, f"U{user:032x}")])
+        response = clients.client.post(
+            "/callback", data=body, headers={"X-Line-Signature": sign(body), "Content-Type": "application/json"}
+        )
+        return response.status_code == 200
+
+    stages = [
+        ("parse", parse),
+        ("calendar.create", create),
+        ("calendar.search", search),
+        ("calendar.delete", delete),
+        ("webhook", webhook),
+    ]
+
+    runs = []
+    try:
+        for users in args.users:
+            print(f"--- 同時実行ユーザー数: {users} ---")
+            run: Dict[str, Any] = {"users": users, "stages": {}}
+            for name, operation in stages:
+                if env.parser.cache is not None:
+                    env.parser.cache.clear()
+                # 計測中はアプリケーションやライブラリの出力を抑制する
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    stats = run_stage(users, args.iterations, operation)
+                run["stages"][name] = stats
+                print(
+                    f"{name:16s} p50={stats['p50_ms']:8.1f}ms p95={stats['p95_ms']:8.1f}ms "
+                    f"p99={stats['p99_ms']:8.1f}ms  {stats['throughput_rps']:7.1f} req/s  "
+                    f"errors={stats['errors']}"
+                )
+            runs.append(run)
+    finally:
+        env.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "config": {
+                "users": args.users,
+                "iterations": args.iterations,
+                "gemini_latency_ms": args.gemini_latency,
+                "calendar_latency_ms": args.calendar_latency,
+                "line_latency_ms": args.line_latency,
+                "error_rate": args.error_rate,
+                "fast_path": not args.no_fast_path,
+                "cache": not args.no_cache,
+            },
+        },
+        "runs": runs,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> bool:
+    """
+    同じユーザー数・段階のp95を比較し、threshold(割合)を超えて悪化したものを表示します。
+
+    Returns:
+        劣化が見つからなかった場合はTrue。
+    """
+    base_runs = {run["users"]: run["stages"] for run in baseline.get("runs", [])}
+    ok = True
+    print(f"\n--- ベースライン({baseline['meta'].get('git_commit', '?')[:8]})との比較 (p95) ---")
+    for run in current["runs"]:
+        base_stages = base_runs.get(run["users"])
+        if base_stages is None:
+            continue
+        for name, stats in run["stages"].items():
+            base = base_stages.get(name)
+            if base is None or base["p95_ms"] <= 0:
+                continue
+            change = stats["p95_ms"] / base["p95_ms"] - 1
+            regressed = change > threshold
+            ok = ok and not regressed
+            mark = "  << 劣化" if regressed else ""
+            print(
+                f"users={run['users']:<4d} {name:16s} {base['p95_ms']:8.1f}ms -> "
+                f"{stats['p95_ms']:8.1f}ms ({change:+.1%}){mark}"
+            )
+    return ok
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Agenda Genieのオフラインベンチマーク")
+    parser.add_argument("--users", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 32],
+                        help="同時実行ユーザー数(カンマ区切り)")
+    parser.add_argument("--iterations", type=int, default=20, help="ユーザー1人あたりの呼び出し回数")
+    parser.add_argument("--gemini-latency", type=float, default=800.0, help="Geminiスタブの平均応答時間(ms)")
+    parser.add_argument("--calendar-latency", type=float, default=120.0, help="Calendarスタブの平均応答時間(ms)")
+    parser.add_argument("--line-latency", type=float, default=50.0, help="LINEスタブの平均応答時間(ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="各スタブがエラーを返す確率")
+    parser.add_argument("--corpus", default=str(UTTERANCES_PATH), help="発話コーパスのファイル")
+    parser.add_argument("--no-fast-path", action="store_true", help="ルールベースの高速解析を無効にする")
+    parser.add_argument("--no-cache", action="store_true", help="解析結果のキャッシュを無効にする")
+    parser.add_argument("--output", default="benchmark_results.json", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較対象とする過去の結果(JSON)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="劣化とみなすp95の悪化率")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    result = run_benchmark(args)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を {args.output} に保存しました。")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(baseline, result, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+本番環境でapp.pyを動かすためのgunicornの設定。
+
+    gunicorn -c gunicorn.conf.py "app:create_app()"
+
+処理時間のほとんどはGemini・Google Calendar・LINEの応答待ちのため、CPUコア数のワーカープロセスに
+それぞれ多めのスレッドを持たせるgthreadワーカーを使います。
+
+読み込みに時間のかかるライブラリは、この設定ファイルを読み込むマスタープロセスで1度だけ読み込み、
+forkしたワーカーで共有します。パーサーやクライアントプールはスレッドやSQLite・HTTPのコネクションを
+持つため、forkの後に各ワーカーで1度だけ作成します(preload_appは使いません)。
+"""
+import multiprocessing
+import os
+
+# ワーカーで共有するため、マスタープロセスで読み込んでおく
+import google.generativeai  # noqa: F401
+import googleapiclient.discovery  # noqa: F401
+import linebot.v3.messaging  # noqa: F401
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# ワーカーの数はCPUコア数、1ワーカーあたりのスレッド数は応答待ちの間に並行して処理できるリクエスト数
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+# Geminiの応答と再試行を待てるよう、既定の30秒より長くする
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+# 停止時に、処理中のリクエストとキューに積まれたイベントを処理し終えるまで待つ秒数。
+# この時間を過ぎるとワーカーは強制終了されるため、キューの処理を待つ時間(DRAIN_TIMEOUT)はこれより短くする
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+os.environ.setdefault('DRAIN_TIMEOUT', str(max(1, graceful_timeout - 10)))
+# SIGTERMを受け取ってからリスナーを閉じるまでの秒数。その間は/readyzがdrainingを報告し、webhookには503を返す
+shutdown_delay = float(os.getenv('GUNICORN_SHUTDOWN_DELAY', 5))
+keepalive = 5
+
+# メモリの断片化を避けるため、一定数のリクエストを処理したワーカーを入れ替える
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+
+def post_worker_init(worker):
+    """
+    SIGTERMを受け取った時点で、キューに積まれたイベントの処理を始める。
+
+    worker_exitは処理中のリクエストをgraceful_timeoutまで待った後に呼ばれるため、そこから始めると
+    キューの処理が強制終了で打ち切られる。また、gunicornはSIGTERMですぐにリスナーを閉じるため、
+    shutdown_delay秒だけ遅らせて/readyzがdrainingを報告できるようにする。
+    """
+    import signal
+    import threading
+
+    # worker.wsgiはcreate_app()が返したアプリケーション
+    genie = worker.wsgi.extensions["agenda_genie"]
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        # シグナルハンドラーはワーカーのメインループで動くため、停止処理は別のスレッドで行う
+        threading.Thread(target=genie.shutdown, name="drain", daemon=True).start()
+        threading.Timer(shutdown_delay, handle_exit, (signum, frame)).start()
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """
+    ワーカーの終了時に、SIGTERMで始めたキューの処理が終わるのを待つ(始まっていなければここで処理する)。
+    """
+    worker.wsgi.extensions["agenda_genie"].shutdown()
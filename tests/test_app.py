@@ -0,0 +1,44 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def line_env(monkeypatch):
+    monkeypatch.setenv("LINE_CHANNEL_SECRET", "secret")
+    monkeypatch.setenv("LINE_CHANNEL_ACCESS_TOKEN", "token")
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setattr(app_module, "load_dotenv", lambda: None)
+
+
+def test_create_app_requires_line_credentials(line_env, monkeypatch):
+    monkeypatch.delenv("LINE_CHANNEL_SECRET")
+
+    with pytest.raises(ValueError):
+        app_module.create_app(start=False)
+
+
+def test_create_app_builds_independent_components(line_env):
+    first = app_module.create_app(start=False)
+    second = app_module.create_app(start=False)
+
+    first_genie, second_genie = first.extensions["agenda_genie"], second.extensions["agenda_genie"]
+    assert first_genie.parser is not second_genie.parser
+    assert first_genie.calendar_pool is not second_genie.calendar_pool
+    assert first_genie.handler is not second_genie.handler
+
+
+def test_draining_app_rejects_webhooks_and_reports_not_ready(line_env):
+    flask_app = app_module.create_app(start=False)
+    genie = flask_app.extensions["agenda_genie"]
+    client = flask_app.test_client()
+
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/readyz").status_code == 503
+    genie.warm_up_status["calendar"] = "ok"
+    genie.warmed_up.set()
+    assert client.get("/readyz").status_code == 200
+
+    genie.shutdown()
+    assert client.get("/readyz").get_json()["status"] == "draining"
+    assert client.post("/callback", data="{}", headers={"X-Line-Signature": "x"}).status_code == 503
@@ -0,0 +1,34 @@
+import datetime
+
+from agenda_genie.calendar_mirror import CalendarMirror
+
+START = datetime.datetime(2026, 10, 18)
+END = datetime.datetime(2026, 10, 19)
+
+
+def event(event_id, summary, description=None, hour=10):
+    return {
+        "id": event_id,
+        "summary": summary,
+        "description": description,
+        "start": {"dateTime": f"2026-10-18T{hour:02d}:00:00+09:00"},
+        "end": {"dateTime": f"2026-10-18T{hour + 1:02d}:00:00+09:00"},
+    }
+
+
+def test_search_matches_summary_and_description():
+    mirror = CalendarMirror()
+    mirror.upsert(event("a", "打ち合わせ", "会議室A"))
+    mirror.upsert(event("b", "ランチ", hour=12))
+
+    assert [e["id"] for e in mirror.search(START, END, "会議室")] == ["a"]
+    assert [e["id"] for e in mirror.search(START, END, "ランチ")] == ["b"]
+    assert [e["id"] for e in mirror.search(START, END)] == ["a", "b"]
+
+
+def test_null_summary_and_description_are_not_indexed_as_text():
+    mirror = CalendarMirror()
+    mirror.upsert(event("a", None, None))
+    mirror.upsert(event("b", "打ち合わせ", None, hour=12))
+
+    assert mirror.search(START, END, "none") == []
@@ -0,0 +1,59 @@
+import datetime
+import gc
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from agenda_genie.calendar_pool import MultiTenantCalendarPool
+from agenda_genie.credential_store import CredentialStore
+
+
+def make_creds(token, expiry):
+    return Credentials(
+        token=token,
+        refresh_token="refresh",
+        client_id="client",
+        client_secret="secret",
+        expiry=expiry,
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CredentialStore(tmp_path / "credentials.db")
+    store.save("user", make_creds("old", datetime.datetime.utcnow() + datetime.timedelta(minutes=30)))
+    return store
+
+
+def test_record_refresh_saves_newer_token(store):
+    store.record_refresh("user", make_creds("new", datetime.datetime.utcnow() + datetime.timedelta(hours=1)))
+
+    assert store.get("user").token == "new"
+    assert store.stats()["refreshes"] == 1
+
+
+def test_record_refresh_keeps_newer_stored_token(store):
+    store.record_refresh("user", make_creds("stale", datetime.datetime.utcnow() - datetime.timedelta(hours=1)))
+
+    assert store.get("user").token == "old"
+    assert store.stats()["refreshes"] == 0
+
+
+def test_refresh_locks_are_released(store):
+    for i in range(100):
+        with store._refresh_lock(f"user{i}"):
+            pass
+    gc.collect()
+
+    assert len(store._refresh_locks) == 0
+
+
+def test_pool_saves_credentials_refreshed_during_a_call(store):
+    pool = MultiTenantCalendarPool(store, service_factory=lambda creds: object())
+
+    with pool.acquire("user"):
+        # API呼び出しの401でgoogle-authが更新した状態を再現する
+        pool._tenant("user").creds.token = "refreshed"
+        pool._tenant("user").creds.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    assert store.get("user").token == "refreshed"
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from agenda_genie.dedupe import EventDeduplicator, SQLiteEventDeduplicator
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_dedupe(request, tmp_path):
+    def factory(**kwargs):
+        kwargs.setdefault("poll_interval", 0.01)
+        if request.param == "memory":
+            return EventDeduplicator(**kwargs)
+        return SQLiteEventDeduplicator(tmp_path / "dedupe.db", **kwargs)
+    return factory
+
+
+def run_in_background(dedupe, event_id, results):
+    def target():
+        with dedupe.process(event_id) as fresh:
+            results.append(fresh)
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_processes_an_event_once(make_dedupe):
+    dedupe = make_dedupe()
+    with dedupe.process("e1") as fresh:
+        assert fresh
+    with dedupe.process("e1") as fresh:
+        assert not fresh
+
+    stats = dedupe.stats()
+    assert stats["processed"] == 1
+    assert stats["duplicates"] == 1
+
+
+def test_events_without_id_are_always_processed(make_dedupe):
+    dedupe = make_dedupe()
+    for _ in range(2):
+        with dedupe.process(None) as fresh:
+            assert fresh
+    assert dedupe.stats()["processed"] == 0
+
+
+def test_failed_processing_is_released_for_redelivery(make_dedupe):
+    dedupe = make_dedupe()
+    with pytest.raises(RuntimeError):
+        with dedupe.process("e1") as fresh:
+            assert fresh
+            raise RuntimeError("boom")
+
+    with dedupe.process("e1") as fresh:
+        assert fresh
+
+
+def test_redelivery_waits_for_in_flight_processing(make_dedupe):
+    dedupe = make_dedupe()
+    results = []
+    with dedupe.process("e1") as fresh:
+        assert fresh
+        thread = run_in_background(dedupe, "e1", results)
+        wait_until(lambda: dedupe.stats()["waits"] == 1)
+        # 最初の処理が終わるまでは判定しない
+        assert results == []
+    thread.join()
+
+    assert results == [False]
+    assert dedupe.stats()["duplicates"] == 1
+
+
+def test_redelivery_takes_over_when_in_flight_processing_fails(make_dedupe):
+    dedupe = make_dedupe()
+    results = []
+    with pytest.raises(RuntimeError):
+        with dedupe.process("e1"):
+            thread = run_in_background(dedupe, "e1", results)
+            wait_until(lambda: dedupe.stats()["waits"] == 1)
+            raise RuntimeError("boom")
+    thread.join()
+
+    assert results == [True]
+    assert dedupe.stats()["processed"] == 1
+
+
+def test_redelivery_gives_up_after_wait_timeout(make_dedupe):
+    dedupe = make_dedupe(wait_timeout=0.05)
+    with dedupe.process("e1"):
+        with dedupe.process("e1") as fresh:
+            assert not fresh
+
+    assert dedupe.stats()["timeouts"] == 1
+
+
+def test_expired_lease_can_be_taken_over(make_dedupe):
+    dedupe = make_dedupe(lease=0.05)
+    with dedupe.process("e1"):
+        time.sleep(0.06)
+        # 処理していたスレッドが失われたものとみなして引き継ぐ
+        with dedupe.process("e1") as fresh:
+            assert fresh
+
+
+def test_forgets_oldest_processed_events_beyond_max_entries(make_dedupe):
+    dedupe = make_dedupe(max_entries=2)
+    for event_id in ("e1", "e2", "e3"):
+        with dedupe.process(event_id):
+            pass
+
+    assert dedupe.stats()["entries"] == 2
+    with dedupe.process("e1") as fresh:
+        assert fresh
+    with dedupe.process("e3") as fresh:
+        assert not fresh
+
+
+def test_sqlite_dedupe_is_shared_between_instances(tmp_path):
+    first = SQLiteEventDeduplicator(tmp_path / "dedupe.db")
+    second = SQLiteEventDeduplicator(tmp_path / "dedupe.db")
+    with first.process("e1"):
+        pass
+
+    with second.process("e1") as fresh:
+        assert not fresh
@@ -0,0 +1,129 @@
+import datetime
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from agenda_genie.google_calendar import GoogleCalendarManager, _is_retryable, save_credentials
+from agenda_genie.resilience import Upstream
+
+
+def http_error(status, content=b""):
+    return HttpError(httplib2.Response({"status": status}), content)
+
+
+def legacy_error(reason):
+    return json.dumps(
+        {"error": {"code": 403, "message": "Rate Limit Exceeded", "errors": [{"domain": "usageLimits", "reason": reason}]}}
+    ).encode()
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_transient_statuses_are_retryable(status):
+    assert _is_retryable(http_error(status))
+
+
+@pytest.mark.parametrize("reason", ["rateLimitExceeded", "userRateLimitExceeded", "RATELIMITEXCEEDED"])
+def test_rate_limited_403_is_retryable(reason):
+    assert _is_retryable(http_error(403, legacy_error(reason)))
+
+
+def test_rate_limited_403_in_error_details_is_retryable():
+    content = json.dumps(
+        {"error": {"code": 403, "details": [{"@type": "type.googleapis.com/google.rpc.ErrorInfo", "reason": "RATE_LIMIT_EXCEEDED"}]}}
+    ).encode()
+
+    assert _is_retryable(http_error(403, content))
+
+
+@pytest.mark.parametrize(
+    "status, content",
+    [
+        (403, legacy_error("forbidden")),
+        (403, legacy_error("quotaExceeded")),
+        (403, b"not json"),
+        (403, b""),
+        (400, legacy_error("rateLimitExceeded")),
+        (404, b""),
+    ],
+)
+def test_other_errors_are_not_retryable(status, content):
+    assert not _is_retryable(http_error(status, content))
+
+
+def test_connection_errors_are_retryable():
+    assert _is_retryable(ConnectionError())
+    assert _is_retryable(TimeoutError())
+    assert not _is_retryable(ValueError())
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class FakeService:
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    def events(self):
+        return self
+
+    def list(self, **params):
+        return FakeRequest(self.pages.pop(0))
+
+
+def make_manager(pages):
+    return GoogleCalendarManager(service=FakeService(pages), upstream=Upstream("test", max_retries=0))
+
+
+def test_iter_events_returns_nothing_when_first_page_fails():
+    manager = make_manager([http_error(404)])
+
+    assert list(manager.iter_events(datetime.datetime(2026, 10, 18), datetime.datetime(2026, 10, 19))) == []
+
+
+def test_iter_events_raises_when_a_later_page_fails():
+    manager = make_manager([{"items": [{"id": "a"}], "nextPageToken": "p2"}, http_error(404)])
+    events = manager.iter_events(datetime.datetime(2026, 10, 18), datetime.datetime(2026, 10, 19))
+
+    assert next(events) == {"id": "a"}
+    with pytest.raises(HttpError):
+        next(events)
+
+
+class FakeCredentials:
+    def __init__(self, content):
+        self.content = content
+
+    def to_json(self):
+        if isinstance(self.content, Exception):
+            raise self.content
+        return self.content
+
+
+def test_save_credentials_replaces_token_file(tmp_path):
+    token_file = tmp_path / "token.json"
+    token_file.write_text('{"token": "old"}')
+
+    save_credentials(FakeCredentials('{"token": "new"}'), str(token_file))
+
+    assert token_file.read_text() == '{"token": "new"}'
+    assert [p.name for p in tmp_path.iterdir()] == ["token.json"]
+
+
+def test_save_credentials_keeps_old_token_when_write_fails(tmp_path):
+    token_file = tmp_path / "token.json"
+    token_file.write_text('{"token": "old"}')
+
+    with pytest.raises(ValueError):
+        save_credentials(FakeCredentials(ValueError("broken")), str(token_file))
+
+    assert token_file.read_text() == '{"token": "old"}'
+    assert [p.name for p in tmp_path.iterdir()] == ["token.json"]
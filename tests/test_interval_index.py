@@ -0,0 +1,125 @@
+import datetime
+import random
+
+import pytest
+
+from agenda_genie.interval_index import Interval, IntervalIndex, free_gaps
+from agenda_genie.time_utils import localize
+
+DAY = localize(datetime.datetime(2026, 10, 18))
+
+
+def at(hour, minute=0):
+    return DAY + datetime.timedelta(hours=hour, minutes=minute)
+
+
+def interval(key, start, end, busy=True):
+    return Interval(start=start, end=end, key=key, busy=busy)
+
+
+def event(event_id, start, end, **fields):
+    return dict({"id": event_id, "start": start, "end": end}, **fields)
+
+
+def brute_force(intervals, start, end):
+    return sorted(
+        (i for i in intervals if i.start < end and i.end > start),
+        key=lambda i: (i.start, i.key),
+    )
+
+
+def random_intervals(rng, count):
+    intervals = []
+    for n in range(count):
+        start = at(0) + datetime.timedelta(minutes=rng.randrange(0, 7 * 24 * 60, 15))
+        length = datetime.timedelta(minutes=rng.choice([15, 30, 60, 120, 24 * 60, 3 * 24 * 60]))
+        intervals.append(interval(f"e{n}", start, start + length))
+    return intervals
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(1)
+    intervals = random_intervals(rng, 300)
+    index = IntervalIndex(intervals)
+
+    for _ in range(200):
+        start = at(0) + datetime.timedelta(minutes=rng.randrange(0, 8 * 24 * 60, 15))
+        end = start + datetime.timedelta(minutes=rng.choice([15, 60, 24 * 60]))
+        assert index.overlapping(start, end) == brute_force(intervals, start, end)
+
+
+def test_add_and_remove_keep_index_consistent():
+    rng = random.Random(2)
+    intervals = random_intervals(rng, 100)
+    index = IntervalIndex(intervals[:50])
+    for item in intervals[50:]:
+        index.add(item)
+    for item in intervals[::3]:
+        assert index.remove(item.key)
+    assert not index.remove("missing")
+
+    remaining = [i for n, i in enumerate(intervals) if n % 3]
+    assert len(index) == len(remaining)
+    for day in range(8):
+        start, end = at(0) + datetime.timedelta(days=day), at(0) + datetime.timedelta(days=day + 1)
+        assert index.overlapping(start, end) == brute_force(remaining, start, end)
+
+
+def test_overlapping_excludes_touching_intervals():
+    index = IntervalIndex([interval("a", at(9), at(10)), interval("b", at(11), at(12))])
+
+    assert index.overlapping(at(10), at(11)) == []
+    assert [i.key for i in index.overlapping(at(9, 59), at(11, 1))] == ["a", "b"]
+
+
+def test_overlapping_accepts_naive_datetimes():
+    index = IntervalIndex([interval("a", at(9), at(10))])
+
+    assert [i.key for i in index.overlapping(datetime.datetime(2026, 10, 18, 9, 30), datetime.datetime(2026, 10, 18, 11))] == ["a"]
+
+
+def test_from_events_marks_all_day_and_transparent_events_free():
+    index = IntervalIndex.from_events([
+        event("meeting", {"dateTime": "2026-10-18T09:00:00+09:00"}, {"dateTime": "2026-10-18T10:00:00+09:00"}),
+        event("holiday", {"date": "2026-10-18"}, {"date": "2026-10-19"}),
+        event(
+            "reminder",
+            {"dateTime": "2026-10-18T13:00:00+09:00"},
+            {"dateTime": "2026-10-18T14:00:00+09:00"},
+            transparency="transparent",
+        ),
+        {"id": "broken", "summary": "no times"},
+    ])
+
+    busy = {i.key: i.busy for i in index}
+    assert busy == {"meeting": True, "holiday": False, "reminder": False}
+    assert index.free_slots(at(8), at(15)) == [(at(8), at(9)), (at(10), at(15))]
+
+
+@pytest.mark.parametrize(
+    "intervals, expected",
+    [
+        ([], [(at(9), at(18))]),
+        # 重なる・隣接する予定はまとめて1つの予定ありとして扱う
+        (
+            [interval("a", at(10), at(12)), interval("b", at(11), at(13)), interval("c", at(13), at(14))],
+            [(at(9), at(10)), (at(14), at(18))],
+        ),
+        # 長い予定の中に含まれる予定は空き時間を作らない
+        ([interval("a", at(10), at(16)), interval("b", at(11), at(12))], [(at(9), at(10)), (at(16), at(18))]),
+        # 期間の外にはみ出す予定
+        ([interval("a", at(8), at(10)), interval("b", at(17), at(20))], [(at(10), at(17))]),
+        ([interval("a", at(8), at(20))], []),
+        # 予定なしの区間は無視する
+        ([interval("a", at(10), at(12), busy=False)], [(at(9), at(18))]),
+    ],
+)
+def test_free_gaps(intervals, expected):
+    assert free_gaps(intervals, at(9), at(18)) == expected
+
+
+def test_free_gaps_skips_gaps_shorter_than_min_duration():
+    intervals = [interval("a", at(9, 30), at(12)), interval("b", at(12, 45), at(17))]
+
+    gaps = free_gaps(intervals, at(9), at(18), min_duration=datetime.timedelta(hours=1))
+    assert gaps == [(at(17), at(18))]
@@ -0,0 +1,151 @@
+import json
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from agenda_genie import resilience
+from agenda_genie.natural_language_parser import GeminiParser, _is_retryable
+from agenda_genie.resilience import Upstream
+from agenda_genie.schemas import ActionType, response_schema
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        google_exceptions.TooManyRequests("429"),
+        google_exceptions.ResourceExhausted("quota"),
+        google_exceptions.InternalServerError("500"),
+        google_exceptions.BadGateway("502"),
+        google_exceptions.ServiceUnavailable("503"),
+        google_exceptions.GatewayTimeout("504"),
+        google_exceptions.DeadlineExceeded("deadline"),
+        ConnectionError(),
+        TimeoutError(),
+    ],
+)
+def test_transient_errors_are_retryable(error):
+    assert _is_retryable(error)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        google_exceptions.BadRequest("400"),
+        google_exceptions.PermissionDenied("403"),
+        google_exceptions.MethodNotImplemented("501"),
+        ValueError(),
+    ],
+)
+def test_other_errors_are_not_retryable(error):
+    assert not _is_retryable(error)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FlakyModel:
+    """
+    最初のfailures回は例外を送出し、その後は雑談として応答するモデル。
+    """
+
+    def __init__(self, error, failures=1):
+        self.error = error
+        self.failures = failures
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return FakeResponse(json.dumps({"action": "talk"}))
+
+
+def test_parse_event_text_retries_too_many_requests(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    parser = GeminiParser(upstream=Upstream("test", max_retries=2, is_retryable=_is_retryable), use_cache=False)
+    parser.model = FlakyModel(google_exceptions.TooManyRequests("429 Too Many Requests"))
+
+    result = parser.parse_event_text("こんにちは")
+
+    assert result.action == ActionType.TALK
+    assert parser.model.calls == 2
+
+
+class ScriptedModel:
+    """
+    あらかじめ決めた応答を順に返すモデル。
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        return FakeResponse(json.dumps(self.replies.pop(0), ensure_ascii=False))
+
+
+CREATE_REPLY = {
+    "action": "create",
+    "event": {"title": "打ち合わせ", "start_time": "2026-10-18T15:00", "end_time": "2026-10-18T16:00"},
+}
+
+
+@pytest.fixture
+def make_parser(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+
+    def factory(model):
+        parser = GeminiParser(upstream=Upstream("test", max_retries=0), use_cache=False, use_fast_path=False)
+        parser.model = model
+        return parser
+    return factory
+
+
+def test_response_schema_requires_fields_used_by_every_event_action():
+    event = response_schema()["properties"]["event"]
+
+    assert event["required"] == ["start_time", "end_time"]
+    assert response_schema(batch=True)["items"]["properties"]["event"]["required"] == ["start_time", "end_time"]
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        {"action": "create", "event": {"start_time": "2026-10-18T15:00", "end_time": "2026-10-18T16:00"}},
+        {"action": "create", "event": {"title": "", "start_time": "2026-10-18T15:00", "end_time": ""}},
+        {"action": "create"},
+        {"action": "delete", "event": {"start_time": "", "end_time": ""}},
+    ],
+)
+def test_incomplete_event_is_asked_again_instead_of_becoming_talk(make_parser, reply):
+    parser = make_parser(ScriptedModel(reply, CREATE_REPLY))
+
+    result = parser.parse_event_text("明日の15時から打ち合わせ")
+
+    assert result.action == ActionType.CREATE
+    assert result.event.title == "打ち合わせ"
+    assert parser.model.calls == 2
+
+
+def test_incomplete_event_is_rejected_after_asking_again(make_parser):
+    reply = {"action": "delete", "event": {"start_time": "", "end_time": ""}}
+    parser = make_parser(ScriptedModel(reply, reply))
+
+    assert parser.parse_event_text("打ち合わせを消して") is None
+    assert parser.model.calls == 2
+
+
+def test_batch_resends_items_with_incomplete_event(make_parser):
+    parser = make_parser(ScriptedModel(
+        [dict(CREATE_REPLY, id=0), {"id": 1, "action": "create", "event": {"start_time": "2026-10-19T10:00", "end_time": ""}}],
+        dict(CREATE_REPLY, event=dict(CREATE_REPLY["event"], title="面談")),
+    ))
+
+    results = parser.parse_many(["打ち合わせ", "面談"])
+
+    assert [r.event.title for r in results] == ["打ち合わせ", "面談"]
+    assert parser.model.calls == 2
@@ -0,0 +1,121 @@
+import datetime
+
+import pytest
+
+from agenda_genie import parse_cache
+from agenda_genie.parse_cache import ParseCache, SQLiteParseCache, cache_key, normalize_text
+from agenda_genie.schemas import ActionType, CalendarEvent, ParsedResult
+
+NOW = datetime.datetime(2026, 10, 17, 10, 0)
+
+
+def create_result(title="打ち合わせ"):
+    event = CalendarEvent(
+        title=title,
+        start_time=datetime.datetime(2026, 10, 18, 15, 0),
+        end_time=datetime.datetime(2026, 10, 18, 16, 0),
+        description="会議室A",
+    )
+    return ParsedResult(action=ActionType.CREATE, event=event)
+
+
+def test_normalize_text_ignores_width_case_spaces_and_punctuation():
+    assert normalize_text("明日の１５時、 ＭＴＧ！") == normalize_text("明日の15時mtg")
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("明日の15時から打ち合わせ", "明日の１５時から　打ち合わせ。"),
+        ("来週の月曜に定例", "「来週の月曜」に定例！"),
+    ],
+)
+def test_cache_key_matches_variants_of_the_same_text(first, second):
+    assert cache_key(first, NOW) == cache_key(second, NOW)
+
+
+def test_cache_key_uses_day_bucket_for_dates():
+    later = NOW.replace(hour=23, minute=59)
+
+    assert cache_key("明日の15時から打ち合わせ", NOW) == cache_key("明日の15時から打ち合わせ", later)
+    assert cache_key("明日の15時から打ち合わせ", NOW) != cache_key("明日の15時から打ち合わせ", NOW + datetime.timedelta(days=1))
+
+
+@pytest.mark.parametrize("text", ["30分後に電話", "2時間後に出発", "今から会議"])
+def test_cache_key_uses_minute_bucket_for_relative_times(text):
+    assert cache_key(text, NOW) != cache_key(text, NOW + datetime.timedelta(minutes=1))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(parse_cache.time, "monotonic", clock)
+    monkeypatch.setattr(parse_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache_factory(request, tmp_path):
+    def factory(**kwargs):
+        if request.param == "memory":
+            return ParseCache(**kwargs)
+        return SQLiteParseCache(tmp_path / "parse_cache.db", **kwargs)
+    return factory
+
+
+def test_cache_round_trips_results(cache_factory, clock):
+    cache = cache_factory()
+    cache.set("key", create_result())
+
+    result = cache.get("key")
+    assert result.action == ActionType.CREATE
+    assert result.event.title == "打ち合わせ"
+    assert result.event.start_time == datetime.datetime(2026, 10, 18, 15, 0)
+    assert result.event.description == "会議室A"
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_expires_entries_after_ttl(cache_factory, clock):
+    cache = cache_factory(ttl=60)
+    cache.set("key", create_result())
+
+    clock.now += 59
+    assert cache.get("key") is not None
+    clock.now += 1
+    assert cache.get("key") is None
+
+
+def test_cache_evicts_least_recently_used(cache_factory, clock):
+    cache = cache_factory(max_entries=2)
+    cache.set("a", create_result("a"))
+    clock.now += 1
+    cache.set("b", create_result("b"))
+    clock.now += 1
+    # aを使うと、次に追い出されるのはbになる
+    assert cache.get("a") is not None
+    clock.now += 1
+    cache.set("c", create_result("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a").event.title == "a"
+    assert cache.get("c").event.title == "c"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_sqlite_cache_survives_reopening(tmp_path, clock):
+    SQLiteParseCache(tmp_path / "parse_cache.db").set("key", ParsedResult(action=ActionType.TALK, original_text="こんにちは"))
+
+    result = SQLiteParseCache(tmp_path / "parse_cache.db").get("key")
+    assert result.action == ActionType.TALK
+    assert result.original_text == "こんにちは"
@@ -0,0 +1,137 @@
+import json
+import re
+
+import pytest
+
+from agenda_genie.natural_language_parser import GeminiParser
+from agenda_genie.resilience import Upstream
+from agenda_genie.schemas import ActionType
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    ユーザー入力の各textをそのままoriginal_textとするtalkを、入力と逆の順序で返すモデル。
+    """
+
+    _INPUTS_RE = re.compile(r"# ユーザー入力\s*\n(.*?)\n\s*# 出力", re.S)
+
+    def __init__(self, drop=(), truncate_batches_over=None):
+        self.drop = set(drop)
+        self.truncate_batches_over = truncate_batches_over
+        self.batches = []
+
+    def generate_content(self, prompt, **kwargs):
+        match = self._INPUTS_RE.search(prompt)
+        try:
+            inputs = json.loads(match.group(1)) if match else None
+        except ValueError:
+            inputs = None
+        if not isinstance(inputs, list):
+            # 1件だけの場合は通常のプロンプトで送られる
+            text = prompt.rsplit("\n", 1)[-1].strip() if not match else match.group(1).strip()
+            self.batches.append([text])
+            if text in self.drop:
+                return FakeResponse("[]")
+            return FakeResponse(json.dumps({"action": "talk", "original_text": text}, ensure_ascii=False))
+
+        texts = [item["text"] for item in inputs]
+        self.batches.append(texts)
+        if self.truncate_batches_over is not None and len(inputs) > self.truncate_batches_over:
+            return FakeResponse('[{"id": 0, "action": "talk"')
+        items = [
+            {"id": item["id"], "action": "talk", "original_text": item["text"]}
+            for item in reversed(inputs)
+            if item["text"] not in self.drop
+        ]
+        return FakeResponse(json.dumps(items, ensure_ascii=False))
+
+
+@pytest.fixture
+def make_parser(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+
+    def factory(model=None, **kwargs):
+        kwargs.setdefault("use_cache", False)
+        parser = GeminiParser(upstream=Upstream("test", max_retries=0), **kwargs)
+        parser.model = model or FakeModel()
+        return parser
+    return factory
+
+
+def texts(count):
+    return [f"メッセージ{i}" for i in range(count)]
+
+
+def test_plan_batches_respects_size_and_token_limits(make_parser):
+    # 1件あたりのトークン数は、文字数に16を加えて見積もる
+    parser = make_parser(max_batch_size=4, max_batch_input_tokens=110)
+    items = list(enumerate(["a" * 10] * 6 + ["b" * 70, "c" * 10]))
+
+    batches = parser._plan_batches(items)
+
+    assert [[index for index, _ in batch] for batch in batches] == [[0, 1, 2, 3], [4, 5], [6], [7]]
+
+
+def test_plan_batches_limits_items_by_expected_output_tokens(make_parser):
+    parser = make_parser(max_batch_size=25, max_batch_output_tokens=600)
+
+    batches = parser._plan_batches(list(enumerate(texts(12))))
+
+    assert [len(batch) for batch in batches] == [5, 5, 2]
+
+
+def test_parse_many_keeps_input_order(make_parser):
+    parser = make_parser(max_batch_size=3)
+    inputs = texts(7)
+
+    results = parser.parse_many(inputs)
+
+    assert [r.original_text for r in results] == inputs
+    assert [len(batch) for batch in parser.model.batches] == [3, 3, 1]
+
+
+def test_parse_many_sends_duplicates_once(make_parser):
+    parser = make_parser()
+    inputs = ["メッセージA", "メッセージB", "メッセージA"]
+
+    results = parser.parse_many(inputs)
+
+    assert [r.original_text for r in results] == inputs
+    assert parser.model.batches == [["メッセージA", "メッセージB"]]
+
+
+def test_parse_many_skips_inputs_parsed_locally(make_parser):
+    parser = make_parser()
+
+    results = parser.parse_many(["明日の15時から打ち合わせ", "メッセージA", "メッセージB"])
+
+    assert results[0].action == ActionType.CREATE
+    assert [r.original_text for r in results[1:]] == ["メッセージA", "メッセージB"]
+    assert parser.model.batches == [["メッセージA", "メッセージB"]]
+
+
+def test_parse_many_resends_missing_items_and_falls_back_to_talk(make_parser):
+    parser = make_parser(model=FakeModel(drop={"メッセージ1"}))
+
+    results = parser.parse_many(texts(3), max_rounds=2)
+
+    assert [r.action for r in results] == [ActionType.TALK] * 3
+    assert [r.original_text for r in results] == texts(3)
+    # 2回目は解析できなかった入力だけを送る
+    assert parser.model.batches[1] == ["メッセージ1"]
+    assert len(parser.model.batches) == 2
+
+
+def test_parse_many_shrinks_batches_after_truncated_responses(make_parser):
+    parser = make_parser(model=FakeModel(truncate_batches_over=2), max_batch_size=8)
+
+    results = parser.parse_many(texts(8))
+
+    assert [r.original_text for r in results] == texts(8)
+    # 応答が途中で切れるたびにバッチを半分にし、3回目は1件ずつ送る
+    assert [len(batch) for batch in parser.model.batches] == [8, 4, 4] + [1] * 8
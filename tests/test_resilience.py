@@ -0,0 +1,195 @@
+import pytest
+
+from agenda_genie import resilience
+from agenda_genie.resilience import CircuitBreaker, TokenBucket, Upstream, UpstreamUnavailableError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(resilience.time, "sleep", clock.sleep)
+    return clock
+
+
+class TransientError(Exception):
+    pass
+
+
+class ClientError(Exception):
+    pass
+
+
+def make_upstream(**kwargs):
+    options = {"max_retries": 2, "failure_threshold": 2, "reset_timeout": 10.0}
+    options.update(kwargs)
+    return Upstream("test", is_retryable=lambda error: isinstance(error, TransientError), **options)
+
+
+def failing(error):
+    def func():
+        raise error
+    return func
+
+
+def test_token_bucket_without_rate_never_waits(clock):
+    bucket = TokenBucket(rate=0, capacity=1)
+
+    assert all(bucket.acquire(timeout=0) for _ in range(100))
+    assert clock.sleeps == []
+
+
+def test_token_bucket_allows_burst_then_paces(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0)
+    assert clock.sleeps == []
+
+    # 3つ目は補充を待つ（0.1秒）
+    assert bucket.acquire(timeout=1.0)
+    assert clock.sleeps == [pytest.approx(0.1)]
+
+
+def test_token_bucket_rejects_without_waiting_beyond_timeout(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.acquire()
+
+    assert not bucket.acquire(timeout=0.5)
+    assert clock.sleeps == []
+    # 拒否した呼び出しはトークンを消費しない
+    clock.now += 1.0
+    assert bucket.acquire(timeout=0)
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+
+    clock.now += 60
+    assert [bucket.acquire(timeout=0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_allows_a_single_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_reopens_when_trial_fails(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_release_keeps_state_and_frees_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_upstream_retries_transient_errors(clock):
+    upstream = make_upstream(failure_threshold=5)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise TransientError()
+        return "ok"
+
+    assert upstream.call(flaky) == "ok"
+    assert len(calls) == 3
+    assert upstream.stats()["retries"] == 2
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_upstream_gives_up_after_max_retries(clock):
+    upstream = make_upstream(failure_threshold=10)
+
+    with pytest.raises(UpstreamUnavailableError):
+        upstream.call(failing(TransientError()))
+    assert upstream.stats()["failures"] == 3
+
+
+def test_upstream_rejects_calls_while_open(clock):
+    upstream = make_upstream(max_retries=0, failure_threshold=1)
+    with pytest.raises(UpstreamUnavailableError):
+        upstream.call(failing(TransientError()))
+
+    with pytest.raises(UpstreamUnavailableError, match="circuit open"):
+        upstream.call(lambda: "ok")
+    assert upstream.stats()["rejected"] == 1
+
+
+def test_upstream_client_errors_do_not_affect_breaker(clock):
+    upstream = make_upstream(max_retries=0, failure_threshold=2)
+    with pytest.raises(UpstreamUnavailableError):
+        upstream.call(failing(TransientError()))
+
+    # 一時的でないエラーはそのまま送出し、連続失敗回数をリセットしない
+    with pytest.raises(ClientError):
+        upstream.call(failing(ClientError()))
+    with pytest.raises(UpstreamUnavailableError):
+        upstream.call(failing(TransientError()))
+    assert upstream.breaker.state == CircuitBreaker.OPEN
+
+
+def test_upstream_client_error_does_not_close_half_open_breaker(clock):
+    upstream = make_upstream(max_retries=0, failure_threshold=1)
+    with pytest.raises(UpstreamUnavailableError):
+        upstream.call(failing(TransientError()))
+    clock.now += 10
+
+    with pytest.raises(ClientError):
+        upstream.call(failing(ClientError()))
+    assert upstream.breaker.state == CircuitBreaker.HALF_OPEN
+    assert upstream.call(lambda: "ok") == "ok"
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
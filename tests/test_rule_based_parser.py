@@ -0,0 +1,159 @@
+import datetime
+
+import pytest
+
+from agenda_genie.rule_based_parser import RuleBasedParser, find_date, find_times, normalize
+from agenda_genie.schemas import ActionType
+
+# 2026-10-17 は土曜日
+NOW = datetime.datetime(2026, 10, 17, 10, 0)
+
+
+def dt(day, hour, minute=0, month=10):
+    return datetime.datetime(2026, month, day, hour, minute)
+
+
+@pytest.fixture
+def parser():
+    return RuleBasedParser()
+
+
+@pytest.mark.parametrize(
+    "text, title, start, end",
+    [
+        ("明日の15時からクライアントと30分間の打ち合わせ", "クライアントと打ち合わせ", dt(18, 15), dt(18, 15, 30)),
+        ("来週の月曜、朝9時から定例会議", "定例会議", dt(19, 9), dt(19, 10)),
+        ("明後日の10時から12時までチームレビュー", "チームレビュー", dt(19, 10), dt(19, 12)),
+        ("1週間後の13時半に歯医者を予約", "歯医者を予約", dt(24, 13, 30), dt(24, 14, 30)),
+        ("明日の正午からランチミーティング", "ランチミーティング", dt(18, 12), dt(18, 13)),
+        ("来週の水曜、午後2時から1時間半の面談", "面談", dt(21, 14), dt(21, 15, 30)),
+        ("10月30日 9:30〜11:00 企画会議", "企画会議", dt(30, 9, 30), dt(30, 11)),
+        ("3日後の夜7時にジム", "ジム", dt(20, 19), dt(20, 20)),
+        ("明日の夜11時に電話", "電話", dt(18, 23), dt(19, 0)),
+        # 夜12時は翌日の0時
+        ("明日の夜12時に飲み会", "飲み会", dt(19, 0), dt(19, 1)),
+        ("明日の21時から夜12時までパーティー", "パーティー", dt(18, 21), dt(19, 0)),
+        # 終了時刻が開始時刻より前なら、午後または翌日とみなす
+        ("明日の10時から1時まで作業", "作業", dt(18, 10), dt(18, 13)),
+        ("明日の22時から2時まで夜勤", "夜勤", dt(18, 22), dt(19, 2)),
+        # 末尾の依頼の表現はタイトルに含めない
+        ("明日15時に会議を予約して", "会議", dt(18, 15), dt(18, 16)),
+        ("明日の10時から打ち合わせを入れといてください", "打ち合わせ", dt(18, 10), dt(18, 11)),
+    ],
+)
+def test_parse_create(parser, text, title, start, end):
+    result = parser.parse(text, NOW)
+
+    assert result is not None
+    assert result.action == ActionType.CREATE
+    assert result.event.title == title
+    assert result.event.start_time == start
+    assert result.event.end_time == end
+
+
+def test_parse_create_keeps_following_sentences_as_description(parser):
+    result = parser.parse("今日の午後8時にオンラインで勉強会。内容はPythonについて。", NOW)
+
+    assert result.event.title == "オンラインで勉強会"
+    assert result.event.description == "内容はPythonについて。"
+
+
+def test_parse_create_without_description_matches_gemini_shape(parser):
+    result = parser.parse("明日の15時から打ち合わせ", NOW)
+
+    assert result.event.description is None
+
+
+@pytest.mark.parametrize(
+    "text, start, end, key_word",
+    [
+        ("明日の会議を削除して", "2026-10-18T00:00", "2026-10-19T00:00", "会議"),
+        ("明後日の歯医者の予定をキャンセル", "2026-10-19T00:00", "2026-10-20T00:00", "歯医者"),
+        ("明日の15時の打ち合わせを消して", "2026-10-18T15:00", "2026-10-19T15:00", "打ち合わせ"),
+        # 所要時間は検索語に含めない
+        ("明日の10時から1時間の打ち合わせをキャンセル", "2026-10-18T10:00", "2026-10-19T10:00", "打ち合わせ"),
+    ],
+)
+def test_parse_delete(parser, text, start, end, key_word):
+    result = parser.parse(text, NOW)
+
+    assert result is not None
+    assert result.action == ActionType.DELETE
+    assert result.event == {"start_time": start, "end_time": end, "key_word": key_word}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # 質問・曖昧な表現・繰り返しはGeminiに任せる
+        "今週の予定は？",
+        "明日空いてる？",
+        "明日の15時頃に打ち合わせ",
+        "毎週月曜の9時から定例会議",
+        # 日付や時刻がない
+        "渋谷でランチ",
+        "ありがとう！",
+        "明日は打ち合わせ",
+        # 午前か午後か分からない時刻
+        "明日の3時に打ち合わせ",
+        # 打ち消しを削除や登録として扱わない
+        "明日の15時に会議を削除しないで",
+        "明日の会議は消さないで",
+        "明日の会議をキャンセルしないでください",
+        "明日の飲み会はやめないで",
+        # 今日より前になる日時
+        "今週の金曜に18時から飲み会",
+        "今日の9時から朝会",
+        "今週の金曜の会議を削除して",
+        # 深夜の時刻はどの日の夜か判断できない
+        "明日の深夜2時にリリース",
+        # タイトルや検索語に依頼の表現や数字が残る
+        "明日15時に電話して",
+        "明日の15時から2件目の会議を削除",
+    ],
+)
+def test_parse_falls_back_to_gemini(parser, text):
+    assert parser.parse(text, NOW) is None
+
+
+def test_stats_counts_hits_and_misses(parser):
+    parser.parse("明日の15時から打ち合わせ", NOW)
+    parser.parse("ありがとう！", NOW)
+
+    assert parser.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("明日", datetime.date(2026, 10, 18)),
+        ("来週の金曜", datetime.date(2026, 10, 23)),
+        ("金曜", datetime.date(2026, 10, 23)),
+        ("今週の金曜", datetime.date(2026, 10, 16)),
+        ("10/1", datetime.date(2027, 10, 1)),
+        ("2週間後", datetime.date(2026, 10, 31)),
+        # 複数の日付はどちらとも決められない
+        ("明日か明後日", None),
+    ],
+)
+def test_find_date(text, expected):
+    date, _ = find_date(normalize(text), NOW)
+
+    assert date == expected
+
+
+@pytest.mark.parametrize(
+    "text, start, end",
+    [
+        ("午後8時", datetime.timedelta(hours=20), None),
+        ("15時30分から16時まで", datetime.timedelta(hours=15, minutes=30), datetime.timedelta(hours=16)),
+        ("深夜0時", datetime.timedelta(days=1), None),
+        ("夜12時", datetime.timedelta(days=1), None),
+        ("深夜11時", datetime.timedelta(hours=23), None),
+    ],
+)
+def test_find_times(text, start, end):
+    found_start, found_end, _, _ = find_times(normalize(text))
+
+    assert found_start == start
+    assert found_end == end